@@ -1,5 +1,12 @@
 from django.contrib import admin
 from .models import GlobalComplianceModel
 
+
+class GlobalComplianceModelAdmin(admin.ModelAdmin):
+    list_display = ('version', 'status', 'size_bytes', 'created_at', 'activated_at')
+    list_filter = ('status',)
+    readonly_fields = ('version', 'model_path', 'checksum', 'size_bytes', 'metrics', 'created_at', 'activated_at')
+
+
 # This makes your models appear in the admin site.
-admin.site.register(GlobalComplianceModel)
+admin.site.register(GlobalComplianceModel, GlobalComplianceModelAdmin)
@@ -0,0 +1,120 @@
+"""
+Compression of client-to-server model updates for FedAvg rounds.
+
+Clients upload the delta between their locally trained weights and the
+global model they started from, optionally keeping only the top-k entries
+by magnitude and quantizing the kept values to 8 bits. With error feedback
+each client adds what compression dropped last round to its next delta, so
+the dropped mass is delayed rather than lost.
+"""
+import struct
+
+import numpy as np
+
+
+class UpdateCodec:
+    """
+    Encodes a model delta (a dict of arrays) to bytes and back. Tensors are
+    written in the order of the global state, which both sides share, each
+    as: flags, value count, scale, [indices], values.
+    """
+    SPARSE = 1
+    QUANTIZED = 2
+    WIDE_INDEX = 4
+    ENTRY = struct.Struct('<BIf')
+
+    def __init__(self, top_k=None, quantize=False, error_feedback=True):
+        if top_k is not None and not 0 < top_k <= 1:
+            raise ValueError(f"top_k must be a fraction in (0, 1], got {top_k}")
+        self.top_k = top_k
+        self.quantize = quantize
+        self.error_feedback = error_feedback
+
+    def describe(self) -> str:
+        parts = []
+        if self.top_k is not None and self.top_k < 1:
+            parts.append(f"top-{self.top_k:.0%}")
+        if self.quantize:
+            parts.append('int8')
+        if not parts:
+            parts.append('delta fp32')
+        if self.error_feedback and (self.quantize or (self.top_k or 1) < 1):
+            parts.append('error feedback')
+        return ' + '.join(parts)
+
+    def encode(self, delta: dict, residual=None):
+        """
+        Returns (payload bytes, residual for the client's next round). The
+        residual is None without error feedback.
+        """
+        chunks, next_residual = [], {}
+        for name, value in delta.items():
+            flat = np.asarray(value, dtype=np.float32).ravel()
+            if self.error_feedback and residual is not None:
+                flat = flat + residual[name]
+            size, flags, indices = flat.size, 0, None
+
+            if self.top_k is not None and self.top_k < 1:
+                k = max(1, int(np.ceil(self.top_k * size)))
+                indices = np.sort(np.argpartition(np.abs(flat), size - k)[size - k:])
+                values = flat[indices]
+                flags |= self.SPARSE
+            else:
+                values = flat
+
+            scale = 1.0
+            if self.quantize:
+                peak = float(np.abs(values).max()) if values.size else 0.0
+                scale = peak / 127 or 1.0
+                quantized = np.clip(np.rint(values / scale), -127, 127).astype(np.int8)
+                sent = quantized.astype(np.float32) * np.float32(scale)
+                body = quantized.tobytes()
+                flags |= self.QUANTIZED
+            else:
+                sent = values
+                body = values.astype('<f4').tobytes()
+
+            index_bytes = b''
+            if indices is not None:
+                wide = size > 1 << 16
+                flags |= self.WIDE_INDEX if wide else 0
+                index_bytes = indices.astype('<u4' if wide else '<u2').tobytes()
+            chunks.append(self.ENTRY.pack(flags, len(values), scale) + index_bytes + body)
+
+            if self.error_feedback:
+                if indices is None:
+                    next_residual[name] = flat - sent
+                else:
+                    next_residual[name] = flat.copy()
+                    next_residual[name][indices] -= sent
+        return b''.join(chunks), (next_residual if self.error_feedback else None)
+
+    def decode(self, payload, template: dict) -> dict:
+        """Rebuilds the dense delta, using `template` (the global state) for names and shapes."""
+        view, offset, delta = memoryview(payload), 0, {}
+        for name, reference in template.items():
+            flags, count, scale = self.ENTRY.unpack_from(view, offset)
+            offset += self.ENTRY.size
+            indices = None
+            if flags & self.SPARSE:
+                dtype = np.dtype('<u4' if flags & self.WIDE_INDEX else '<u2')
+                indices = np.frombuffer(view, dtype=dtype, count=count, offset=offset)
+                offset += count * dtype.itemsize
+            if flags & self.QUANTIZED:
+                values = np.frombuffer(view, dtype=np.int8, count=count, offset=offset).astype(np.float32) * np.float32(scale)
+                offset += count
+            else:
+                values = np.frombuffer(view, dtype='<f4', count=count, offset=offset)
+                offset += count * 4
+            if indices is None:
+                dense = values.astype(np.float32, copy=True)
+            else:
+                dense = np.zeros(reference.size, dtype=np.float32)
+                dense[indices] = values
+            delta[name] = dense.reshape(reference.shape)
+        return delta
+
+
+def dense_size(state: dict) -> int:
+    """Bytes needed to ship a state uncompressed."""
+    return sum(np.asarray(value).nbytes for value in state.values())
@@ -0,0 +1,195 @@
+import json
+import os
+
+import numpy as np
+from django.conf import settings
+from django.db.models import CharField, Q
+from django.db.models.functions import Cast, Coalesce, Lower, Right
+from transactions.archive import AMOUNT_SCALE, TransactionArchive
+from transactions.models import Transaction
+
+from .fedavg import FEATURES
+
+# Outcomes used as training labels; PENDING rows are unlabeled. An analyst's
+# confirmed label takes precedence over the model-assigned status.
+LABELS = {
+    Transaction.Status.COMPLIANT: 0.0,
+    Transaction.Status.HIGH_RISK: 1.0,
+    Transaction.Status.BLOCKED: 1.0,
+}
+
+# The holdout is decided by the last 16 bits of the transaction id, which
+# SQL (the id's last four hex digits) and archived segments (its last two
+# bytes) can both test
+_HOLDOUT_BUCKETS = 1 << 16
+
+_SECONDS_PER_DAY = 86400
+_EPOCH_WEEKDAY = 3  # 1970-01-01 was a Thursday
+
+
+def _holdout_threshold() -> int:
+    fraction = getattr(settings, 'FL_ONLINE_HOLDOUT_FRACTION', 0.2)
+    return min(max(int(fraction * _HOLDOUT_BUCKETS), 0), _HOLDOUT_BUCKETS)
+
+
+def is_holdout(pk) -> bool:
+    """A fixed share of transactions, chosen by id, is only ever used for evaluation."""
+    return (pk.int & 0xFFFF) < _holdout_threshold()
+
+
+def exclude_holdout(queryset):
+    """Drops the rows is_holdout() reserves for evaluation from a Transaction queryset."""
+    threshold = _holdout_threshold()
+    if threshold == 0:
+        return queryset
+    if threshold == _HOLDOUT_BUCKETS:
+        return queryset.none()
+    # Fixed-width lowercase hex sorts like the number it encodes
+    return queryset.annotate(
+        id_suffix=Lower(Right(Cast('id', output_field=CharField()), 4)),
+    ).exclude(id_suffix__lt=f"{threshold:04x}")
+
+
+def featurize(amounts, unix_seconds, is_crypto):
+    """
+    Columnar version of Transaction.to_feature_dict (UTC timestamps):
+    [amount, day_of_week, hour_of_day, is_crypto] as float32.
+    """
+    seconds = np.asarray(unix_seconds, dtype=np.int64)
+    days = seconds // _SECONDS_PER_DAY
+    return np.column_stack([
+        np.asarray(amounts, dtype=np.float64),
+        (days + _EPOCH_WEEKDAY) % 7,
+        (seconds % _SECONDS_PER_DAY) // 3600,
+        np.asarray(is_crypto, dtype=np.float64),
+    ]).astype(np.float32)
+
+
+def featurize_rows(rows):
+    """Features and labels for (amount, timestamp, transaction_type, label, ...) rows."""
+    amounts, timestamps, types, labels = zip(*(row[:4] for row in rows))
+    features = featurize(
+        [float(a) for a in amounts],
+        [int(ts.timestamp()) for ts in timestamps],
+        [t == Transaction.TransactionType.CRYPTO for t in types],
+    )
+    return features, np.array([LABELS[label] for label in labels], dtype=np.float32)
+
+
+def confirmed_labels(since=None, start=None, limit=None):
+    """
+    Analyst-confirmed transactions ordered by (labeled_at, id), labeled after
+    the `since` (labeled_at, id) cursor and at or after the `start` time. Rows are
+    (amount, timestamp, transaction_type, analyst_label, labeled_at, id).
+    """
+    queryset = Transaction.objects.filter(analyst_label__in=list(LABELS))
+    if since is not None:
+        labeled_at, pk = since
+        queryset = queryset.filter(Q(labeled_at__gt=labeled_at) | Q(labeled_at=labeled_at, id__gt=pk))
+    if start is not None:
+        queryset = queryset.filter(labeled_at__gte=start)
+    rows = queryset.order_by('labeled_at', 'id').values_list(
+        'amount', 'timestamp', 'transaction_type', 'analyst_label', 'labeled_at', 'id')
+    return list(rows[:limit] if limit else rows)
+
+
+def partition_of(account_indexes, n_partitions):
+    """
+    Assigns rows to simulated institutions by the source account's blind
+    index, so each account's history stays with one institution.
+    """
+    return np.array([int(index[:8] or '0', 16) % n_partitions for index in account_indexes], dtype=np.int64)
+
+
+class TransactionDataLoader:
+    """
+    Streams labeled Transaction rows in chunks (a server-side cursor on
+    PostgreSQL), then the archived segments, featurizes each chunk into
+    columns and appends it to per-institution files on disk. Memory stays at
+    one chunk (or one segment) regardless of history size; training then
+    memory-maps each partition. With `since`, only transactions from then on
+    are read, and archived segments that end before it are never opened.
+    Rows in the online learner's evaluation holdout (is_holdout) are left
+    out of both the table and the archive.
+
+    A partition directory holds features.f32 (rows x 4), labels.f32 and
+    meta.json with the row count.
+    """
+
+    ARCHIVE_COLUMNS = ('id', 'amount', 'timestamp', 'transaction_type', 'status', 'analyst_label', 'source_account_index')
+
+    def __init__(self, n_partitions, chunk_size=10000, since=None):
+        self.n_partitions = n_partitions
+        self.chunk_size = chunk_size
+        self.since = since
+        self.counts = [0] * n_partitions
+
+    def queryset(self):
+        queryset = Transaction.objects.annotate(label=Coalesce('analyst_label', 'status')).filter(label__in=list(LABELS))
+        if self.since is not None:
+            queryset = queryset.filter(timestamp__gte=self.since)
+        return exclude_holdout(queryset).order_by().values_list('amount', 'timestamp', 'transaction_type', 'label', 'source_account_index')
+
+    def iter_chunks(self):
+        """Yields (features, labels, partitions) arrays, one chunk at a time."""
+        rows = self.queryset().iterator(chunk_size=self.chunk_size)
+        while True:
+            chunk = []
+            for row in rows:
+                chunk.append(row)
+                if len(chunk) >= self.chunk_size:
+                    break
+            if not chunk:
+                break
+            features, labels = featurize_rows(chunk)
+            yield features, labels, partition_of([row[4] for row in chunk], self.n_partitions)
+        yield from self.iter_archived()
+
+    def iter_archived(self):
+        """Yields (features, labels, partitions) arrays, one archived segment at a time."""
+        for _, columns in TransactionArchive.scan(self.ARCHIVE_COLUMNS, start=self.since):
+            label = np.where(columns['analyst_label'] != '', columns['analyst_label'], columns['status'])
+            id_suffix = columns['id'][:, 14].astype(np.int64) << 8 | columns['id'][:, 15]
+            keep = np.isin(label, [str(status) for status in LABELS]) & (id_suffix >= _holdout_threshold())
+            if not keep.any():
+                continue
+            features = featurize(
+                columns['amount'][keep] / 10 ** AMOUNT_SCALE,
+                columns['timestamp'][keep] // 1_000_000,
+                columns['transaction_type'][keep] == Transaction.TransactionType.CRYPTO,
+            )
+            labels = np.array([LABELS[value] for value in label[keep]], dtype=np.float32)
+            yield features, labels, partition_of(columns['source_account_index'][keep], self.n_partitions)
+
+    def write_partitions(self, root) -> list:
+        """
+        Streams the table into one directory per institution under `root`.
+        Returns the non-empty partition directories.
+        """
+        dirs = [os.path.join(root, f"partition-{i}") for i in range(self.n_partitions)]
+        counts = self.counts = [0] * self.n_partitions
+        files = []
+        for directory in dirs:
+            os.makedirs(directory, exist_ok=True)
+            files.append((
+                open(os.path.join(directory, 'features.f32'), 'wb'),
+                open(os.path.join(directory, 'labels.f32'), 'wb'),
+            ))
+        try:
+            for features, labels, partitions in self.iter_chunks():
+                for i, (features_file, labels_file) in enumerate(files):
+                    mask = partitions == i
+                    if mask.any():
+                        features_file.write(features[mask].tobytes())
+                        labels_file.write(labels[mask].tobytes())
+                        counts[i] += int(mask.sum())
+        finally:
+            for features_file, labels_file in files:
+                features_file.close()
+                labels_file.close()
+
+        for directory, count in zip(dirs, counts):
+            with open(os.path.join(directory, 'meta.json'), 'w') as f:
+                json.dump({'rows': count, 'features': FEATURES}, f)
+        print(f"Wrote {sum(counts)} labeled transactions into {self.n_partitions} partitions: {counts}")
+        return [directory for directory, count in zip(dirs, counts) if count]
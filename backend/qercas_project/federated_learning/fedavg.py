@@ -0,0 +1,285 @@
+"""
+Federated averaging over simulated institutions.
+
+Kept free of Django imports: local training runs in spawned worker
+processes that only need torch and NumPy.
+"""
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+import torch
+import torch.nn as nn
+
+from .compression import dense_size
+
+FEATURES = ['amount', 'day_of_week', 'hour_of_day', 'is_crypto']
+
+# Fixed priors for standardizing raw features; no client data is needed to set them
+FEATURE_MEAN = [9.0, 3.0, 11.5, 0.2]
+FEATURE_STD = [2.5, 2.0, 6.9, 0.4]
+
+
+class FeatureScaler(nn.Module):
+    """
+    Log-scales the amount and standardizes every feature, so the model takes
+    the same raw [amount, day_of_week, hour_of_day, is_crypto] rows that
+    XAIService passes at inference time.
+    """
+
+    def __init__(self, mean=FEATURE_MEAN, std=FEATURE_STD):
+        super().__init__()
+        self.register_buffer('mean', torch.tensor(mean, dtype=torch.float32))
+        self.register_buffer('std', torch.tensor(std, dtype=torch.float32))
+
+    def forward(self, x):
+        x = torch.cat([torch.log1p(x[:, :1].clamp(min=0)), x[:, 1:]], dim=1)
+        return (x - self.mean) / self.std
+
+
+def build_model() -> nn.Module:
+    return nn.Sequential(
+        FeatureScaler(), nn.Linear(4, 16), nn.ReLU(), nn.Linear(16, 1), nn.Sigmoid()
+    )
+
+
+def explained_layers(model):
+    """
+    Splits a model into (scaler, the layers after it). SHAP's DeepExplainer
+    cannot propagate through the scaler's log1p, so explanations run on
+    scaled rows; the scaling is per feature, so every attribution still
+    belongs to one raw feature. Models without a scaler come back whole.
+    """
+    if isinstance(model, nn.Sequential) and len(model) and isinstance(model[0], FeatureScaler):
+        return model[0], model[1:]
+    return None, model
+
+
+def background_rows(n=100, seed=0) -> np.ndarray:
+    """Raw feature rows drawn from the FEATURE_MEAN/FEATURE_STD priors, as a SHAP background."""
+    rng = np.random.default_rng(seed)
+    log_amount = rng.normal(FEATURE_MEAN[0], FEATURE_STD[0], n).clip(min=0)
+    return np.stack([
+        np.expm1(log_amount),
+        rng.integers(0, 7, n),
+        rng.integers(0, 24, n),
+        rng.random(n) < FEATURE_MEAN[3],
+    ], axis=1).astype(np.float32)
+
+
+def state_to_numpy(model_or_state) -> dict:
+    state = model_or_state.state_dict() if isinstance(model_or_state, nn.Module) else model_or_state
+    return {name: tensor.detach().cpu().numpy().copy() for name, tensor in state.items()}
+
+
+def numpy_to_state(arrays: dict) -> dict:
+    return {name: torch.from_numpy(np.array(value)) for name, value in arrays.items()}
+
+
+def load_client_data(source):
+    """
+    A client's data is an (X, y) pair of arrays, a pair of .npy paths, or a
+    partition directory written by TransactionDataLoader. Files are
+    memory-mapped so workers never copy the whole partition.
+    """
+    if isinstance(source, str):
+        with open(os.path.join(source, 'meta.json')) as f:
+            rows = json.load(f)['rows']
+        return (
+            np.memmap(os.path.join(source, 'features.f32'), dtype=np.float32, mode='r', shape=(rows, len(FEATURES))),
+            np.memmap(os.path.join(source, 'labels.f32'), dtype=np.float32, mode='r', shape=(rows,)),
+        )
+    features, labels = source
+    if isinstance(features, str):
+        return np.load(features, mmap_mode='r'), np.load(labels, mmap_mode='r')
+    return features, labels
+
+
+def iter_minibatches(features, labels, batch_size, rng):
+    """Yields shuffled minibatches, reading one contiguous block at a time."""
+    n = len(labels)
+    block = max(batch_size, min(n, 64 * batch_size))
+    starts = np.arange(0, n, block)
+    rng.shuffle(starts)
+    for start in starts:
+        X = np.asarray(features[start:start + block], dtype=np.float32)
+        y = np.asarray(labels[start:start + block], dtype=np.float32)
+        order = rng.permutation(len(y))
+        for i in range(0, len(y), batch_size):
+            idx = order[i:i + batch_size]
+            yield torch.from_numpy(X[idx]), torch.from_numpy(y[idx]).unsqueeze(1)
+
+
+def local_train(global_state, data_source, epochs, batch_size, lr, seed):
+    """
+    Trains a local copy of the global model on one client's data.
+    Returns (state as NumPy arrays, number of samples, mean loss).
+    """
+    torch.set_num_threads(1)  # one core per client; parallelism comes from the pool
+    torch.manual_seed(seed)
+    rng = np.random.default_rng(seed)
+
+    model = build_model()
+    model.load_state_dict(numpy_to_state(global_state))
+    optimizer = torch.optim.SGD(model.parameters(), lr=lr, momentum=0.9)
+    criterion = nn.BCELoss()
+
+    features, labels = load_client_data(data_source)
+    total_loss, batches = 0.0, 0
+    for _ in range(epochs):
+        for X, y in iter_minibatches(features, labels, batch_size, rng):
+            optimizer.zero_grad()
+            loss = criterion(model(X), y)
+            loss.backward()
+            optimizer.step()
+            total_loss += loss.item()
+            batches += 1
+    return state_to_numpy(model), len(labels), total_loss / max(batches, 1)
+
+
+def client_update(global_state, data_source, epochs, batch_size, lr, seed, codec=None, residual=None):
+    """
+    One client's round: local training, then (with a codec) the compressed
+    delta against the global model that the client uploads. Returns
+    (state or payload bytes, number of samples, mean loss, next residual).
+    """
+    state, samples, loss = local_train(global_state, data_source, epochs, batch_size, lr, seed)
+    if codec is None:
+        return state, samples, loss, None
+    payload, residual = codec.encode({name: state[name] - global_state[name] for name in state}, residual)
+    return payload, samples, loss, residual
+
+
+def federated_average(states, weights) -> dict:
+    """Weighted average of client states, parameter by parameter."""
+    weights = np.asarray(weights, dtype=np.float64)
+    weights = weights / weights.sum()
+    return {
+        name: sum(w * state[name].astype(np.float64) for w, state in zip(weights, states)).astype(states[0][name].dtype)
+        for name in states[0]
+    }
+
+
+class FedAvgEngine:
+    """
+    Runs R rounds of FedAvg: every client trains the current global model
+    for E local epochs in parallel, then the server replaces the global
+    model with the sample-weighted average of the client models.
+
+    Clients run in a spawned process pool. Inside daemonic processes (e.g.
+    Celery prefork children), which cannot start children, a thread pool is
+    used instead; torch still releases the GIL inside its kernels.
+
+    With an UpdateCodec, clients upload compressed deltas instead of full
+    weights and the server averages the decoded deltas. Each client's
+    error-feedback residual is carried between rounds. The history records
+    uplink bytes per round next to what uncompressed weights would cost.
+    """
+
+    def __init__(self, rounds=5, local_epochs=2, batch_size=64, lr=0.05, workers=None, seed=0, codec=None):
+        self.rounds = rounds
+        self.local_epochs = local_epochs
+        self.batch_size = batch_size
+        self.lr = lr
+        self.workers = workers or os.cpu_count() or 1
+        self.seed = seed
+        self.codec = codec
+        self.history = []
+
+    def _executor(self, n_clients):
+        workers = min(self.workers, n_clients)
+        if multiprocessing.current_process().daemon or workers == 1:
+            return ThreadPoolExecutor(max_workers=workers)
+        return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+
+    def aggregate(self, global_state, results):
+        """Combines one round of client results into the next global state."""
+        weights = [n for _, n, _ in results]
+        if self.codec is None:
+            return federated_average([state for state, _, _ in results], weights)
+        deltas = [self.codec.decode(payload, global_state) for payload, _, _ in results]
+        mean_delta = federated_average(deltas, weights)
+        return {name: (value + mean_delta[name]).astype(value.dtype) for name, value in global_state.items()}
+
+    def run(self, client_sources, model=None) -> nn.Module:
+        """Trains over the given client data sources and returns the global model."""
+        torch.manual_seed(self.seed)
+        model = model or build_model()
+        global_state = state_to_numpy(model)
+        residuals = [None] * len(client_sources)
+        with self._executor(len(client_sources)) as pool:
+            for round_number in range(1, self.rounds + 1):
+                start = time.perf_counter()
+                futures = [
+                    pool.submit(
+                        client_update, global_state, source, self.local_epochs,
+                        self.batch_size, self.lr, self.seed * 100003 + round_number * 1009 + i,
+                        self.codec, residuals[i],
+                    )
+                    for i, source in enumerate(client_sources)
+                ]
+                results = []
+                for i, future in enumerate(futures):
+                    update, n, loss, residuals[i] = future.result()
+                    results.append((update, n, loss))
+                global_state = self.aggregate(global_state, results)
+                samples = sum(n for _, n, _ in results)
+                loss = sum(l * n for _, n, l in results) / max(samples, 1)
+                uplink = sum(len(update) if self.codec else dense_size(update) for update, _, _ in results)
+                dense_uplink = dense_size(global_state) * len(results)
+                self.history.append({
+                    'round': round_number,
+                    'loss': loss,
+                    'samples': samples,
+                    'uplink_bytes': uplink,
+                    'dense_uplink_bytes': dense_uplink,
+                    'seconds': time.perf_counter() - start,
+                })
+                ratio = f" ({dense_uplink / max(uplink, 1):.1f}x compressed)" if self.codec else ''
+                print(f"FedAvg round {round_number}/{self.rounds}: "
+                      f"loss {loss:.4f} over {samples} samples, uplink {uplink} bytes{ratio} "
+                      f"({self.history[-1]['seconds']:.2f}s)")
+        model.load_state_dict(numpy_to_state(global_state))
+        return model
+
+
+def simulated_client_data(n_clients, samples_per_client, seed=0):
+    """
+    Synthetic, non-IID institutions whose labels follow a fixed risk rule,
+    so training progress is measurable without real data.
+    """
+    rng = np.random.default_rng(seed)
+    sources = []
+    for client in range(n_clients):
+        crypto_share = 0.1 + 0.6 * client / max(n_clients - 1, 1)
+        amount = np.exp(rng.normal(9.0 + 0.3 * client, 2.0, samples_per_client))
+        day = rng.integers(0, 7, samples_per_client)
+        hour = rng.integers(0, 24, samples_per_client)
+        crypto = (rng.random(samples_per_client) < crypto_share).astype(np.float32)
+        logit = 1.2 * (np.log1p(amount) - 10.0) + 2.0 * crypto + 0.8 * ((hour < 6) | (hour > 21)) - 1.0
+        labels = (rng.random(samples_per_client) < 1 / (1 + np.exp(-logit))).astype(np.float32)
+        features = np.stack([amount, day, hour, crypto], axis=1).astype(np.float32)
+        sources.append((features, labels))
+    return sources
+
+
+def predict_proba(model, features) -> np.ndarray:
+    """
+    Risk probabilities for raw feature rows, exactly as XAIService serves
+    them; the models end in a sigmoid, so their output is the probability.
+    """
+    with torch.no_grad():
+        return model(torch.from_numpy(np.asarray(features, dtype=np.float32))).squeeze(1).numpy()
+
+
+def evaluate(model, features, labels) -> dict:
+    """Log loss and accuracy of a model on held-out rows, scored like predict_proba()."""
+    probabilities = predict_proba(model, features)
+    labels = np.asarray(labels, dtype=np.float32)
+    clipped = np.clip(probabilities, 1e-7, 1 - 1e-7)
+    log_loss = float(-np.mean(labels * np.log(clipped) + (1 - labels) * np.log(1 - clipped)))
+    accuracy = float(np.mean((probabilities > 0.5) == (labels > 0.5)))
+    return {'log_loss': log_loss, 'accuracy': accuracy}
@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand
+from federated_learning.fedavg import evaluate, simulated_client_data
+from federated_learning.services import FederatedTrainingService
+
+
+class Command(BaseCommand):
+    help = 'Runs FedAvg over simulated institutions at several worker counts and reports wall-clock time and accuracy.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=8)
+        parser.add_argument('--samples-per-client', type=int, default=20000)
+        parser.add_argument('--rounds', type=int, default=3)
+        parser.add_argument('--local-epochs', type=int, default=1)
+        parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+
+    def handle(self, *args, **options):
+        sources = simulated_client_data(options['clients'], options['samples_per_client'])
+        holdout_X, holdout_y = simulated_client_data(1, 20000, seed=99)[0]
+
+        baseline = None
+        for workers in options['workers']:
+            engine = FederatedTrainingService.build_engine(
+                rounds=options['rounds'], local_epochs=options['local_epochs'], workers=workers,
+            )
+            start = time.perf_counter()
+            model = engine.run(sources)
+            elapsed = time.perf_counter() - start
+            baseline = baseline or elapsed
+            metrics = evaluate(model, holdout_X, holdout_y)
+            self.stdout.write(
+                f"workers {workers:>3}: {elapsed:7.2f}s  (x{baseline / elapsed:.2f})  "
+                f"holdout accuracy {metrics['accuracy']:.3f}  log loss {metrics['log_loss']:.4f}"
+            )
@@ -0,0 +1,53 @@
+from django.core.management.base import BaseCommand
+from federated_learning.compression import UpdateCodec
+from federated_learning.fedavg import evaluate, simulated_client_data
+from federated_learning.services import FederatedTrainingService
+
+
+def _fraction_list(value):
+    return [float(v) for v in value.split(',') if v]
+
+
+class Command(BaseCommand):
+    help = (
+        'Runs FedAvg over in-process simulated institutions with different update compression settings '
+        'and reports uplink bytes per round against convergence and holdout accuracy.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=8)
+        parser.add_argument('--samples-per-client', type=int, default=5000)
+        parser.add_argument('--rounds', type=int, default=10)
+        parser.add_argument('--local-epochs', type=int, default=1)
+        parser.add_argument('--top-k', type=_fraction_list, default=[0.1, 0.01],
+                            help='Comma-separated fractions of each update to keep')
+
+    def handle(self, *args, **options):
+        sources = simulated_client_data(options['clients'], options['samples_per_client'])
+        holdout_X, holdout_y = simulated_client_data(1, 20000, seed=99)[0]
+
+        codecs = [None, UpdateCodec(), UpdateCodec(quantize=True)]
+        for top_k in options['top_k']:
+            codecs += [
+                UpdateCodec(top_k=top_k, error_feedback=False),
+                UpdateCodec(top_k=top_k),
+                UpdateCodec(top_k=top_k, quantize=True),
+            ]
+
+        self.stdout.write(
+            f"{'update':<34}{'bytes/round':>13}{'ratio':>8}{'final loss':>12}{'accuracy':>10}{'log loss':>10}"
+        )
+        for codec in codecs:
+            # One worker keeps every client in this process, so runs are comparable
+            engine = FederatedTrainingService.build_engine(
+                rounds=options['rounds'], local_epochs=options['local_epochs'], workers=1,
+            )
+            engine.codec = codec
+            model = engine.run(sources)
+            metrics = evaluate(model, holdout_X, holdout_y)
+            uplink = sum(r['uplink_bytes'] for r in engine.history) / len(engine.history)
+            dense = engine.history[0]['dense_uplink_bytes']
+            self.stdout.write(
+                f"{codec.describe() if codec else 'full weights fp32':<34}{uplink:>13.0f}{dense / uplink:>8.1f}"
+                f"{engine.history[-1]['loss']:>12.4f}{metrics['accuracy']:>10.3f}{metrics['log_loss']:>10.4f}"
+            )
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand, CommandError
+from federated_learning.registry import ModelRegistry
+
+
+class Command(BaseCommand):
+    help = 'Re-activates an earlier version of the global risk model (the previous one by default).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('version', nargs='?', type=int, help='Version to activate')
+
+    def handle(self, *args, **options):
+        try:
+            record = ModelRegistry.rollback(options['version'])
+        except ValueError as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(f"Active global model is now v{record.version}."))
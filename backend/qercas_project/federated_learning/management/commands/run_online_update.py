@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from federated_learning.online import OnlineLearner
+
+
+class Command(BaseCommand):
+    help = 'Applies newly confirmed analyst labels to the shadow model and promotes it if it beats the live model.'
+
+    def handle(self, *args, **options):
+        result = OnlineLearner.step()
+        self.stdout.write(self.style.SUCCESS(f"Online update {result['status']}: {result}"))
@@ -0,0 +1,58 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:33
+
+from django.db import migrations, models
+
+
+def renumber_versions(apps, schema_editor):
+    # Rows created before the registry all defaulted to version 1
+    GlobalComplianceModel = apps.get_model('federated_learning', 'GlobalComplianceModel')
+    records = GlobalComplianceModel.objects.using(schema_editor.connection.alias)
+    for number, record in enumerate(records.order_by('created_at', 'id'), start=1):
+        if record.version != number:
+            record.version = number
+            record.save(update_fields=['version'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('federated_learning', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='globalcompliancemodel',
+            options={'ordering': ['-version']},
+        ),
+        migrations.AddField(
+            model_name='globalcompliancemodel',
+            name='activated_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='globalcompliancemodel',
+            name='checksum',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='globalcompliancemodel',
+            name='metrics',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='globalcompliancemodel',
+            name='size_bytes',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='globalcompliancemodel',
+            name='status',
+            field=models.CharField(choices=[('ACTIVE', 'Active'), ('RETIRED', 'Retired')], db_index=True, default='RETIRED', max_length=10),
+        ),
+        migrations.RunPython(renumber_versions, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='globalcompliancemodel',
+            name='version',
+            field=models.PositiveBigIntegerField(unique=True),
+        ),
+    ]
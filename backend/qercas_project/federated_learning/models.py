@@ -1,11 +1,32 @@
 from django.db import models
 
 class GlobalComplianceModel(models.Model):
-    version = models.PositiveBigIntegerField(default=1)
+    """
+    One published version of the global risk model. The weights live in an
+    immutable artifact file; exactly one version is ACTIVE at a time, and
+    rolling back re-activates an earlier version.
+    """
+
+    class Status(models.TextChoices):
+        ACTIVE = 'ACTIVE', 'Active'
+        RETIRED = 'RETIRED', 'Retired'
+
+    version = models.PositiveBigIntegerField(unique=True)
     model_path = models.CharField(max_length=255)
+    checksum = models.CharField(max_length=64, blank=True)  # SHA-256 of the artifact file
+    size_bytes = models.PositiveBigIntegerField(default=0)
+    status = models.CharField(
+        max_length=10,
+        choices=Status.choices,
+        default=Status.RETIRED,
+        db_index=True
+    )
+    metrics = models.JSONField(default=dict, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    activated_at = models.DateTimeField(null=True, blank=True)
 
-    def __str__(self):
-        return f"Global Compliance Model v{self.version}"
-
+    class Meta:
+        ordering = ['-version']
 
+    def __str__(self):
+        return f"Global Compliance Model v{self.version} [{self.status}]"
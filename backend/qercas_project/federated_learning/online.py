@@ -0,0 +1,124 @@
+import os
+import tempfile
+import uuid
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .data import confirmed_labels, featurize_rows, is_holdout
+from .fedavg import build_model, evaluate, local_train, numpy_to_state, state_to_numpy
+from .registry import ModelRegistry, read_artifact, write_artifact
+
+
+class OnlineLearner:
+    """
+    Incremental updates between nightly retrains. A shadow copy of the live
+    model takes a few SGD steps on analyst-confirmed labels that arrived
+    since the last step. It is promoted through the ModelRegistry only when
+    it beats the live model on held-out confirmed labels from the recent
+    window.
+
+    The shadow weights and the label cursor are kept in a shadow artifact
+    next to the registry's versions. When another version becomes active
+    (a nightly retrain or a rollback), the shadow restarts from it.
+    """
+
+    @staticmethod
+    def shadow_path():
+        return os.path.join(ModelRegistry.directory(), 'shadow.qrm')
+
+    @classmethod
+    def _load_shadow(cls, live_record, live_model):
+        path = cls.shadow_path()
+        meta = {}
+        if os.path.exists(path):
+            header, arrays = read_artifact(path, mmap=False)
+            meta = header['metadata']
+            if meta['base_version'] == live_record.version:
+                return arrays, meta
+        cursor = meta.get('cursor') or [live_record.created_at.isoformat(), str(uuid.UUID(int=0))]
+        return state_to_numpy(live_model), {
+            'base_version': live_record.version, 'cursor': cursor, 'updates': 0, 'labels': 0,
+        }
+
+    @classmethod
+    def _save_shadow(cls, state, meta):
+        directory = ModelRegistry.directory()
+        os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(prefix='.shadow-', suffix='.qrm', dir=directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                write_artifact(state, f, metadata=meta)
+            os.replace(temp_path, cls.shadow_path())
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    @classmethod
+    def step(cls) -> dict:
+        """Consumes new confirmed labels, updates the shadow and promotes it if it wins."""
+        live_record = ModelRegistry.active()
+        if live_record is None:
+            return {'status': 'skipped', 'message': 'No published model to update'}
+        live_model = ModelRegistry.load(live_record)
+        shadow_state, meta = cls._load_shadow(live_record, live_model)
+
+        labeled_at, pk = meta['cursor']
+        rows = confirmed_labels(
+            since=(datetime.fromisoformat(labeled_at), uuid.UUID(pk)),
+            limit=getattr(settings, 'FL_ONLINE_MAX_BATCH', 5000),
+        )
+        train_rows = [row for row in rows if not is_holdout(row[5])]
+        result = {'status': 'idle', 'live_version': live_record.version, 'new_labels': len(rows)}
+        if rows:
+            meta['cursor'] = [rows[-1][4].isoformat(), str(rows[-1][5])]
+
+        if train_rows:
+            shadow_state, _, loss = local_train(
+                shadow_state, featurize_rows(train_rows),
+                getattr(settings, 'FL_ONLINE_EPOCHS', 1),
+                getattr(settings, 'FL_BATCH_SIZE', 64),
+                getattr(settings, 'FL_ONLINE_LEARNING_RATE', 0.01),
+                seed=meta['updates'],
+            )
+            meta['updates'] += 1
+            meta['labels'] += len(train_rows)
+            result.update(status='updated', trained_on=len(train_rows), train_loss=loss)
+            result.update(cls._compare(live_record, live_model, shadow_state, meta))
+            if result.get('promoted_version'):
+                meta = {'base_version': result['promoted_version'], 'cursor': meta['cursor'], 'updates': 0, 'labels': 0}
+
+        cls._save_shadow(shadow_state, meta)
+        print(f"Online update: {result}")
+        return result
+
+    @staticmethod
+    def _compare(live_record, live_model, shadow_state, meta) -> dict:
+        start = timezone.now() - timedelta(hours=getattr(settings, 'FL_ONLINE_WINDOW_HOURS', 72))
+        rows = confirmed_labels(start=start, limit=getattr(settings, 'FL_ONLINE_WINDOW_MAX_ROWS', 100000))
+        window = [row for row in rows if is_holdout(row[5])]
+        if len(window) < getattr(settings, 'FL_ONLINE_MIN_HOLDOUT', 50):
+            return {'holdout_rows': len(window)}
+
+        # Both models are scored by predict_proba, the probabilities XAIService serves
+        features, labels = featurize_rows(window)
+        shadow_model = build_model()
+        shadow_model.load_state_dict(numpy_to_state(shadow_state))
+        live = evaluate(live_model, features, labels)
+        shadow = evaluate(shadow_model, features, labels)
+        comparison = {
+            'holdout_rows': len(window),
+            'live_log_loss': live['log_loss'],
+            'shadow_log_loss': shadow['log_loss'],
+        }
+        if shadow['log_loss'] < live['log_loss'] - getattr(settings, 'FL_ONLINE_PROMOTION_MARGIN', 0.002):
+            record = ModelRegistry.publish(shadow_model, metrics={
+                'data': 'online',
+                'base_version': live_record.version,
+                'labels': meta['labels'],
+                'updates': meta['updates'],
+                **comparison,
+            })
+            comparison['promoted_version'] = record.version
+        return comparison
@@ -0,0 +1,233 @@
+import hashlib
+import json
+import os
+import struct
+import tempfile
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import GlobalComplianceModel
+
+# Artifact layout: magic, header length, JSON header, then each tensor's raw
+# little-endian bytes at a 64-byte aligned offset so it can be memory-mapped.
+MAGIC = b'QRM1'
+PREAMBLE = struct.Struct('<4sI')
+ALIGNMENT = 64
+ARCHITECTURE = 'fedavg-mlp-4x16'
+
+
+def _aligned(offset):
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def write_artifact(arrays: dict, f, architecture=ARCHITECTURE, metadata=None):
+    """
+    Writes a weights-only artifact to the open binary file `f`.
+    Returns (sha256 hex digest, size in bytes).
+    """
+    arrays = {name: np.ascontiguousarray(value, dtype=np.asarray(value).dtype.newbyteorder('<'))
+              for name, value in arrays.items()}
+    tensors, offset = [], 0
+    for name, value in arrays.items():
+        offset = _aligned(offset)
+        tensors.append({'name': name, 'dtype': value.dtype.str, 'shape': list(value.shape),
+                        'offset': offset, 'nbytes': value.nbytes})
+        offset += value.nbytes
+    header = json.dumps({'architecture': architecture, 'metadata': metadata or {}, 'tensors': tensors}).encode('utf-8')
+    data_start = _aligned(PREAMBLE.size + len(header))
+
+    digest = hashlib.sha256()
+
+    def emit(chunk):
+        f.write(chunk)
+        digest.update(chunk)
+
+    emit(PREAMBLE.pack(MAGIC, len(header)) + header + b'\0' * (data_start - PREAMBLE.size - len(header)))
+    position = 0
+    for entry, value in zip(tensors, arrays.values()):
+        emit(b'\0' * (entry['offset'] - position))
+        emit(memoryview(value).cast('B'))
+        position = entry['offset'] + entry['nbytes']
+    return digest.hexdigest(), data_start + position
+
+
+def read_artifact(path, mmap=True):
+    """
+    Returns (header, {name: array}). With mmap the arrays are copy-on-write
+    views of the file, so processes loading the same version share its pages.
+    """
+    with open(path, 'rb') as f:
+        magic, header_length = PREAMBLE.unpack(f.read(PREAMBLE.size))
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a model artifact")
+        header = json.loads(f.read(header_length))
+        if not mmap:
+            f.seek(0)
+            buffer = np.frombuffer(bytearray(f.read()), dtype=np.uint8)
+    if mmap:
+        buffer = np.memmap(path, dtype=np.uint8, mode='c')
+    data_start = _aligned(PREAMBLE.size + header_length)
+    arrays = {}
+    for entry in header['tensors']:
+        start = data_start + entry['offset']
+        arrays[entry['name']] = (
+            buffer[start:start + entry['nbytes']].view(np.dtype(entry['dtype'])).reshape(entry['shape'])
+        )
+    return header, arrays
+
+
+def file_checksum(path) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _fsync_directory(directory):
+    # Makes the rename itself durable; not supported on every platform
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+class ModelRegistry:
+    """
+    Versioned storage for the global risk model on top of GlobalComplianceModel.
+
+    Each version is an immutable, checksummed weights-only artifact. Publishing
+    writes it to a temporary file, renames it into place and activates the new
+    row in one DB transaction, so readers only ever see complete files; an
+    artifact is never overwritten while a worker may be reading it. Rolling
+    back re-activates an earlier version. Readers poll the active version at
+    most every FL_MODEL_REFRESH_SECONDS.
+    """
+    _loaded = None  # (GlobalComplianceModel, nn.Module)
+    _checked_at = None
+    _lock = threading.Lock()
+
+    @staticmethod
+    def directory():
+        return getattr(settings, 'FL_MODEL_REGISTRY_DIR', os.path.join(settings.BASE_DIR, 'ml_models', 'registry'))
+
+    @staticmethod
+    def active():
+        return GlobalComplianceModel.objects.filter(status=GlobalComplianceModel.Status.ACTIVE).first()
+
+    @staticmethod
+    def _activate(record):
+        GlobalComplianceModel.objects.filter(status=GlobalComplianceModel.Status.ACTIVE).exclude(
+            pk=record.pk).update(status=GlobalComplianceModel.Status.RETIRED)
+        record.status = GlobalComplianceModel.Status.ACTIVE
+        record.activated_at = timezone.now()
+        record.save(update_fields=['status', 'activated_at'])
+
+    @classmethod
+    def publish(cls, model, metrics=None) -> GlobalComplianceModel:
+        """Stores the model's weights as the next version and makes it active."""
+        from .fedavg import state_to_numpy
+
+        directory = cls.directory()
+        os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(prefix='.publish-', suffix='.qrm', dir=directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                checksum, size = write_artifact(state_to_numpy(model), f, metadata=metrics)
+                f.flush()
+                os.fsync(f.fileno())
+            with transaction.atomic():
+                latest = GlobalComplianceModel.objects.select_for_update().order_by('-version').first()
+                version = (latest.version if latest else 0) + 1
+                path = os.path.join(directory, f"risk_model-v{version:06d}.qrm")
+                # The row is inserted first: a concurrent publisher blocks on the
+                # unique version and fails before touching the file
+                record = GlobalComplianceModel.objects.create(
+                    version=version, model_path=path, checksum=checksum,
+                    size_bytes=size, metrics=metrics or {},
+                )
+                os.replace(temp_path, path)
+                cls._activate(record)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        _fsync_directory(directory)
+        print(f"Published global model v{record.version} ({size} bytes) to {record.model_path}")
+        cls.prune()
+        return record
+
+    @classmethod
+    def rollback(cls, version=None) -> GlobalComplianceModel:
+        """Re-activates `version`, or the version before the active one."""
+        with transaction.atomic():
+            current = GlobalComplianceModel.objects.select_for_update().filter(
+                status=GlobalComplianceModel.Status.ACTIVE).first()
+            candidates = GlobalComplianceModel.objects.select_for_update()
+            if version is not None:
+                target = candidates.filter(version=version).first()
+            elif current is not None:
+                target = candidates.filter(version__lt=current.version).order_by('-version').first()
+            else:
+                target = None
+            if target is None:
+                raise ValueError(f"No model version to roll back to (requested: {version or 'previous'})")
+            if file_checksum(target.model_path) != target.checksum:
+                raise ValueError(f"Artifact for v{target.version} failed its checksum")
+            cls._activate(target)
+        print(f"Rolled back global model to v{target.version}")
+        return target
+
+    @classmethod
+    def prune(cls, keep=None):
+        """Deletes retired versions beyond the newest `keep`, artifacts first."""
+        keep = keep or getattr(settings, 'FL_MODEL_REGISTRY_KEEP', 10)
+        stale = GlobalComplianceModel.objects.filter(
+            status=GlobalComplianceModel.Status.RETIRED).order_by('-version')[keep:]
+        for record in list(stale):
+            if os.path.exists(record.model_path):
+                os.remove(record.model_path)
+            record.delete()
+
+    @staticmethod
+    def load(record, verify=True):
+        """Builds the model for a version with its weights memory-mapped from the artifact."""
+        # torch is only imported by processes that serve or train the model
+        import torch
+        from .fedavg import build_model
+
+        if verify and file_checksum(record.model_path) != record.checksum:
+            raise ValueError(f"Artifact for v{record.version} failed its checksum")
+        header, arrays = read_artifact(record.model_path)
+        if header['architecture'] != ARCHITECTURE:
+            raise ValueError(f"Unsupported model architecture: {header['architecture']}")
+        model = build_model()
+        model.load_state_dict({name: torch.from_numpy(value) for name, value in arrays.items()}, assign=True)
+        return model.eval()
+
+    @classmethod
+    def load_active(cls):
+        """Returns (record, model) for the active version, or None if nothing is published."""
+        refresh = getattr(settings, 'FL_MODEL_REFRESH_SECONDS', 30)
+        now = time.monotonic()
+        if cls._checked_at is not None and now - cls._checked_at < refresh:
+            return cls._loaded
+        with cls._lock:
+            if cls._checked_at is None or now - cls._checked_at >= refresh:
+                record = cls.active()
+                if record is None:
+                    cls._loaded = None
+                elif cls._loaded is None or cls._loaded[0].pk != record.pk:
+                    cls._loaded = (record, cls.load(record))
+                cls._checked_at = now
+        return cls._loaded
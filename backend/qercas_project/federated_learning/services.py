@@ -1,53 +1,95 @@
-import torch
-import torch.nn as nn
-import torch.optim as optim
-import joblib
 import os
+import shutil
+import tempfile
+from datetime import timedelta
 from django.conf import settings
+from django.utils import timezone
+from .compression import UpdateCodec
+from .data import TransactionDataLoader
+from .fedavg import FedAvgEngine, simulated_client_data
+from .registry import ModelRegistry
 
 class FederatedTrainingService:
     """
-    Simulates a federated learning cycle to train the risk model.
+    Runs a federated learning cycle (FedAvg over simulated institutions)
+    to train the risk model. Labeled transactions are streamed from the
+    database into per-institution partitions; below FL_MIN_TRAINING_ROWS the
+    cycle falls back to synthetic data.
     """
     @staticmethod
-    def get_simulated_data_for_bank():
-        """Creates some dummy data representing a bank's private transactions."""
-        data = torch.randn(100, 4)
-        labels = torch.randint(0, 2, (100, 1)).float()
-        return data, labels
+    def get_simulated_data_for_banks(n_clients=None, samples_per_client=None):
+        """Creates synthetic data representing each bank's private transactions."""
+        return simulated_client_data(
+            n_clients or getattr(settings, 'FL_CLIENTS', 4),
+            samples_per_client or getattr(settings, 'FL_SAMPLES_PER_CLIENT', 5000),
+        )
 
     @staticmethod
-    def run_training_cycle():
-        print("--- Starting Federated Learning Training Cycle ---")
-        
-        model = nn.Sequential(
-            nn.Linear(4, 16), nn.ReLU(), nn.Linear(16, 1), nn.Sigmoid()
+    def load_transaction_partitions(root, n_clients=None):
+        """
+        Streams labeled transactions, live and archived, from the last
+        FL_TRAINING_HISTORY_DAYS (all history when None) into one partition
+        directory per bank under `root`. Returns (partition dirs, total rows).
+        """
+        history_days = getattr(settings, 'FL_TRAINING_HISTORY_DAYS', None)
+        loader = TransactionDataLoader(
+            n_clients or getattr(settings, 'FL_CLIENTS', 4),
+            chunk_size=getattr(settings, 'FL_LOADER_CHUNK_SIZE', 10000),
+            since=timezone.now() - timedelta(days=history_days) if history_days else None,
         )
+        partitions = loader.write_partitions(root)
+        return partitions, sum(loader.counts)
+
+    @staticmethod
+    def build_codec():
+        """The configured client update compression, or None to upload full weights."""
+        top_k = getattr(settings, 'FL_UPDATE_TOP_K', None)
+        quantize = getattr(settings, 'FL_UPDATE_QUANTIZE', False)
+        if top_k is None and not quantize:
+            return None
+        return UpdateCodec(top_k=top_k, quantize=quantize,
+                           error_feedback=getattr(settings, 'FL_UPDATE_ERROR_FEEDBACK', True))
 
-        bank_1_data, bank_1_labels = FederatedTrainingService.get_simulated_data_for_bank()
-        bank_2_data, bank_2_labels = FederatedTrainingService.get_simulated_data_for_bank()
-        
-        optimizer = optim.SGD(model.parameters(), lr=0.01)
-        criterion = nn.BCELoss()
+    @staticmethod
+    def build_engine(**overrides):
+        options = {
+            'rounds': getattr(settings, 'FL_ROUNDS', 5),
+            'local_epochs': getattr(settings, 'FL_LOCAL_EPOCHS', 2),
+            'batch_size': getattr(settings, 'FL_BATCH_SIZE', 64),
+            'lr': getattr(settings, 'FL_LEARNING_RATE', 0.05),
+            'workers': getattr(settings, 'FL_WORKERS', None),
+            'codec': FederatedTrainingService.build_codec(),
+        }
+        options.update({k: v for k, v in overrides.items() if v is not None})
+        return FedAvgEngine(**options)
+
+    @staticmethod
+    def run_training_cycle():
+        print("--- Starting Federated Learning Training Cycle ---")
 
-        print("Training on Bank 1's private data...")
-        optimizer.zero_grad()
-        output = model(bank_1_data)
-        loss = criterion(output, bank_1_labels)
-        loss.backward()
-        optimizer.step()
+        data_dir = getattr(settings, 'FL_DATA_DIR', os.path.join(settings.BASE_DIR, 'fl_data'))
+        os.makedirs(data_dir, exist_ok=True)
+        workdir = tempfile.mkdtemp(prefix='cycle-', dir=data_dir)
+        try:
+            client_sources, rows = FederatedTrainingService.load_transaction_partitions(workdir)
+            data_source = 'transactions'
+            if rows < getattr(settings, 'FL_MIN_TRAINING_ROWS', 1000):
+                print(f"Only {rows} labeled transactions; training on simulated bank data instead.")
+                client_sources = FederatedTrainingService.get_simulated_data_for_banks()
+                data_source = 'simulated'
+            engine = FederatedTrainingService.build_engine()
+            print(f"Training on {len(client_sources)} banks' private data "
+                  f"({engine.rounds} rounds x {engine.local_epochs} local epochs)...")
+            model = engine.run(client_sources)
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
 
-        print("Training on Bank 2's private data...")
-        optimizer.zero_grad()
-        output = model(bank_2_data)
-        loss = criterion(output, bank_2_labels)
-        loss.backward()
-        optimizer.step()
-        
-        model_dir = os.path.join(settings.BASE_DIR, 'ml_models')
-        os.makedirs(model_dir, exist_ok=True)
-        model_path = os.path.join(model_dir, "risk_model.joblib")
-        joblib.dump(model, model_path)
-        
-        print(f"\n--- Federated training complete. New aggregated model saved to: {model_path} ---")
-        return model_path
+        record = ModelRegistry.publish(model, metrics={
+            'data': data_source,
+            'clients': len(client_sources),
+            'rounds': engine.rounds,
+            'samples': engine.history[-1]['samples'],
+            'loss': engine.history[-1]['loss'],
+        })
+        print(f"\n--- Federated training complete. Global model v{record.version} published to: {record.model_path} ---")
+        return record
@@ -1,15 +1,19 @@
 from celery import shared_task
-from federated_learning.services import FederatedTrainingService
+
+# Training modules import torch; every worker imports this module at startup,
+# so they are only imported by the worker that runs a training task.
 
 @shared_task(name="federated_learning.tasks.run_federated_training")
 def run_federated_training():
     """Celery task to run federated learning training"""
+    from federated_learning.services import FederatedTrainingService
     try:
-        model_path = FederatedTrainingService.run_training_cycle()
+        record = FederatedTrainingService.run_training_cycle()
         return {
             'status': 'success',
-            'model_path': model_path,
-            'message': f'Model updated at: {model_path}'
+            'version': record.version,
+            'model_path': record.model_path,
+            'message': f'Model v{record.version} published at: {record.model_path}'
         }
     except Exception as e:
         return {
@@ -17,3 +21,16 @@ def run_federated_training():
             'error': str(e),
             'message': 'Federated learning training failed'
         }
+
+@shared_task(name="federated_learning.tasks.run_online_update")
+def run_online_update():
+    """Celery task to apply newly confirmed labels to the shadow model"""
+    from federated_learning.online import OnlineLearner
+    try:
+        return OnlineLearner.step()
+    except Exception as e:
+        return {
+            'status': 'error',
+            'error': str(e),
+            'message': 'Online model update failed'
+        }
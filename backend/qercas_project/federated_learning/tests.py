@@ -1,3 +1,555 @@
-from django.test import TestCase
+import base64
+import io
+import math
+import os
+import shutil
+import tempfile
+import uuid
+from datetime import datetime, timedelta, timezone as dt_timezone
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+import torch
+from django.core.management import CommandError, call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from privacy_vault.keystore import KeyStore
+from transactions.archive import TransactionArchive
+from transactions.models import Transaction
+from xai_engine.services import XAIService
+
+from .compression import UpdateCodec, dense_size
+from . import online
+from .data import TransactionDataLoader, exclude_holdout, featurize_rows, is_holdout
+
+from .fedavg import (
+    FedAvgEngine, build_model, evaluate, federated_average, load_client_data, local_train, simulated_client_data,
+    state_to_numpy,
+)
+from .models import GlobalComplianceModel
+from .online import OnlineLearner
+from .registry import ModelRegistry, read_artifact, write_artifact
+from .services import FederatedTrainingService
+
+VAULT_KEY = base64.b64encode(bytes(range(32))).decode()
+
+
+class TransactionDataMixin:
+    """Creates transactions under a test vault key, with archives written to a temporary directory."""
+
+    def setUp(self):
+        super().setUp()
+        KeyStore._current = None
+        KeyStore._keys.clear()
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir, ignore_errors=True)
+        settings_override = override_settings(
+            PRIVACY_VAULT_MASTER_KEY=VAULT_KEY, TRANSACTION_ARCHIVE_DIR=os.path.join(self.tmp_dir, 'archive'),
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.count = 0
+
+    def create(self, amount=100, status=Transaction.Status.COMPLIANT, analyst_label=None, labeled_at=None,
+               source='DE89 3704', timestamp=None, transaction_type=Transaction.TransactionType.WIRE_TRANSFER):
+        self.count += 1
+        tx = Transaction.objects.create(
+            transaction_id_str=f"TX-{self.count}", amount=amount, currency='EUR', client_name='Client',
+            source_account=source, destination_account='FR76 3000', status=status,
+            analyst_label=analyst_label, labeled_at=labeled_at, transaction_type=transaction_type,
+        )
+        if timestamp is not None:
+            Transaction.objects.filter(pk=tx.pk).update(timestamp=timestamp)
+        tx.refresh_from_db()
+        return tx
+
+
+class FedAvgTests(SimpleTestCase):
+    def test_average_is_weighted_by_samples(self):
+        states = [{'w': np.array([0.0, 2.0], dtype=np.float32)}, {'w': np.array([4.0, 6.0], dtype=np.float32)}]
+        averaged = federated_average(states, [1, 3])
+
+        np.testing.assert_allclose(averaged['w'], [3.0, 5.0])
+        self.assertEqual(averaged['w'].dtype, np.float32)
+
+    def test_model_takes_raw_feature_rows(self):
+        model = build_model()
+        rows = torch.tensor([[25000.0, 2, 14, 1], [12.5, 6, 3, 0]])
+        with torch.no_grad():
+            scores = model(rows)
+        self.assertEqual(tuple(scores.shape), (2, 1))
+        self.assertTrue(((scores > 0) & (scores < 1)).all())
+
+    def test_one_client_round_equals_local_training(self):
+        (features, labels), = simulated_client_data(1, 300)
+        torch.manual_seed(0)
+        initial = state_to_numpy(build_model())
+
+        engine = FedAvgEngine(rounds=1, local_epochs=1, batch_size=32, workers=1, seed=0)
+        trained = state_to_numpy(engine.run([(features, labels)]))
+        expected, samples, _ = local_train(initial, (features, labels), 1, 32, engine.lr, seed=1009)
+
+        self.assertEqual(samples, 300)
+        for name in expected:
+            np.testing.assert_allclose(trained[name], expected[name], rtol=1e-5, atol=1e-6)
+
+    def test_rounds_reduce_the_holdout_loss(self):
+        sources = simulated_client_data(3, 800)
+        holdout_X, holdout_y = simulated_client_data(1, 2000, seed=99)[0]
+        torch.manual_seed(0)
+        before = evaluate(build_model(), holdout_X, holdout_y)
+
+        engine = FedAvgEngine(rounds=3, local_epochs=1, batch_size=64, workers=1, seed=0)
+        after = evaluate(engine.run(sources), holdout_X, holdout_y)
+
+        self.assertLess(after['log_loss'], before['log_loss'])
+        self.assertEqual([entry['round'] for entry in engine.history], [1, 2, 3])
+        self.assertEqual(engine.history[-1]['samples'], 2400)
+
+    def test_training_is_reproducible_for_a_seed(self):
+        sources = simulated_client_data(2, 200)
+        first = state_to_numpy(FedAvgEngine(rounds=2, local_epochs=1, workers=1, seed=7).run(sources))
+        second = state_to_numpy(FedAvgEngine(rounds=2, local_epochs=1, workers=1, seed=7).run(sources))
+        for name in first:
+            np.testing.assert_array_equal(first[name], second[name])
+
+    def test_process_pool_matches_sequential_training(self):
+        sources = simulated_client_data(2, 200)
+        sequential = state_to_numpy(FedAvgEngine(rounds=1, local_epochs=1, workers=1, seed=3).run(sources))
+        parallel = state_to_numpy(FedAvgEngine(rounds=1, local_epochs=1, workers=2, seed=3).run(sources))
+        for name in sequential:
+            np.testing.assert_allclose(parallel[name], sequential[name], rtol=1e-5, atol=1e-6)
+
+
+@override_settings(FL_ONLINE_HOLDOUT_FRACTION=0)
+class TransactionDataLoaderTests(TransactionDataMixin, TestCase):
+    def load(self, loader):
+        partitions = loader.write_partitions(os.path.join(self.tmp_dir, 'partitions'))
+        return [load_client_data(p) for p in partitions]
+
+    def test_columnar_features_match_the_model_features(self):
+        tx = self.create(amount='1234.5', transaction_type=Transaction.TransactionType.CRYPTO,
+                         timestamp=datetime(2024, 3, 9, 23, 15, tzinfo=dt_timezone.utc))
+        features, labels = featurize_rows([(tx.amount, tx.timestamp, tx.transaction_type, tx.status)])
+
+        expected = tx.to_feature_dict()
+        self.assertEqual(features[0].tolist(), [
+            expected['amount'], expected['day_of_week'], expected['hour_of_day'], expected['is_crypto'],
+        ])
+        self.assertEqual(labels.tolist(), [0.0])
+
+    def test_only_labeled_rows_are_loaded_and_analyst_labels_win(self):
+        self.create(status=Transaction.Status.PENDING)
+        self.create(status=Transaction.Status.BLOCKED)
+        self.create(status=Transaction.Status.COMPLIANT, analyst_label=Transaction.Status.HIGH_RISK)
+        self.create(status=Transaction.Status.HIGH_RISK, analyst_label=Transaction.Status.COMPLIANT)
+
+        loader = TransactionDataLoader(1, chunk_size=2)
+        (features, labels), = self.load(loader)
+
+        self.assertEqual(loader.counts, [3])
+        self.assertEqual(features.shape, (3, 4))
+        self.assertEqual(sorted(labels.tolist()), [0.0, 1.0, 1.0])
+
+    def test_each_account_stays_with_one_institution(self):
+        for i in range(16):
+            self.create(amount=i + 1, source=f"ACC-{i % 8}")
+            self.create(amount=i + 1, source=f"ACC-{i % 8}")
+
+        loader = TransactionDataLoader(3, chunk_size=5)
+        partitions = self.load(loader)
+
+        self.assertEqual(sum(loader.counts), 32)
+        self.assertEqual(len(partitions), 3)
+        # Every account contributes rows of two equal amounts; they must land together
+        for features, _ in partitions:
+            amounts = sorted(features[:, 0].tolist())
+            self.assertEqual(amounts[0::2], amounts[1::2])
+
+    def test_since_limits_both_the_table_and_the_archive(self):
+        now = timezone.now()
+        self.create(amount=1, timestamp=now - timedelta(days=400))
+        self.create(amount=2, timestamp=now - timedelta(days=100))
+        self.create(amount=3, timestamp=now - timedelta(days=10))
+        TransactionArchive.archive(before=now - timedelta(days=50))
+        self.assertEqual(Transaction.objects.count(), 1)
+
+        (features, _), = self.load(TransactionDataLoader(1, since=now - timedelta(days=200)))
+        self.assertEqual(sorted(features[:, 0].tolist()), [2.0, 3.0])
+        (features, _), = self.load(TransactionDataLoader(1))
+        self.assertEqual(sorted(features[:, 0].tolist()), [1.0, 2.0, 3.0])
+
+    @override_settings(FL_ONLINE_HOLDOUT_FRACTION=0.5)
+    def test_holdout_rows_are_left_out_of_the_table_and_the_archive(self):
+        now = timezone.now()
+        rows = [self.create(amount=i + 1, timestamp=now - timedelta(days=400 if i % 2 else 1)) for i in range(40)]
+        TransactionArchive.archive(before=now - timedelta(days=50))
+
+        loader = TransactionDataLoader(1)
+        (features, _), = self.load(loader)
+
+        expected = sorted(float(tx.amount) for tx in rows if not is_holdout(tx.pk))
+        self.assertEqual(sorted(features[:, 0].tolist()), expected)
+        self.assertLess(len(expected), 40)
+
+
+class RegistryDirMixin:
+    """Publishes into a temporary registry directory and forgets the loaded model."""
+
+    def setUp(self):
+        super().setUp()
+        self.registry_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.registry_dir, ignore_errors=True)
+        settings_override = override_settings(FL_MODEL_REGISTRY_DIR=self.registry_dir, FL_MODEL_REFRESH_SECONDS=0)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.forget_loaded()
+        self.addCleanup(self.forget_loaded)
+
+    @staticmethod
+    def forget_loaded():
+        ModelRegistry._loaded, ModelRegistry._checked_at = None, None
+
+    @staticmethod
+    def model(seed):
+        torch.manual_seed(seed)
+        return build_model()
+
+
+class ArtifactTests(SimpleTestCase):
+    def test_roundtrip_with_aligned_memory_mapped_tensors(self):
+        arrays = {'a': np.arange(5, dtype=np.float32), 'b': np.ones((3, 2), dtype=np.float64), 'c': np.zeros(0)}
+        path = os.path.join(tempfile.mkdtemp(), 'model.qrm')
+        self.addCleanup(shutil.rmtree, os.path.dirname(path))
+        with open(path, 'wb') as f:
+            checksum, size = write_artifact(arrays, f, metadata={'loss': 0.5})
+
+        header, loaded = read_artifact(path)
+        self.assertEqual(os.path.getsize(path), size)
+        self.assertEqual(header['metadata'], {'loss': 0.5})
+        self.assertTrue(all(entry['offset'] % 64 == 0 for entry in header['tensors']))
+        for name, value in arrays.items():
+            np.testing.assert_array_equal(loaded[name], value)
+            self.assertEqual(loaded[name].dtype, value.dtype)
+        self.assertEqual(len(checksum), 64)
+
+    def test_other_files_are_rejected(self):
+        path = os.path.join(tempfile.mkdtemp(), 'model.joblib')
+        self.addCleanup(shutil.rmtree, os.path.dirname(path))
+        with open(path, 'wb') as f:
+            f.write(b'not a model artifact')
+        with self.assertRaisesRegex(ValueError, 'not a model artifact'):
+            read_artifact(path)
+
+
+class ModelRegistryTests(RegistryDirMixin, TestCase):
+    def test_publish_activates_a_new_version(self):
+        first = ModelRegistry.publish(self.model(1), metrics={'loss': 0.7})
+        second = ModelRegistry.publish(self.model(2), metrics={'loss': 0.6})
+
+        self.assertEqual((first.version, second.version), (1, 2))
+        self.assertEqual(ModelRegistry.active(), second)
+        first.refresh_from_db()
+        self.assertEqual(first.status, GlobalComplianceModel.Status.RETIRED)
+        self.assertTrue(os.path.exists(first.model_path))
+        self.assertEqual([f for f in os.listdir(self.registry_dir) if f.startswith('.')], [])
+
+    def test_loaded_model_has_the_published_weights(self):
+        model = self.model(1)
+        ModelRegistry.publish(model)
+
+        record, loaded = ModelRegistry.load_active()
+        rows = torch.tensor([[5000.0, 1, 2, 1], [10.0, 4, 13, 0]])
+        with torch.no_grad():
+            torch.testing.assert_close(loaded(rows), model(rows))
+
+    def test_scoring_serves_the_published_model_probability(self):
+        self.addCleanup(XAIService._set_model, None)
+        features = {'amount': 250.0, 'day_of_week': 2, 'hour_of_day': 14, 'is_crypto': 0}
+        expected = {0.3: Transaction.Status.COMPLIANT, 0.6: Transaction.Status.HIGH_RISK, 0.9: Transaction.Status.BLOCKED}
+        for probability, status in expected.items():
+            with self.subTest(probability):
+                model = self.model(1)
+                with torch.no_grad():
+                    model[-2].weight.zero_()
+                    model[-2].bias.fill_(math.log(probability / (1 - probability)))
+                ModelRegistry.publish(model)
+
+                served_status, served, _ = XAIService().predict_status(features)
+                self.assertEqual(served_status, status)
+                self.assertAlmostEqual(served, probability, places=5)
+
+    def test_rollback_reactivates_the_previous_version(self):
+        first = ModelRegistry.publish(self.model(1))
+        ModelRegistry.publish(self.model(2))
+        ModelRegistry.load_active()
+
+        self.assertEqual(ModelRegistry.rollback(), first)
+        self.assertEqual(ModelRegistry.active(), first)
+        self.assertEqual(ModelRegistry.load_active()[0], first)
+
+    def test_rollback_to_a_version_and_its_errors(self):
+        ModelRegistry.publish(self.model(1))
+        ModelRegistry.publish(self.model(2))
+        ModelRegistry.publish(self.model(3))
+
+        self.assertEqual(ModelRegistry.rollback(1).version, 1)
+        with self.assertRaisesRegex(ValueError, 'No model version'):
+            ModelRegistry.rollback()
+        with self.assertRaisesRegex(ValueError, 'No model version'):
+            ModelRegistry.rollback(9)
+
+    def test_corrupted_artifact_is_never_activated_or_loaded(self):
+        first = ModelRegistry.publish(self.model(1))
+        second = ModelRegistry.publish(self.model(2))
+        with open(first.model_path, 'r+b') as f:
+            f.seek(-1, os.SEEK_END)
+            f.write(b'\xff')
+
+        with self.assertRaisesRegex(ValueError, 'checksum'):
+            ModelRegistry.rollback()
+        self.assertEqual(ModelRegistry.active(), second)
+        with self.assertRaisesRegex(ValueError, 'checksum'):
+            ModelRegistry.load(first)
+
+    @override_settings(FL_MODEL_REGISTRY_KEEP=1)
+    def test_old_retired_versions_are_pruned(self):
+        records = [ModelRegistry.publish(self.model(i)) for i in range(4)]
+
+        self.assertEqual(list(GlobalComplianceModel.objects.values_list('version', flat=True)), [4, 3])
+        self.assertFalse(os.path.exists(records[0].model_path))
+        self.assertTrue(os.path.exists(records[2].model_path))
+
+    def test_training_cycle_publishes_a_version(self):
+        with override_settings(FL_DATA_DIR=os.path.join(self.registry_dir, 'data'), FL_CLIENTS=2,
+                               FL_SAMPLES_PER_CLIENT=100, FL_ROUNDS=1, FL_LOCAL_EPOCHS=1, FL_WORKERS=1):
+            record = FederatedTrainingService.run_training_cycle()
+
+        self.assertEqual(ModelRegistry.active(), record)
+        self.assertEqual(record.metrics['data'], 'simulated')
+        self.assertEqual(record.metrics['samples'], 200)
+        self.assertEqual(os.listdir(os.path.join(self.registry_dir, 'data')), [])
+
+    def test_rollback_command(self):
+        ModelRegistry.publish(self.model(1))
+        ModelRegistry.publish(self.model(2))
+        out = io.StringIO()
+        call_command('rollback_model', stdout=out)
+        self.assertIn('v1', out.getvalue())
+        with self.assertRaises(CommandError):
+            call_command('rollback_model', '7', stdout=out)
+
+
+class ExplanationTests(RegistryDirMixin, TestCase):
+    def test_fedavg_model_explanations_add_up_to_its_score(self):
+        self.addCleanup(XAIService._set_model, None)
+        model = FedAvgEngine(rounds=1, local_epochs=1, workers=1, seed=0).run(simulated_client_data(2, 200))
+        ModelRegistry.publish(model)
+        features = {'amount': 25000.0, 'day_of_week': 5, 'hour_of_day': 2, 'is_crypto': 1}
+
+        explanation = XAIService().generate_explanation(features)
+        _, probability, _ = XAIService().predict_status(features)
+
+        self.assertEqual(explanation['feature_names'], ['amount', 'day_of_week', 'hour_of_day', 'is_crypto'])
+        self.assertEqual(len(explanation['shap_values']), 4)
+        self.assertAlmostEqual(explanation['base_value'] + sum(explanation['shap_values']), probability, places=3)
+
+
+class UpdateCodecTests(SimpleTestCase):
+    def delta(self, seed=0):
+        rng = np.random.default_rng(seed)
+        return {'weight': rng.standard_normal((16, 4)).astype(np.float32), 'bias': rng.standard_normal(16).astype(np.float32)}
+
+    def test_uncompressed_delta_roundtrips_exactly(self):
+        delta = self.delta()
+        payload, residual = UpdateCodec().encode(delta)
+
+        decoded = UpdateCodec().decode(payload, delta)
+        for name in delta:
+            np.testing.assert_array_equal(decoded[name], delta[name])
+            np.testing.assert_array_equal(residual[name], 0)
+        self.assertEqual(len(payload), dense_size(delta) + 2 * UpdateCodec.ENTRY.size)
+
+    def test_top_k_keeps_the_largest_entries(self):
+        delta = self.delta()
+        codec = UpdateCodec(top_k=0.25, error_feedback=False)
+        payload, residual = codec.encode(delta)
+        decoded = codec.decode(payload, delta)
+
+        self.assertIsNone(residual)
+        for name, value in delta.items():
+            kept = np.flatnonzero(decoded[name].ravel())
+            k = int(np.ceil(0.25 * value.size))
+            self.assertEqual(len(kept), k)
+            threshold = np.sort(np.abs(value.ravel()))[-k]
+            np.testing.assert_array_equal(np.sort(kept), np.flatnonzero(np.abs(value.ravel()) >= threshold))
+            np.testing.assert_array_equal(decoded[name].ravel()[kept], value.ravel()[kept])
+        # 16-bit indices and 32-bit values per kept entry
+        self.assertEqual(len(payload), 2 * UpdateCodec.ENTRY.size + (16 + 4) * 6)
+
+    def test_large_tensors_use_wide_indices(self):
+        delta = {'big': np.arange(70000, dtype=np.float32)}
+        codec = UpdateCodec(top_k=0.0001, error_feedback=False)
+        decoded = codec.decode(codec.encode(delta)[0], delta)
+        self.assertEqual(np.flatnonzero(decoded['big']).tolist(), list(range(69993, 70000)))
+
+    def test_int8_quantization_error_is_within_half_a_step(self):
+        delta = self.delta()
+        codec = UpdateCodec(quantize=True, error_feedback=False)
+        payload, _ = codec.encode(delta)
+        decoded = codec.decode(payload, delta)
+
+        for name, value in delta.items():
+            step = np.abs(value).max() / 127
+            self.assertLessEqual(np.abs(decoded[name] - value).max(), step / 2 + 1e-6)
+        self.assertEqual(len(payload), 2 * UpdateCodec.ENTRY.size + 80)
+
+    def test_error_feedback_carries_what_was_dropped(self):
+        codec = UpdateCodec(top_k=0.1, quantize=True)
+        residual, sent, total = None, None, None
+        for round_number in range(30):
+            delta = self.delta(seed=round_number)
+            payload, next_residual = codec.encode(delta, residual)
+            decoded = codec.decode(payload, delta)
+            for name in delta:
+                carried = delta[name].ravel() + (residual[name] if residual else 0)
+                np.testing.assert_allclose(decoded[name].ravel() + next_residual[name], carried, atol=1e-5)
+            sent = {n: (sent[n] if sent else 0) + decoded[n] for n in delta}
+            total = {n: (total[n] if total else 0) + delta[n] for n in delta}
+            residual = next_residual
+
+        # Everything not yet sent is still in the residual
+        for name in total:
+            np.testing.assert_allclose(sent[name].ravel() + residual[name], total[name].ravel(), atol=1e-4)
+
+    def test_invalid_fraction_is_rejected(self):
+        for top_k in (0, 1.5):
+            with self.assertRaises(ValueError):
+                UpdateCodec(top_k=top_k)
+
+    def test_settings_build_the_codec(self):
+        with override_settings(FL_UPDATE_TOP_K=None, FL_UPDATE_QUANTIZE=False):
+            self.assertIsNone(FederatedTrainingService.build_codec())
+        with override_settings(FL_UPDATE_TOP_K=0.1, FL_UPDATE_QUANTIZE=True, FL_UPDATE_ERROR_FEEDBACK=False):
+            codec = FederatedTrainingService.build_codec()
+        self.assertEqual(codec.describe(), 'top-10% + int8')
+
+    def test_lossless_codec_trains_like_full_weights(self):
+        sources = simulated_client_data(2, 200)
+        full = FedAvgEngine(rounds=2, local_epochs=1, workers=1, seed=5)
+        coded = FedAvgEngine(rounds=2, local_epochs=1, workers=1, seed=5, codec=UpdateCodec())
+        expected, actual = state_to_numpy(full.run(sources)), state_to_numpy(coded.run(sources))
+
+        for name in expected:
+            np.testing.assert_allclose(actual[name], expected[name], rtol=1e-4, atol=1e-5)
+
+    def test_compressed_rounds_upload_less_and_still_learn(self):
+        sources = simulated_client_data(3, 800)
+        holdout_X, holdout_y = simulated_client_data(1, 2000, seed=99)[0]
+        torch.manual_seed(0)
+        before = evaluate(build_model(), holdout_X, holdout_y)
+
+        engine = FedAvgEngine(rounds=4, local_epochs=1, workers=1, seed=0, codec=UpdateCodec(top_k=0.1, quantize=True))
+        after = evaluate(engine.run(sources), holdout_X, holdout_y)
+
+        for entry in engine.history:
+            self.assertLess(entry['uplink_bytes'] * 3, entry['dense_uplink_bytes'])
+        self.assertLess(after['log_loss'], before['log_loss'])
+
+
+class HoldoutTests(TransactionDataMixin, TestCase):
+    def test_sql_holdout_matches_is_holdout(self):
+        for _ in range(60):
+            self.create()
+        for fraction in (0.0, 0.3, 0.5, 1.0):
+            with self.subTest(fraction=fraction), override_settings(FL_ONLINE_HOLDOUT_FRACTION=fraction):
+                kept = set(exclude_holdout(Transaction.objects.all()).values_list('id', flat=True))
+                expected = {pk for pk in Transaction.objects.values_list('id', flat=True) if not is_holdout(pk)}
+                self.assertEqual(kept, expected)
+
+    @override_settings(FL_ONLINE_HOLDOUT_FRACTION=0.25)
+    def test_holdout_is_decided_by_the_last_16_bits_of_the_id(self):
+        self.assertTrue(is_holdout(uuid.UUID(int=0x3FFF)))
+        self.assertFalse(is_holdout(uuid.UUID(int=0x4000)))
+        self.assertTrue(is_holdout(uuid.UUID(int=0xFFFF0000)))
+
+
+@override_settings(FL_ONLINE_HOLDOUT_FRACTION=0.5, FL_ONLINE_MIN_HOLDOUT=1, FL_ONLINE_PROMOTION_MARGIN=0.01)
+class OnlineLearnerTests(RegistryDirMixin, TransactionDataMixin, TestCase):
+    def label(self, n, status=Transaction.Status.HIGH_RISK):
+        """Confirms n new transactions, labeled after everything published or labeled so far."""
+        rows = []
+        for i in range(n):
+            self.clock = max(getattr(self, 'clock', timezone.now()), timezone.now()) + timedelta(seconds=1)
+            rows.append(self.create(amount=1000 + i, analyst_label=status, labeled_at=self.clock))
+        return rows
+
+    def test_nothing_to_update_without_a_published_model(self):
+        self.assertEqual(OnlineLearner.step()['status'], 'skipped')
+
+    def test_new_labels_are_consumed_once_and_the_holdout_is_never_trained_on(self):
+        ModelRegistry.publish(self.model(1))
+        rows = self.label(20)
+        trainable = sorted(float(tx.amount) for tx in rows if not is_holdout(tx.pk))
+
+        with mock.patch.object(online, 'local_train', wraps=online.local_train) as train:
+            result = OnlineLearner.step()
+        features, _ = train.call_args[0][1]
+        self.assertEqual(sorted(features[:, 0].tolist()), trainable)
+        self.assertEqual((result['new_labels'], result['trained_on']), (20, len(trainable)))
+
+        again = OnlineLearner.step()
+        self.assertEqual((again['status'], again['new_labels']), ('idle', 0))
+        self.label(2)
+        self.assertEqual(OnlineLearner.step()['new_labels'], 2)
+
+    def test_shadow_that_beats_the_live_model_is_promoted(self):
+        live = ModelRegistry.publish(self.model(1))
+        self.label(20)
+
+        scores = iter([{'log_loss': 0.70, 'accuracy': 0.5}, {'log_loss': 0.60, 'accuracy': 0.6}])
+        with mock.patch.object(online, 'evaluate', side_effect=lambda *args: next(scores)):
+            result = OnlineLearner.step()
+
+        self.assertEqual(result['promoted_version'], live.version + 1)
+        promoted = ModelRegistry.active()
+        self.assertEqual((promoted.metrics['data'], promoted.metrics['base_version']), ('online', live.version))
+        header, _ = read_artifact(OnlineLearner.shadow_path())
+        self.assertEqual(header['metadata']['base_version'], promoted.version)
+
+    def test_holdout_is_scored_the_way_transactions_are_served(self):
+        self.addCleanup(XAIService._set_model, None)
+        ModelRegistry.publish(self.model(1))
+        holdout = [tx for tx in self.label(20) if is_holdout(tx.pk)]
+
+        result = OnlineLearner.step()
+
+        served = np.array([XAIService().predict_status(tx.to_feature_dict())[1] for tx in holdout])
+        self.assertEqual(result['holdout_rows'], len(holdout))
+        self.assertAlmostEqual(result['live_log_loss'], float(-np.mean(np.log(np.clip(served, 1e-7, 1)))), places=5)
+
+    def test_shadow_that_does_not_win_by_the_margin_stays_in_shadow(self):
+        ModelRegistry.publish(self.model(1))
+        self.label(20)
+
+        scores = iter([{'log_loss': 0.70, 'accuracy': 0.5}, {'log_loss': 0.695, 'accuracy': 0.5}])
+        with mock.patch.object(online, 'evaluate', side_effect=lambda *args: next(scores)):
+            result = OnlineLearner.step()
+
+        self.assertNotIn('promoted_version', result)
+        self.assertEqual(GlobalComplianceModel.objects.count(), 1)
+        self.assertEqual(read_artifact(OnlineLearner.shadow_path())[0]['metadata']['updates'], 1)
+
+    @mock.patch.object(online, 'evaluate', return_value={'log_loss': 0.7, 'accuracy': 0.5})
+    def test_shadow_restarts_from_a_newly_activated_version(self, _evaluate):
+        ModelRegistry.publish(self.model(1))
+        self.label(20)
+        OnlineLearner.step()
+
+        retrained = ModelRegistry.publish(self.model(2))
+        self.label(2)
+        OnlineLearner.step()
+
+        meta = read_artifact(OnlineLearner.shadow_path())[0]['metadata']
+        self.assertEqual(meta['base_version'], retrained.version)
+        self.assertLessEqual(meta['labels'], 2)
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from gnn_analyzer.snapshots import GraphSnapshotService
+
+class Command(BaseCommand):
+    help = 'Writes a CSR snapshot of the account graph for workers to memory-map at startup.'
+
+    def handle(self, *args, **options):
+        self.stdout.write("Building account graph snapshot...")
+        snapshot_dir = GraphSnapshotService.write_snapshot()
+        self.stdout.write(self.style.SUCCESS(f"Snapshot written to {snapshot_dir}"))
@@ -1,54 +1,215 @@
 import os
-import networkx as nx
-import matplotlib
-matplotlib.use('Agg')  # Set non-interactive backend before importing pyplot
-import matplotlib.pyplot as plt
+import random
+import sys
 from django.conf import settings
+from django.core.cache import cache
 from transactions.models import Transaction
 from django.db.models import Q # Make sure Q is imported
+from privacy_vault.fields import decrypt_fields
+from qercas_project.metrics import timed
+from .snapshots import get_account_graph
+
+
+def _pyplot():
+    """
+    Imports pyplot on first use, so only processes that draw graphs load
+    matplotlib. The non-interactive backend is set before the first import.
+    """
+    if 'matplotlib.pyplot' not in sys.modules:
+        import matplotlib
+        matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    return plt
+
+
+class LayoutCache:
+    """
+    Stores the last known layout position of every account so overlapping
+    neighbourhoods are drawn in the same place between renders.
+    Positions live in the shared default cache, keyed by account id, so
+    every worker process reads the same layout. When the cache is
+    unreachable, graphs are laid out from scratch and nothing is stored.
+    """
+    KEY_PREFIX = 'gnn_layout:'
+
+    @staticmethod
+    def _key(account):
+        return f"{LayoutCache.KEY_PREFIX}{account}"
+
+    @staticmethod
+    def get_positions(accounts):
+        """Returns {account: (x, y)} for the accounts that have a stored position."""
+        keys = {LayoutCache._key(acc): acc for acc in accounts}
+        try:
+            stored = cache.get_many(list(keys))
+        except Exception as e:
+            print(f"Layout cache read failed, laying out without cached positions: {e}")
+            return {}
+        return {keys[key]: tuple(xy) for key, xy in stored.items()}
+
+    @staticmethod
+    def store_positions(pos):
+        """Persists the given {account: (x, y)} mapping."""
+        timeout = getattr(settings, 'GNN_LAYOUT_CACHE_TIMEOUT', 7 * 24 * 60 * 60)
+        try:
+            cache.set_many(
+                {LayoutCache._key(acc): [float(xy[0]), float(xy[1])] for acc, xy in pos.items()},
+                timeout=timeout,
+            )
+        except Exception as e:
+            print(f"Layout cache write failed, positions not stored: {e}")
+
 
 class GNNService:
+    @staticmethod
+    def compute_layout(G):
+        """
+        Computes a spring layout for G, warm-started from cached positions.
+        Accounts with a cached position are pinned there; new nodes start next
+        to their already placed neighbours and only they are moved. When every
+        node is cached the stored positions are returned as they are. The seed
+        makes the layout deterministic when nothing is cached yet.
+        """
+        import networkx as nx
+
+        seed = getattr(settings, 'GNN_LAYOUT_SEED', 42)
+        known = LayoutCache.get_positions(G.nodes)
+
+        if known and all(node in known for node in G):
+            return {node: known[node] for node in G}
+
+        if not known:
+            pos = nx.spring_layout(G, k=0.8, seed=seed)
+        else:
+            rng = random.Random(seed)
+            initial = dict(known)
+            for node in G.nodes:
+                if node in initial:
+                    continue
+                anchors = [known[n] for n in G.neighbors(node) if n in known]
+                if anchors:
+                    x = sum(a[0] for a in anchors) / len(anchors)
+                    y = sum(a[1] for a in anchors) / len(anchors)
+                else:
+                    x, y = rng.uniform(-1, 1), rng.uniform(-1, 1)
+                initial[node] = (x + rng.uniform(-0.1, 0.1), y + rng.uniform(-0.1, 0.1))
+
+            iterations = getattr(settings, 'GNN_LAYOUT_PARTIAL_ITERATIONS', 15)
+            pos = nx.spring_layout(
+                G, k=0.8, pos=initial, fixed=[n for n in G if n in known], iterations=iterations, seed=seed,
+            )
+
+        LayoutCache.store_positions(pos)
+        return pos
+
+    @staticmethod
+    def _related_edges(center_tx, accounts_in_tx, limit=10):
+        """
+        Returns up to `limit` (source, destination) pairs of account blind
+        indexes touching the given accounts, newest first. Reads the memory-mapped account graph when a
+        snapshot exists and falls back to querying the Transaction table.
+        """
+        graph = get_account_graph()
+        if graph.has_snapshot:
+            graph.refresh()
+            # The centre transaction is in both of its accounts' adjacency lists.
+            center_pair = tuple(sorted(accounts_in_tx))
+            center_edge = (int(center_tx.timestamp.timestamp()), float(center_tx.amount))
+            edges = [
+                (ts, acc, counterparty)
+                for acc in accounts_in_tx
+                for counterparty, amount, ts in graph.neighbors(acc)
+                if not (tuple(sorted((acc, counterparty))) == center_pair and (ts, amount) == center_edge)
+            ]
+            edges.sort(reverse=True)
+            related, seen = [], set()
+            for _ts, acc, counterparty in edges:
+                pair = (min(acc, counterparty), max(acc, counterparty))
+                if pair in seen:
+                    continue
+                seen.add(pair)
+                related.append((acc, counterparty))
+                if len(related) == limit:
+                    break
+            return related
+
+        related_txns = Transaction.objects.filter(
+            Q(source_account_index__in=accounts_in_tx) |
+            Q(destination_account_index__in=accounts_in_tx)
+        ).exclude(id=center_tx.id).order_by('-timestamp')[:limit]  # `limit` keeps the drawing readable
+        return [(tx.source_account_index, tx.destination_account_index) for tx in related_txns]
+
+    @staticmethod
+    def _account_labels(center_tx, accounts):
+        """
+        Maps account blind indexes to their plaintext numbers for drawing.
+        Only one transaction per account is decrypted.
+        """
+        labels = {
+            center_tx.source_account_index: center_tx.source_account,
+            center_tx.destination_account_index: center_tx.destination_account,
+        }
+        missing = set(accounts) - set(labels)
+        rows = Transaction.objects.filter(
+            Q(source_account_index__in=missing) | Q(destination_account_index__in=missing)
+        ).only('id', 'source_account', 'destination_account', 'source_account_index', 'destination_account_index')
+        chosen = []
+        for tx in rows.iterator():
+            if not missing:
+                break
+            if tx.source_account_index in missing or tx.destination_account_index in missing:
+                missing.difference_update((tx.source_account_index, tx.destination_account_index))
+                chosen.append(tx)
+        decrypt_fields(chosen, ['source_account', 'destination_account'])
+        for tx in chosen:
+            labels.setdefault(tx.source_account_index, tx.source_account)
+            labels.setdefault(tx.destination_account_index, tx.destination_account)
+        return {acc: labels.get(acc, acc[:8]) for acc in accounts}
+
     @staticmethod
     def analyze_and_generate_graph(transaction_id):
         """
         Finds related transactions and generates a network graph image.
         """
+        import networkx as nx
+        plt = _pyplot()
         try:
             center_tx = Transaction.objects.get(id=transaction_id)
             
             # --- THIS IS THE CORRECTED LOGIC ---
-            # 1. Get the accounts involved in our main transaction.
-            accounts_in_tx = [center_tx.source_account, center_tx.destination_account]
+            # 1. Get the accounts involved in our main transaction (by blind index).
+            accounts_in_tx = [center_tx.source_account_index, center_tx.destination_account_index]
             
-            # 2. Find all other transactions that involve EITHER of these accounts.
-            related_txns = Transaction.objects.filter(
-                Q(source_account__in=accounts_in_tx) |
-                Q(destination_account__in=accounts_in_tx)
-            ).exclude(id=transaction_id).distinct()[:10] # Limit to 10 for readability
-
-            # 3. Build the graph
-            G = nx.Graph()
+            with timed('graph_build'):
+                # 2. Find all other transactions that involve EITHER of these accounts.
+                related_edges = GNNService._related_edges(center_tx, accounts_in_tx)
+
+                # 3. Build the graph
+                G = nx.Graph()
             
-            # Add all unique accounts from all related transactions as nodes
-            all_accounts = {center_tx.source_account, center_tx.destination_account}
-            for tx in related_txns:
-                all_accounts.add(tx.source_account)
-                all_accounts.add(tx.destination_account)
+                # Add all unique accounts from all related transactions as nodes
+                all_accounts = set(accounts_in_tx)
+                for src, dst in related_edges:
+                    all_accounts.add(src)
+                    all_accounts.add(dst)
             
-            for acc in all_accounts:
-                G.add_node(acc)
+                for acc in all_accounts:
+                    G.add_node(acc)
 
-            # Add edges for the main transaction and all related ones
-            G.add_edge(center_tx.source_account, center_tx.destination_account)
-            for tx in related_txns:
-                G.add_edge(tx.source_account, tx.destination_account)
+                # Add edges for the main transaction and all related ones
+                G.add_edge(*accounts_in_tx)
+                for src, dst in related_edges:
+                    G.add_edge(src, dst)
 
             # 4. Generate and save the graph image
             # Use thread-safe figure creation
             fig, ax = plt.subplots(figsize=(10, 7))
-            pos = nx.spring_layout(G, k=0.8) # Adjust layout spacing
-            nx.draw(G, pos, with_labels=True, node_color='skyblue', node_size=2000, 
-                    edge_color='gray', font_size=10, font_weight='bold', ax=ax)
+            with timed('layout'):
+                pos = GNNService.compute_layout(G)
+            with timed('draw'):
+                labels = GNNService._account_labels(center_tx, G.nodes)
+                nx.draw(G, pos, labels=labels, with_labels=True, node_color='skyblue', node_size=2000, 
+                        edge_color='gray', font_size=10, font_weight='bold', ax=ax)
             
             graph_dir = os.path.join(settings.MEDIA_ROOT, 'gnn_graphs')
             os.makedirs(graph_dir, exist_ok=True)
@@ -57,7 +218,8 @@ class GNNService:
             graph_path = os.path.join(graph_dir, graph_filename)
             
             # Save and close properly to avoid memory leaks
-            fig.savefig(graph_path, dpi=150, bbox_inches='tight')
+            with timed('png_encode'):
+                fig.savefig(graph_path, dpi=150, bbox_inches='tight')
             plt.close(fig)  # Explicitly close the figure
             
             print(f"Successfully generated GNN graph at {graph_path}")
@@ -0,0 +1,240 @@
+import json
+import os
+import shutil
+import threading
+import uuid
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+import numpy as np
+from django.conf import settings
+from django.utils import timezone
+from transactions.models import Transaction
+
+
+class GraphSnapshotService:
+    """
+    Writes and opens compact CSR snapshots of the account graph.
+
+    A snapshot is a directory of .npy arrays:
+      accounts    sorted account blind indexes (row i of the CSR is accounts[i])
+      offsets     int64, len(accounts) + 1; row i spans offsets[i]:offsets[i+1]
+      neighbors   int32 index of the counterparty account
+      amounts     float64 transaction amount of the edge
+      timestamps  int64 unix seconds of the edge
+    plus meta.json holding the cutoff and the ids of the snapshot's
+    transactions from the replay overlap before it. Readers replay the DB from
+    the cutoff minus GNN_REPLAY_OVERLAP_SECONDS and skip those ids, so a
+    transaction that commits after the snapshot with an earlier timestamp is
+    still picked up. Each transaction is stored in both directions, like the
+    nx.Graph the GNN service draws.
+    """
+    ARRAYS = ('accounts', 'offsets', 'neighbors', 'amounts', 'timestamps')
+    CURRENT = 'CURRENT'
+
+    @staticmethod
+    def replay_overlap():
+        return timedelta(seconds=getattr(settings, 'GNN_REPLAY_OVERLAP_SECONDS', 60))
+
+    @staticmethod
+    def snapshot_root():
+        return getattr(settings, 'GNN_SNAPSHOT_DIR', os.path.join(settings.BASE_DIR, 'graph_snapshots'))
+
+    @staticmethod
+    def write_snapshot(chunk_size=10000):
+        """
+        Builds a snapshot from the Transaction table and publishes it
+        atomically. Returns the snapshot directory.
+        """
+        # Leave a small gap so rows still being inserted land in the replayed delta
+        cutoff = timezone.now() - timedelta(seconds=5)
+        overlap_start = cutoff - GraphSnapshotService.replay_overlap()
+        rows = (
+            Transaction.objects.filter(timestamp__lt=cutoff)
+            .values_list('id', 'source_account_index', 'destination_account_index', 'amount', 'timestamp')
+            .iterator(chunk_size=chunk_size)
+        )
+        sources, destinations, amounts, timestamps, recent_ids = [], [], [], [], []
+        for tx_id, src, dst, amount, ts in rows:
+            if ts >= overlap_start:
+                recent_ids.append(str(tx_id))
+            sources.append(src)
+            destinations.append(dst)
+            amounts.append(float(amount))
+            timestamps.append(int(ts.timestamp()))
+
+        n_edges = len(sources)
+        accounts, inverse = np.unique(np.array(sources + destinations, dtype=str), return_inverse=True)
+        src_idx, dst_idx = inverse[:n_edges], inverse[n_edges:]
+
+        rows_idx = np.concatenate([src_idx, dst_idx])
+        order = np.argsort(rows_idx, kind='stable')
+        neighbors = np.concatenate([dst_idx, src_idx])[order].astype(np.int32)
+        edge_amounts = np.tile(np.asarray(amounts, dtype=np.float64), 2)[order]
+        edge_timestamps = np.tile(np.asarray(timestamps, dtype=np.int64), 2)[order]
+        offsets = np.zeros(len(accounts) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows_idx, minlength=len(accounts)), out=offsets[1:])
+
+        root = GraphSnapshotService.snapshot_root()
+        os.makedirs(root, exist_ok=True)
+        name = f"snapshot-{cutoff.strftime('%Y%m%dT%H%M%S%f')}"
+        tmp_dir = os.path.join(root, f".{name}.tmp")
+        os.makedirs(tmp_dir, exist_ok=True)
+        arrays = {
+            'accounts': accounts,
+            'offsets': offsets,
+            'neighbors': neighbors,
+            'amounts': edge_amounts,
+            'timestamps': edge_timestamps,
+        }
+        for array_name, array in arrays.items():
+            np.save(os.path.join(tmp_dir, f"{array_name}.npy"), array)
+        with open(os.path.join(tmp_dir, 'meta.json'), 'w') as f:
+            json.dump({
+                'cutoff': cutoff.isoformat(),
+                'num_accounts': int(len(accounts)),
+                'num_transactions': n_edges,
+                'recent_ids': recent_ids,
+            }, f)
+
+        snapshot_dir = os.path.join(root, name)
+        os.replace(tmp_dir, snapshot_dir)
+        pointer_tmp = os.path.join(root, f".{GraphSnapshotService.CURRENT}.tmp")
+        with open(pointer_tmp, 'w') as f:
+            f.write(name)
+        os.replace(pointer_tmp, os.path.join(root, GraphSnapshotService.CURRENT))
+
+        GraphSnapshotService._prune(root, keep=name)
+        print(f"Wrote graph snapshot {snapshot_dir} ({len(accounts)} accounts, {n_edges} transactions)")
+        return snapshot_dir
+
+    @staticmethod
+    def _prune(root, keep):
+        """Removes older snapshots, keeping the newest few for readers that still map them."""
+        retain = getattr(settings, 'GNN_SNAPSHOTS_RETAINED', 2)
+        snapshots = sorted(d for d in os.listdir(root) if d.startswith('snapshot-') and d != keep)
+        for old in snapshots[:max(len(snapshots) - (retain - 1), 0)]:
+            shutil.rmtree(os.path.join(root, old), ignore_errors=True)
+
+    @staticmethod
+    def open_snapshot():
+        """
+        Memory-maps the current snapshot. Returns (arrays, meta), or None when
+        no snapshot has been written yet.
+        """
+        root = GraphSnapshotService.snapshot_root()
+        try:
+            with open(os.path.join(root, GraphSnapshotService.CURRENT)) as f:
+                snapshot_dir = os.path.join(root, f.read().strip())
+            with open(os.path.join(snapshot_dir, 'meta.json')) as f:
+                meta = json.load(f)
+        except FileNotFoundError:
+            return None
+        meta['name'] = os.path.basename(snapshot_dir)
+        arrays = {
+            name: np.load(os.path.join(snapshot_dir, f"{name}.npy"), mmap_mode='r')
+            for name in GraphSnapshotService.ARRAYS
+        }
+        return arrays, meta
+
+
+class AccountGraph:
+    """
+    Account adjacency backed by a memory-mapped snapshot plus the transactions
+    replayed from the DB since its cutoff. Transaction ids are random UUIDs,
+    so replay goes by timestamp and re-reads the overlap window before the
+    newest replayed timestamp, skipping ids it has already seen.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._open()
+
+    def _open(self):
+        self._arrays = None
+        self._snapshot_name = None
+        self._delta = defaultdict(list)
+        self._replayed_until = None
+        self._recent = {}  # id -> timestamp of transactions already in the graph, within the overlap
+        opened = GraphSnapshotService.open_snapshot()
+        if opened is not None:
+            self._arrays, meta = opened
+            self._snapshot_name = meta['name']
+            self._replayed_until = datetime.fromisoformat(meta['cutoff'])
+            self._recent = {uuid.UUID(pk): self._replayed_until for pk in meta.get('recent_ids', ())}
+
+    def _current_snapshot_name(self):
+        try:
+            with open(os.path.join(GraphSnapshotService.snapshot_root(), GraphSnapshotService.CURRENT)) as f:
+                return f.read().strip()
+        except FileNotFoundError:
+            return None
+
+    @property
+    def has_snapshot(self):
+        return self._arrays is not None
+
+    def refresh(self):
+        """
+        Replays transactions committed since the last refresh, switching to a
+        newer snapshot first if one has been published. A transaction whose
+        commit lags its timestamp by more than GNN_REPLAY_OVERLAP_SECONDS is
+        missed until the next snapshot.
+        """
+        with self._lock:
+            if self._current_snapshot_name() != self._snapshot_name:
+                self._open()
+            overlap = GraphSnapshotService.replay_overlap()
+            qs = Transaction.objects.all()
+            if self._replayed_until is not None:
+                qs = qs.filter(timestamp__gte=self._replayed_until - overlap)
+            rows = qs.order_by('timestamp').values_list(
+                'id', 'source_account_index', 'destination_account_index', 'amount', 'timestamp'
+            )
+            for tx_id, src, dst, amount, ts in rows.iterator():
+                if tx_id in self._recent:
+                    continue
+                edge_ts = int(ts.timestamp())
+                self._delta[src].append((dst, float(amount), edge_ts))
+                self._delta[dst].append((src, float(amount), edge_ts))
+                self._recent[tx_id] = ts
+                if self._replayed_until is None or ts > self._replayed_until:
+                    self._replayed_until = ts
+            if self._replayed_until is not None:
+                horizon = self._replayed_until - overlap
+                self._recent = {tx_id: ts for tx_id, ts in self._recent.items() if ts >= horizon}
+
+    def _snapshot_neighbors(self, account):
+        accounts = self._arrays['accounts']
+        i = int(np.searchsorted(accounts, account))
+        if i >= len(accounts) or accounts[i] != account:
+            return []
+        start, end = int(self._arrays['offsets'][i]), int(self._arrays['offsets'][i + 1])
+        neighbors = self._arrays['neighbors'][start:end]
+        amounts = self._arrays['amounts'][start:end]
+        timestamps = self._arrays['timestamps'][start:end]
+        return [
+            (str(accounts[n]), float(a), int(t))
+            for n, a, t in zip(neighbors, amounts, timestamps)
+        ]
+
+    def neighbors(self, account):
+        """Returns [(counterparty, amount, unix_timestamp), ...] for an account."""
+        edges = self._snapshot_neighbors(account) if self.has_snapshot else []
+        with self._lock:
+            edges.extend(self._delta.get(account, ()))
+        return edges
+
+
+_account_graph = None
+_account_graph_lock = threading.Lock()
+
+
+def get_account_graph():
+    """Returns the process-wide AccountGraph, opening the snapshot on first use."""
+    global _account_graph
+    if _account_graph is None:
+        with _account_graph_lock:
+            if _account_graph is None:
+                _account_graph = AccountGraph()
+    return _account_graph
@@ -0,0 +1,18 @@
+from celery import shared_task
+from gnn_analyzer.snapshots import GraphSnapshotService
+
+@shared_task(name="gnn_analyzer.tasks.write_graph_snapshot")
+def write_graph_snapshot():
+    """Celery task to write a fresh memory-mappable snapshot of the account graph"""
+    try:
+        snapshot_dir = GraphSnapshotService.write_snapshot()
+        return {
+            'status': 'success',
+            'snapshot_dir': snapshot_dir,
+        }
+    except Exception as e:
+        return {
+            'status': 'error',
+            'error': str(e),
+            'message': 'Graph snapshot failed'
+        }
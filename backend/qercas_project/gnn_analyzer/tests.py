@@ -1,3 +1,190 @@
-from django.test import TestCase
+import base64
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+import networkx as nx
+from django.core.cache import cache
+from django.core.cache.backends.base import BaseCache
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from privacy_vault.keystore import KeyStore
+from transactions.models import Transaction
+
+from . import snapshots
+from .services import GNNService, LayoutCache
+from .snapshots import GraphSnapshotService, get_account_graph
+
+LOCMEM_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+UNREACHABLE_CACHE = {'default': {'BACKEND': 'gnn_analyzer.tests.UnreachableCache'}}
+VAULT_KEY = base64.b64encode(bytes(range(32))).decode()
+
+
+class UnreachableCache(BaseCache):
+    """A cache backend whose server is down."""
+
+    def __init__(self, location, params):
+        super().__init__(params)
+
+    def get(self, *args, **kwargs):
+        raise ConnectionError('cache server unreachable')
+
+    set = get_many = set_many = delete = clear = get
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class LayoutCacheTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_first_layout_is_deterministic_and_cached(self):
+        G = nx.path_graph(['a', 'b', 'c'])
+        first = GNNService.compute_layout(G)
+        cache.clear()
+        second = GNNService.compute_layout(G)
+
+        for node in G:
+            self.assertAlmostEqual(first[node][0], second[node][0])
+            self.assertAlmostEqual(first[node][1], second[node][1])
+        self.assertEqual(set(LayoutCache.get_positions(G.nodes)), {'a', 'b', 'c'})
+
+    def test_cached_nodes_stay_pinned_when_new_nodes_arrive(self):
+        G = nx.path_graph(['a', 'b', 'c'])
+        before = GNNService.compute_layout(G)
+        G.add_edge('c', 'd')
+
+        after = GNNService.compute_layout(G)
+
+        for node in 'abc':
+            self.assertAlmostEqual(float(after[node][0]), before[node][0])
+            self.assertAlmostEqual(float(after[node][1]), before[node][1])
+        self.assertIn('d', LayoutCache.get_positions(['d']))
+
+    def test_fully_cached_graph_is_not_laid_out_again(self):
+        G = nx.path_graph(['a', 'b'])
+        LayoutCache.store_positions({'a': (0.5, -0.5), 'b': (-1.0, 1.0)})
+
+        with mock.patch('networkx.spring_layout') as spring_layout:
+            pos = GNNService.compute_layout(G)
+
+        spring_layout.assert_not_called()
+        self.assertEqual(pos, {'a': (0.5, -0.5), 'b': (-1.0, 1.0)})
+
+    def test_unreachable_cache_lays_the_graph_out_uncached(self):
+        G = nx.path_graph(['a', 'b', 'c'])
+        with override_settings(CACHES=UNREACHABLE_CACHE):
+            pos = GNNService.compute_layout(G)
+
+        self.assertEqual(set(pos), {'a', 'b', 'c'})
+        self.assertEqual(LayoutCache.get_positions(G.nodes), {})
+
+
+@override_settings(PRIVACY_VAULT_MASTER_KEY=VAULT_KEY)
+class GraphSnapshotTests(TestCase):
+    def setUp(self):
+        KeyStore._current = None
+        KeyStore._keys.clear()
+        self.snapshot_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.snapshot_dir, ignore_errors=True)
+        settings_override = override_settings(GNN_SNAPSHOT_DIR=self.snapshot_dir, GNN_SNAPSHOTS_RETAINED=2)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        snapshots._account_graph = None
+        self.addCleanup(setattr, snapshots, '_account_graph', None)
+        self.count = 0
+        self.transactions = {}  # destination account -> its blind index
+
+    def transfer(self, source, destination, amount, minutes_ago=60):
+        self.count += 1
+        tx = Transaction.objects.create(
+            transaction_id_str=f"TX-{self.count}", amount=amount, currency='EUR',
+            client_name='Client', source_account=source, destination_account=destination,
+        )
+        Transaction.objects.filter(pk=tx.pk).update(timestamp=timezone.now() - timedelta(minutes=minutes_ago))
+        tx.refresh_from_db()
+        self.transactions[destination] = tx.destination_account_index
+        return tx
+
+    def test_no_snapshot_until_one_is_written(self):
+        self.assertIsNone(GraphSnapshotService.open_snapshot())
+        self.assertFalse(get_account_graph().has_snapshot)
+
+    def test_snapshot_stores_each_transaction_in_both_directions(self):
+        tx = self.transfer('A', 'B', 25)
+        GraphSnapshotService.write_snapshot()
+        graph = get_account_graph()
+
+        edge_ts = int(tx.timestamp.timestamp())
+        self.assertEqual(graph.neighbors(tx.source_account_index), [(tx.destination_account_index, 25.0, edge_ts)])
+        self.assertEqual(graph.neighbors(tx.destination_account_index), [(tx.source_account_index, 25.0, edge_ts)])
+
+    def test_refresh_replays_transactions_after_the_cutoff(self):
+        old = self.transfer('A', 'B', 10)
+        GraphSnapshotService.write_snapshot()
+        graph = get_account_graph()
+        new = self.transfer('A', 'C', 20, minutes_ago=0)
+
+        graph.refresh()
+        graph.refresh()  # replaying twice must not duplicate edges
+
+        counterparties = sorted(n for n, _, _ in graph.neighbors(old.source_account_index))
+        self.assertEqual(counterparties, sorted([old.destination_account_index, new.destination_account_index]))
+
+    def test_refresh_picks_up_transactions_that_commit_late(self):
+        in_snapshot = self.transfer('A', 'B', 10, minutes_ago=0.25)
+        GraphSnapshotService.write_snapshot()
+        graph = get_account_graph()
+        self.transfer('A', 'C', 20, minutes_ago=0)
+        graph.refresh()
+        late = self.transfer('A', 'D', 30, minutes_ago=0.5)  # timestamped before the snapshot's cutoff
+
+        graph.refresh()
+        graph.refresh()
+
+        counterparties = sorted(n for n, _, _ in graph.neighbors(in_snapshot.source_account_index))
+        self.assertEqual(counterparties, sorted([
+            in_snapshot.destination_account_index, self.transactions['C'], late.destination_account_index]))
+
+    def test_db_fallback_returns_the_newest_related_transactions(self):
+        center = self.transfer('A', 'B', 8, minutes_ago=1)
+        for minutes_ago, counterparty in ((50, 'C'), (10, 'D'), (30, 'E'), (20, 'F')):
+            self.transfer('A', counterparty, 1, minutes_ago=minutes_ago)
+
+        accounts = [center.source_account_index, center.destination_account_index]
+        edges = GNNService._related_edges(center, accounts, limit=2)
+
+        self.assertEqual([dst for _, dst in edges], [self.transactions['D'], self.transactions['F']])
+
+    def test_related_edges_skip_the_centre_transaction_and_repeated_pairs(self):
+        self.transfer('A', 'B', 5, minutes_ago=90)
+        self.transfer('B', 'A', 6, minutes_ago=80)
+        other = self.transfer('A', 'C', 7, minutes_ago=70)
+        center = self.transfer('A', 'B', 8, minutes_ago=60)
+        GraphSnapshotService.write_snapshot()
+
+        accounts = [center.source_account_index, center.destination_account_index]
+        edges = GNNService._related_edges(center, accounts)
+
+        pairs = [frozenset(edge) for edge in edges]
+        self.assertEqual(len(pairs), len(set(pairs)))
+        self.assertEqual(set(pairs), {frozenset(accounts), frozenset(
+            (other.source_account_index, other.destination_account_index))})
+        self.assertEqual(len(GNNService._related_edges(center, accounts, limit=1)), 1)
+
+    def test_centre_transaction_alone_has_no_related_edges(self):
+        center = self.transfer('A', 'B', 8)
+        GraphSnapshotService.write_snapshot()
+
+        accounts = [center.source_account_index, center.destination_account_index]
+        self.assertEqual(GNNService._related_edges(center, accounts), [])
+
+    def test_older_snapshots_are_pruned(self):
+        self.transfer('A', 'B', 1)
+        for _ in range(3):
+            GraphSnapshotService.write_snapshot()
+
+        written = [d for d in os.listdir(self.snapshot_dir) if d.startswith('snapshot-')]
+        self.assertEqual(len(written), 2)
+        self.assertIsNotNone(GraphSnapshotService.open_snapshot())
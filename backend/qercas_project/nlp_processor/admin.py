@@ -1,3 +1,5 @@
 from django.contrib import admin
+from .models import RegulatoryDocument, RegulatoryPassage
 
-# Register your models here.
+admin.site.register(RegulatoryDocument)
+admin.site.register(RegulatoryPassage)
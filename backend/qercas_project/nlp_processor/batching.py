@@ -0,0 +1,136 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+
+from django.conf import settings
+
+
+class _PendingQuestion:
+    __slots__ = ('question', 'contexts', 'future')
+
+    def __init__(self, question, contexts):
+        self.question = question
+        self.contexts = contexts
+        self.future = Future()
+
+
+class QABatcher:
+    """
+    Collects questions that arrive within a short window and runs all of
+    their (question, passage) pairs through the QA model as one padded batch.
+    Callers block on a Future that resolves to their own list of results.
+
+    A batch is sent as soon as it holds `max_batch_size` pairs or the first
+    request in it has waited `max_wait_ms`.
+    """
+
+    def __init__(self, max_batch_size=16, max_wait_ms=10, runner=None):
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._runner = runner or self._run_pipeline
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._worker = None
+        self._worker_pid = None
+
+    @staticmethod
+    def _run_pipeline(inputs):
+        from .services import QAModelLoader
+        qa_pipeline = QAModelLoader.get_pipeline()
+        results = qa_pipeline(
+            question=[i["question"] for i in inputs],
+            context=[i["context"] for i in inputs],
+            batch_size=len(inputs),
+            **QAModelLoader.call_kwargs(),
+        )
+        return [results] if isinstance(results, dict) else list(results)
+
+    def _ensure_worker(self):
+        # Threads do not survive fork, so prefork children start their own
+        if self._worker is None or self._worker_pid != os.getpid():
+            with self._lock:
+                if self._worker is None or self._worker_pid != os.getpid():
+                    self._queue = queue.Queue()
+                    self._worker = threading.Thread(target=self._loop, name='qa-batcher', daemon=True)
+                    self._worker_pid = os.getpid()
+                    self._worker.start()
+
+    def submit(self, question, contexts):
+        """Queues a question over the given passages and returns a Future."""
+        self._ensure_worker()
+        pending = _PendingQuestion(question, list(contexts))
+        self._queue.put(pending)
+        return pending.future
+
+    def answer(self, question, contexts, timeout=None):
+        """
+        Blocking helper: returns the QA results for each context. Raises
+        TimeoutError after `timeout` seconds; a question still waiting in the
+        queue is then dropped instead of being run for nobody.
+        """
+        future = self.submit(question, contexts)
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            raise TimeoutError(f"No QA result within {timeout}s") from None
+
+    def _collect(self):
+        pending = self._queue.get()
+        while not pending.future.set_running_or_notify_cancel():
+            pending = self._queue.get()  # its caller timed out while it was queued
+        batch = [pending]
+        pairs = len(pending.contexts)
+        deadline = time.monotonic() + self.max_wait
+        while pairs < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                pending = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if not pending.future.set_running_or_notify_cancel():
+                continue
+            batch.append(pending)
+            pairs += len(pending.contexts)
+        return batch
+
+    def _loop(self):
+        while True:
+            batch = self._collect()
+            inputs = [
+                {"question": pending.question, "context": context}
+                for pending in batch
+                for context in pending.contexts
+            ]
+            try:
+                results = self._runner(inputs) if inputs else []
+            except Exception as e:
+                for pending in batch:
+                    pending.future.set_exception(e)
+                continue
+            offset = 0
+            for pending in batch:
+                count = len(pending.contexts)
+                pending.future.set_result(results[offset:offset + count])
+                offset += count
+
+
+_qa_batcher = None
+_qa_batcher_lock = threading.Lock()
+
+
+def get_qa_batcher():
+    """Returns the process-wide QABatcher configured from settings."""
+    global _qa_batcher
+    if _qa_batcher is None:
+        with _qa_batcher_lock:
+            if _qa_batcher is None:
+                _qa_batcher = QABatcher(
+                    max_batch_size=getattr(settings, 'NLP_BATCH_MAX_SIZE', 16),
+                    max_wait_ms=getattr(settings, 'NLP_BATCH_MAX_WAIT_MS', 10),
+                )
+    return _qa_batcher
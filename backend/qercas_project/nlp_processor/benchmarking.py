@@ -0,0 +1,37 @@
+import re
+from collections import Counter
+
+import numpy as np
+
+# Fixed question set used by the QA benchmarks and the quantization guardrail
+QUESTIONS = [
+    "What is the reporting threshold for crypto transactions?",
+    "Within how many hours must a transaction be reported?",
+    "What is the Travel Rule?",
+    "Who must CASPs report transactions to?",
+    "When did MiCA become effective?",
+    "What must firms detect for internal fraud monitoring?",
+    "Which providers does MiCA apply to?",
+    "What information must cross-border crypto-asset transfers include?",
+]
+
+
+def latency_summary(latencies_ms) -> dict:
+    p50, p95, p99 = np.percentile(np.asarray(latencies_ms), [50, 95, 99])
+    return {"p50": float(p50), "p95": float(p95), "p99": float(p99)}
+
+
+def _answer_tokens(answer):
+    return re.findall(r"\w+", answer.lower())
+
+
+def token_f1(a: str, b: str) -> float:
+    """SQuAD-style token overlap F1 between two answers."""
+    a_tokens, b_tokens = _answer_tokens(a), _answer_tokens(b)
+    if not a_tokens or not b_tokens:
+        return float(a_tokens == b_tokens)
+    common = sum((Counter(a_tokens) & Counter(b_tokens)).values())
+    if common == 0:
+        return 0.0
+    precision, recall = common / len(a_tokens), common / len(b_tokens)
+    return 2 * precision * recall / (precision + recall)
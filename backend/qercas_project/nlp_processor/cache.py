@@ -0,0 +1,112 @@
+import hashlib
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+
+_WHITESPACE_RE = re.compile(r"\s+")
+_TRAILING_PUNCT_RE = re.compile(r"[\s?!.]+$")
+
+
+def normalize_question(question: str) -> str:
+    """Folds case, unicode forms, whitespace and trailing punctuation."""
+    text = unicodedata.normalize('NFKC', question).casefold()
+    text = _WHITESPACE_RE.sub(' ', text).strip()
+    return _TRAILING_PUNCT_RE.sub('', text)
+
+
+class AnswerCache:
+    """
+    Two-tier cache of answers keyed by normalized question and a version
+    string covering the corpus and the model. A bounded in-process LRU sits in
+    front of a shared Django cache; bumping the version (new documents, new
+    model) makes every older entry unreachable, so nothing stale is served.
+    When the shared cache is unreachable, only the local tier is used.
+    """
+
+    def __init__(self, max_entries=1024, timeout=24 * 60 * 60, alias='default'):
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self.alias = alias
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'local_hits': 0, 'shared_hits': 0, 'misses': 0, 'shared_errors': 0}
+
+    @staticmethod
+    def _key(question, version):
+        digest = hashlib.sha256(f"{version}\x00{normalize_question(question)}".encode('utf-8')).hexdigest()
+        return f"nlp_answer:{digest}"
+
+    def get(self, question, version):
+        """Returns the cached answer, or None."""
+        key = self._key(question, version)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self._stats['local_hits'] += 1
+                return self._entries[key]
+        try:
+            answer = caches[self.alias].get(key)
+        except Exception as e:
+            self._shared_error('read', e)
+            answer = None
+        with self._lock:
+            if answer is None:
+                self._stats['misses'] += 1
+                return None
+            self._stats['shared_hits'] += 1
+            self._remember(key, answer)
+        return answer
+
+    def set(self, question, version, answer):
+        key = self._key(question, version)
+        try:
+            caches[self.alias].set(key, answer, timeout=self.timeout)
+        except Exception as e:
+            self._shared_error('write', e)
+        with self._lock:
+            self._remember(key, answer)
+
+    def _shared_error(self, operation, error):
+        with self._lock:
+            self._stats['shared_errors'] += 1
+        print(f"Answer cache {operation} failed on '{self.alias}', using the local tier only: {error}")
+
+    def _remember(self, key, answer):
+        self._entries[key] = answer
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear_local(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats['local_entries'] = len(self._entries)
+        lookups = stats['local_hits'] + stats['shared_hits'] + stats['misses']
+        stats['hit_rate'] = (stats['local_hits'] + stats['shared_hits']) / lookups if lookups else 0.0
+        return stats
+
+
+_answer_cache = None
+_answer_cache_lock = threading.Lock()
+
+
+def get_answer_cache():
+    """Returns the process-wide AnswerCache configured from settings."""
+    global _answer_cache
+    if _answer_cache is None:
+        with _answer_cache_lock:
+            if _answer_cache is None:
+                _answer_cache = AnswerCache(
+                    max_entries=getattr(settings, 'NLP_ANSWER_CACHE_SIZE', 1024),
+                    timeout=getattr(settings, 'NLP_ANSWER_CACHE_TIMEOUT', 24 * 60 * 60),
+                    alias=getattr(settings, 'NLP_ANSWER_CACHE_ALIAS', 'default'),
+                )
+    return _answer_cache
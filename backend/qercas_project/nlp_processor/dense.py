@@ -0,0 +1,380 @@
+import json
+import os
+import shutil
+import threading
+
+import numpy as np
+from django.conf import settings
+from .models import RegulatoryPassage
+from .retrieval import writer_lock
+
+
+class EmbeddingModelLoader:
+    """
+    Process-wide holder for the sentence embedding model. Like the QA model it
+    is only imported and loaded on first use, and never when NLP_ENABLED is off.
+    """
+    _model = None
+    _tokenizer = None
+    _lock = threading.Lock()
+
+    @classmethod
+    def get(cls):
+        if cls._model is None:
+            if not getattr(settings, 'NLP_ENABLED', True):
+                raise RuntimeError("NLP is disabled for this deployment.")
+            with cls._lock:
+                if cls._model is None:
+                    from transformers import AutoModel, AutoTokenizer
+                    model_name = getattr(settings, 'NLP_EMBEDDING_MODEL', 'sentence-transformers/all-MiniLM-L6-v2')
+                    print(f"Loading embedding model: {model_name}")
+                    cls._tokenizer = AutoTokenizer.from_pretrained(model_name)
+                    model = AutoModel.from_pretrained(model_name)
+                    model.eval()
+                    cls._model = model
+        return cls._tokenizer, cls._model
+
+    @classmethod
+    def embed(cls, texts, batch_size=32):
+        """Returns L2-normalised, mean-pooled float32 embeddings for texts."""
+        import torch
+        tokenizer, model = cls.get()
+        batches = []
+        with torch.inference_mode():
+            for start in range(0, len(texts), batch_size):
+                encoded = tokenizer(
+                    texts[start:start + batch_size], padding=True, truncation=True,
+                    max_length=256, return_tensors='pt',
+                )
+                hidden = model(**encoded).last_hidden_state
+                mask = encoded['attention_mask'].unsqueeze(-1).to(hidden.dtype)
+                pooled = (hidden * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1)
+                batches.append(torch.nn.functional.normalize(pooled, dim=1).numpy())
+        if not batches:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.concatenate(batches).astype(np.float32)
+
+
+def _quantize(embeddings, dtype):
+    """Returns (matrix, scales) for float32 embeddings; scales is None for float16."""
+    if dtype == 'int8':
+        scales = np.abs(embeddings).max(axis=1) / 127.0 if len(embeddings) else np.zeros(0)
+        scales[scales == 0] = 1.0
+        return np.round(embeddings / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+    return embeddings.astype(np.float16), None
+
+
+class DenseIndex:
+    """
+    Passage embeddings stored as a memory-mapped float16 or int8 matrix, so
+    every worker process shares the same pages instead of loading a copy.
+
+    Files in an index directory:
+      embeddings.npy   (n, dim) float16, or int8 with per-row scales.npy
+      passage_ids.npy  int64 RegulatoryPassage primary key of each row
+      centroids.npy    optional IVF centroids; rows are then grouped by list
+      list_offsets.npy optional, rows of list c span list_offsets[c]:list_offsets[c+1]
+      delta_*.npy      optional rows appended since the last full build,
+                       always searched brute force
+    meta.json also lists passage ids deleted since the last full build.
+    """
+    BLOCK_ROWS = 65536
+    MAIN_FILES = ('embeddings.npy', 'passage_ids.npy', 'scales.npy', 'centroids.npy', 'list_offsets.npy')
+
+    def __init__(self, index_dir):
+        self.index_dir = index_dir
+        with open(os.path.join(index_dir, 'meta.json')) as f:
+            self.meta = json.load(f)
+        int8 = self.meta['dtype'] == 'int8'
+        self.embeddings = self._map('embeddings.npy')
+        self.passage_ids = self._map('passage_ids.npy')
+        self.scales = self._map('scales.npy') if int8 else None
+        self.centroids = None
+        self.list_offsets = None
+        if self.meta.get('ivf_lists'):
+            self.centroids = np.load(os.path.join(index_dir, 'centroids.npy'))
+            self.list_offsets = np.load(os.path.join(index_dir, 'list_offsets.npy'))
+        self.delta_embeddings = self.delta_passage_ids = self.delta_scales = None
+        if self.meta.get('delta_count'):
+            self.delta_embeddings = self._map('delta_embeddings.npy')
+            self.delta_passage_ids = self._map('delta_passage_ids.npy')
+            self.delta_scales = self._map('delta_scales.npy') if int8 else None
+        self.deleted_ids = np.asarray(self.meta.get('deleted', []), dtype=np.int64)
+        # Tombstones may name passages that never reached the index (a failed ingest)
+        self._live_count = int(len(self.passage_ids) + self.meta.get('delta_count', 0) - sum(
+            np.isin(ids, self.deleted_ids).sum() for ids in (self.passage_ids, self.delta_passage_ids)
+            if ids is not None
+        ))
+
+    def _map(self, name):
+        return np.load(os.path.join(self.index_dir, name), mmap_mode='r')
+
+    def __len__(self):
+        return self._live_count
+
+    @classmethod
+    def _score_rows(cls, matrix, scales, start, end, query):
+        """Dot products of rows start:end with the query, a block at a time."""
+        scores = np.empty(end - start, dtype=np.float32)
+        for block in range(start, end, cls.BLOCK_ROWS):
+            stop = min(block + cls.BLOCK_ROWS, end)
+            scores[block - start:stop - start] = matrix[block:stop].astype(np.float32) @ query
+            if scales is not None:
+                scores[block - start:stop - start] *= scales[block:stop]
+        return scores
+
+    def search_vector(self, query, k=5, nprobe=None):
+        """Returns [(passage_id, score), ...] for the k nearest passages."""
+        if len(self) <= 0:
+            return []
+        if self.centroids is None:
+            ranges = [(0, len(self.passage_ids))]
+        else:
+            nprobe = min(nprobe or getattr(settings, 'NLP_DENSE_IVF_NPROBE', 8), len(self.centroids))
+            lists = np.argpartition(-(self.centroids @ query), nprobe - 1)[:nprobe]
+            ranges = [(int(self.list_offsets[c]), int(self.list_offsets[c + 1])) for c in lists]
+
+        ids = [np.asarray(self.passage_ids[s:e]) for s, e in ranges]
+        scores = [self._score_rows(self.embeddings, self.scales, s, e, query) for s, e in ranges]
+        if self.delta_embeddings is not None:
+            ids.append(np.asarray(self.delta_passage_ids))
+            scores.append(self._score_rows(
+                self.delta_embeddings, self.delta_scales, 0, len(self.delta_passage_ids), query,
+            ))
+        ids, scores = np.concatenate(ids), np.concatenate(scores)
+        if len(self.deleted_ids):
+            live = ~np.isin(ids, self.deleted_ids)
+            ids, scores = ids[live], scores[live]
+        if not len(ids):
+            return []
+        k = min(k, len(ids))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(ids[i]), float(scores[i])) for i in top]
+
+    def search(self, question, k=5):
+        query = EmbeddingModelLoader.embed([question])[0]
+        return self.search_vector(query, k)
+
+    def vectors(self):
+        """
+        Returns (passage_ids, float32 embeddings) for every live row,
+        dequantized, so the index can be compacted without re-embedding.
+        """
+        parts = [(self.passage_ids, self.embeddings, self.scales)]
+        if self.delta_embeddings is not None:
+            parts.append((self.delta_passage_ids, self.delta_embeddings, self.delta_scales))
+        # An index built from no passages has no dimension yet
+        parts = [p for p in parts if len(p[0])] or parts[:1]
+        ids = np.concatenate([np.asarray(p[0]) for p in parts])
+        vectors = np.concatenate([
+            np.asarray(m, dtype=np.float32) * (np.asarray(sc)[:, None] if sc is not None else 1.0)
+            for _, m, sc in parts
+        ])
+        live = ~np.isin(ids, self.deleted_ids)
+        return ids[live], vectors[live]
+
+    @staticmethod
+    def build(index_dir, passage_ids, embeddings, dtype='float16', ivf_lists=0):
+        """
+        Writes an index for the given float32 embeddings. With ivf_lists > 0
+        rows are clustered with k-means and stored grouped by cluster.
+        """
+        os.makedirs(index_dir, exist_ok=True)
+        passage_ids = np.asarray(passage_ids, dtype=np.int64)
+        if ivf_lists and len(embeddings) > ivf_lists:
+            from sklearn.cluster import MiniBatchKMeans
+            kmeans = MiniBatchKMeans(n_clusters=ivf_lists, random_state=0, n_init=3)
+            kmeans.fit(embeddings[:min(len(embeddings), ivf_lists * 256)])
+            labels = kmeans.predict(embeddings)
+            order = np.argsort(labels, kind='stable')
+            embeddings, passage_ids = embeddings[order], passage_ids[order]
+            centroids = kmeans.cluster_centers_.astype(np.float32)
+            list_offsets = np.zeros(ivf_lists + 1, dtype=np.int64)
+            np.cumsum(np.bincount(labels, minlength=ivf_lists), out=list_offsets[1:])
+            np.save(os.path.join(index_dir, 'centroids.npy'), centroids)
+            np.save(os.path.join(index_dir, 'list_offsets.npy'), list_offsets)
+        else:
+            ivf_lists = 0
+
+        matrix, scales = _quantize(embeddings, dtype)
+        if scales is not None:
+            np.save(os.path.join(index_dir, 'scales.npy'), scales)
+        np.save(os.path.join(index_dir, 'embeddings.npy'), matrix)
+        np.save(os.path.join(index_dir, 'passage_ids.npy'), passage_ids)
+        with open(os.path.join(index_dir, 'meta.json'), 'w') as f:
+            json.dump({
+                'dtype': dtype,
+                'dim': int(matrix.shape[1]) if matrix.ndim == 2 else 0,
+                'count': int(len(passage_ids)),
+                'ivf_lists': int(ivf_lists),
+                'delta_count': 0,
+                'deleted': [],
+            }, f)
+
+    def extend(self, index_dir, passage_ids, embeddings, deleted_ids=()):
+        """
+        Writes a copy of this index to index_dir with the given rows appended
+        to the delta and deleted_ids tombstoned. The large main files are
+        hard-linked rather than copied where the filesystem allows it.
+        """
+        os.makedirs(index_dir, exist_ok=True)
+        for name in self.MAIN_FILES:
+            src = os.path.join(self.index_dir, name)
+            if os.path.exists(src):
+                try:
+                    os.link(src, os.path.join(index_dir, name))
+                except OSError:
+                    shutil.copyfile(src, os.path.join(index_dir, name))
+
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        if not len(embeddings):
+            embeddings = np.zeros((0, self.meta['dim']), dtype=np.float32)
+        matrix, scales = _quantize(embeddings, self.meta['dtype'])
+        passage_ids = np.asarray(passage_ids, dtype=np.int64)
+        if self.delta_embeddings is not None:
+            matrix = np.concatenate([np.asarray(self.delta_embeddings), matrix])
+            passage_ids = np.concatenate([np.asarray(self.delta_passage_ids), passage_ids])
+            if scales is not None:
+                scales = np.concatenate([np.asarray(self.delta_scales), scales])
+        np.save(os.path.join(index_dir, 'delta_embeddings.npy'), matrix)
+        np.save(os.path.join(index_dir, 'delta_passage_ids.npy'), passage_ids)
+        if scales is not None:
+            np.save(os.path.join(index_dir, 'delta_scales.npy'), scales)
+
+        meta = dict(self.meta)
+        meta['delta_count'] = int(len(passage_ids))
+        meta['deleted'] = sorted(set(meta.get('deleted', [])) | set(int(i) for i in deleted_ids))
+        with open(os.path.join(index_dir, 'meta.json'), 'w') as f:
+            json.dump(meta, f)
+
+
+class DenseRetrievalIndex:
+    """
+    Process-wide holder for the published DenseIndex. Builds are written to a
+    new directory and switched to through a pointer file, so readers that
+    still map the previous index are never disturbed.
+    """
+    POINTER = 'DENSE_CURRENT'
+    _index = None
+    _name = None
+    _lock = threading.Lock()
+
+    @staticmethod
+    def root():
+        return getattr(settings, 'NLP_INDEX_DIR', os.path.join(settings.BASE_DIR, 'nlp_index'))
+
+    @classmethod
+    def _current_name(cls):
+        try:
+            with open(os.path.join(cls.root(), cls.POINTER)) as f:
+                return f.read().strip()
+        except FileNotFoundError:
+            return None
+
+    @classmethod
+    def version(cls):
+        return cls._current_name() or ''
+
+    @classmethod
+    def get(cls):
+        """Returns the current DenseIndex, or None when none has been built."""
+        name = cls._current_name()
+        if name is None:
+            return None
+        if name != cls._name:
+            with cls._lock:
+                if name != cls._name:
+                    cls._index = DenseIndex(os.path.join(cls.root(), name))
+                    cls._name = name
+        return cls._index
+
+    @staticmethod
+    def _embed_passages(rows, batch_size=64):
+        """Embeds an iterable of (passage_id, text) pairs in batches."""
+        passage_ids, embeddings = [], []
+        batch_ids, batch_texts = [], []
+        for passage_id, text in rows:
+            batch_ids.append(passage_id)
+            batch_texts.append(text)
+            if len(batch_texts) == batch_size:
+                embeddings.append(EmbeddingModelLoader.embed(batch_texts, batch_size))
+                passage_ids.extend(batch_ids)
+                batch_ids, batch_texts = [], []
+        if batch_texts:
+            embeddings.append(EmbeddingModelLoader.embed(batch_texts, batch_size))
+            passage_ids.extend(batch_ids)
+        matrix = np.concatenate(embeddings) if embeddings else np.zeros((0, 0), dtype=np.float32)
+        return passage_ids, matrix
+
+    @staticmethod
+    def _build_number(name):
+        try:
+            return int(name[len('dense-'):])
+        except ValueError:
+            return 0  # named before builds were numbered
+
+    @classmethod
+    def _publish(cls, write):
+        """
+        Writes a new build with write(index_dir) and points readers at it.
+        Callers hold the writer lock, so build numbers only ever grow.
+        """
+        root = cls.root()
+        builds = [d for d in os.listdir(root) if d.startswith('dense-')] if os.path.isdir(root) else []
+        name = f"dense-{max(map(cls._build_number, builds), default=0) + 1:06d}"
+        previous = cls._current_name()
+        write(os.path.join(root, name))
+        pointer_tmp = os.path.join(root, f".{cls.POINTER}.tmp")
+        with open(pointer_tmp, 'w') as f:
+            f.write(name)
+        os.replace(pointer_tmp, os.path.join(root, cls.POINTER))
+
+        # Keep the previous build for readers that have not switched yet
+        for old in builds:
+            if old != previous:
+                shutil.rmtree(os.path.join(root, old), ignore_errors=True)
+        return cls.get()
+
+    @staticmethod
+    def _ivf_lists(n):
+        if n >= getattr(settings, 'NLP_DENSE_IVF_MIN_PASSAGES', 50000):
+            return int(np.sqrt(n))
+        return 0
+
+    @classmethod
+    def rebuild(cls, batch_size=64):
+        """Embeds every stored passage offline and publishes a new dense index."""
+        rows = RegulatoryPassage.objects.values_list('id', 'text').iterator(chunk_size=2000)
+        passage_ids, matrix = cls._embed_passages(rows, batch_size)
+        ivf_lists = cls._ivf_lists(len(passage_ids))
+        with writer_lock(os.path.join(cls.root(), '.dense.lock')):
+            index = cls._publish(lambda index_dir: DenseIndex.build(
+                index_dir, passage_ids, matrix,
+                dtype=getattr(settings, 'NLP_DENSE_DTYPE', 'float16'), ivf_lists=ivf_lists,
+            ))
+        print(f"Built dense index over {len(passage_ids)} passages ({ivf_lists} IVF lists)")
+        return index
+
+    @classmethod
+    def add_passages(cls, passages, deleted_ids=()):
+        """
+        Embeds only the given (passage_id, text) pairs and publishes them as
+        an append to the current index. When the appended rows exceed
+        NLP_DENSE_MAX_DELTA the stored vectors are re-partitioned into a new
+        main matrix, still without re-embedding anything. Does nothing when
+        no dense index has been built.
+        """
+        if cls.get() is None:
+            return None
+        passage_ids, matrix = cls._embed_passages(passages)
+        with writer_lock(os.path.join(cls.root(), '.dense.lock')):
+            current = cls.get()
+            index = cls._publish(lambda index_dir: current.extend(index_dir, passage_ids, matrix, deleted_ids))
+            if index.meta['delta_count'] > getattr(settings, 'NLP_DENSE_MAX_DELTA', 20000):
+                ids, vectors = index.vectors()
+                index = cls._publish(lambda index_dir: DenseIndex.build(
+                    index_dir, ids, vectors, dtype=index.meta['dtype'], ivf_lists=cls._ivf_lists(len(ids)),
+                ))
+        print(f"Added {len(passage_ids)} passages to the dense index")
+        return index
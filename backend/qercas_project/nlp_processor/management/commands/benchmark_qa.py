@@ -0,0 +1,53 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from nlp_processor.batching import QABatcher
+from nlp_processor.benchmarking import QUESTIONS, latency_summary
+from nlp_processor.services import NLPService, QAModelLoader
+
+
+class Command(BaseCommand):
+    help = 'Measures QA throughput and latency under concurrent load, with and without dynamic batching.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--concurrency', type=int, default=16)
+        parser.add_argument('--max-batch-size', type=int, default=16)
+        parser.add_argument('--max-wait-ms', type=float, default=10)
+
+    def handle(self, *args, **options):
+        contexts = NLPService.retrieve_passages(QUESTIONS[0]) or [NLPService.DEMO_CONTEXT]
+        qa_pipeline = QAModelLoader.get_pipeline()
+        call_kwargs = QAModelLoader.call_kwargs()
+        qa_pipeline(question=QUESTIONS[0], context=contexts[0], **call_kwargs)  # warm up
+
+        def unbatched(question):
+            return [qa_pipeline(question=question, context=c, **call_kwargs) for c in contexts]
+
+        batcher = QABatcher(options['max_batch_size'], options['max_wait_ms'])
+
+        def batched(question):
+            return batcher.answer(question, contexts)
+
+        for label, answer in (('unbatched', unbatched), ('batched', batched)):
+            self._run(label, answer, options['requests'], options['concurrency'])
+
+    def _run(self, label, answer, n_requests, concurrency):
+        def timed(i):
+            start = time.perf_counter()
+            answer(QUESTIONS[i % len(QUESTIONS)])
+            return time.perf_counter() - start
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            latencies = np.array(list(pool.map(timed, range(n_requests)))) * 1000
+        elapsed = time.perf_counter() - start
+
+        summary = latency_summary(latencies)
+        self.stdout.write(
+            f"{label:>10}: {n_requests / elapsed:8.1f} req/s  "
+            f"p50 {summary['p50']:7.1f} ms  p95 {summary['p95']:7.1f} ms  p99 {summary['p99']:7.1f} ms  "
+            f"(concurrency {concurrency})"
+        )
@@ -0,0 +1,61 @@
+import io
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from nlp_processor.benchmarking import QUESTIONS, latency_summary, token_f1
+from nlp_processor.services import NLPService, QAModelLoader
+
+
+class Command(BaseCommand):
+    help = (
+        'Compares the int8 quantized QA model with the full-precision baseline: '
+        'latency, model size and answer agreement on a fixed question set.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeats', type=int, default=5)
+        parser.add_argument(
+            '--min-agreement', type=float, default=0.9,
+            help='Fail when mean token F1 against the baseline answers falls below this.',
+        )
+
+    def handle(self, *args, **options):
+        import torch
+
+        contexts = {q: (NLPService.retrieve_passages(q) or [NLPService.DEMO_CONTEXT]) for q in QUESTIONS}
+        call_kwargs = QAModelLoader.call_kwargs()
+        answers = {}
+        for label, quantized in (('baseline', False), ('int8', True)):
+            qa_pipeline = QAModelLoader.build_pipeline(quantized=quantized)
+            buffer = io.BytesIO()
+            torch.save(qa_pipeline.model.state_dict(), buffer)
+
+            latencies, answers[label] = [], []
+            for question in QUESTIONS:
+                passages = contexts[question]
+                for _ in range(options['repeats']):
+                    start = time.perf_counter()
+                    results = qa_pipeline(question=[question] * len(passages), context=passages, **call_kwargs)
+                    latencies.append((time.perf_counter() - start) * 1000)
+                results = [results] if isinstance(results, dict) else results
+                answers[label].append(max(results, key=lambda r: r['score'])['answer'])
+
+            summary = latency_summary(latencies)
+            self.stdout.write(
+                f"{label:>8}: p50 {summary['p50']:7.1f} ms  p99 {summary['p99']:7.1f} ms  "
+                f"weights {buffer.tell() / 2**20:6.1f} MiB  (torch threads {torch.get_num_threads()})"
+            )
+
+        exact = sum(a == b for a, b in zip(answers['baseline'], answers['int8'])) / len(QUESTIONS)
+        f1 = sum(token_f1(a, b) for a, b in zip(answers['baseline'], answers['int8'])) / len(QUESTIONS)
+        self.stdout.write(f"agreement: exact {exact:.0%}  token F1 {f1:.3f}")
+        for question, a, b in zip(QUESTIONS, answers['baseline'], answers['int8']):
+            if a != b:
+                self.stdout.write(f"  differs: {question!r}: {a!r} vs {b!r}")
+
+        if f1 < options['min_agreement']:
+            raise CommandError(
+                f"int8 model agreement {f1:.3f} is below the {options['min_agreement']} guardrail; "
+                "keep NLP_QA_QUANTIZED off."
+            )
+        self.stdout.write(self.style.SUCCESS("int8 model is within the agreement guardrail."))
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from nlp_processor.dense import DenseRetrievalIndex
+
+class Command(BaseCommand):
+    help = 'Embeds all regulatory passages into the memory-mapped dense index used for semantic search.'
+
+    def handle(self, *args, **options):
+        self.stdout.write("Embedding regulatory passages...")
+        index = DenseRetrievalIndex.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Dense index holds {len(index)} passages"))
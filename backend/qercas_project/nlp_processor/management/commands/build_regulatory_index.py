@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from nlp_processor.retrieval import RetrievalIndex
+
+class Command(BaseCommand):
+    help = 'Rebuilds the BM25 passage index over all stored regulatory documents.'
+
+    def handle(self, *args, **options):
+        self.stdout.write("Rebuilding regulatory passage index...")
+        index = RetrievalIndex.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Indexed {len(index)} passages"))
@@ -0,0 +1,43 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+from nlp_processor.services import RegulatoryCorpus
+
+
+class Command(BaseCommand):
+    help = (
+        'Streams regulatory text files into the document store. Only new or '
+        'changed files are split into passages and added to the retrieval indexes.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='+', help='Text files, or directories of .txt files')
+        parser.add_argument('--source', default='', help='Regulation family, e.g. MiCA, AMLD, FATF')
+        parser.add_argument('--encoding', default='utf-8')
+
+    def handle(self, *args, **options):
+        files = []
+        for path in options['paths']:
+            if os.path.isdir(path):
+                files.extend(
+                    os.path.join(root, name)
+                    for root, _, names in os.walk(path)
+                    for name in sorted(names) if name.endswith('.txt')
+                )
+            elif os.path.isfile(path):
+                files.append(path)
+            else:
+                raise CommandError(f"No such file or directory: {path}")
+
+        counts = {'created': 0, 'updated': 0, 'unchanged': 0}
+        for path in files:
+            document, status = RegulatoryCorpus.ingest_file(
+                path, source=options['source'], encoding=options['encoding'],
+            )
+            counts[status] += 1
+            self.stdout.write(f"{status:>9}: {document.key} ({document.passages.count()} passages)")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Ingested {len(files)} files: {counts['created']} new, "
+            f"{counts['updated']} updated, {counts['unchanged']} unchanged."
+        ))
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.5 on 2026-10-19 11:05
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def fill_document_keys(apps, schema_editor):
+    RegulatoryDocument = apps.get_model('nlp_processor', 'RegulatoryDocument')
+    for document in RegulatoryDocument.objects.all():
+        document.key = f"document-{document.pk}"
+        document.save(update_fields=['key'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('nlp_processor', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='regulatorydocument',
+            name='key',
+            field=models.CharField(default='', max_length=255),
+            preserve_default=False,
+        ),
+        migrations.RunPython(fill_document_keys, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='regulatorydocument',
+            name='key',
+            field=models.CharField(max_length=255, unique=True),
+        ),
+        migrations.AddField(
+            model_name='regulatorydocument',
+            name='content_hash',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='regulatorydocument',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+    ]
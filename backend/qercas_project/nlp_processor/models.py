@@ -1,3 +1,29 @@
 from django.db import models
 
-# Create your models here.
+
+class RegulatoryDocument(models.Model):
+    key = models.CharField(max_length=255, unique=True)  # stable identity, e.g. the file name
+    title = models.CharField(max_length=255)
+    source = models.CharField(max_length=50, blank=True)  # e.g. MiCA, AMLD, FATF
+    content_hash = models.CharField(max_length=64, blank=True)  # sha256 of the full text
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    def __str__(self):
+        return f"{self.source} - {self.title}" if self.source else self.title
+
+
+class RegulatoryPassage(models.Model):
+    document = models.ForeignKey(
+        RegulatoryDocument,
+        on_delete=models.CASCADE,
+        related_name='passages',
+    )
+    position = models.PositiveIntegerField()
+    text = models.TextField()
+
+    class Meta:
+        ordering = ['document', 'position']
+
+    def __str__(self):
+        return f"{self.document.title} #{self.position}"
@@ -0,0 +1,374 @@
+import json
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+import numpy as np
+from django.conf import settings
+from .models import RegulatoryPassage
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+STOP_WORDS = frozenset("""
+a an and are as at be by for from has have in is it its of on or that the
+this to was were which will with within must shall any all such
+""".split())
+
+
+def tokenize(text):
+    """Lower-cases text and splits it into index terms."""
+    return [t for t in TOKEN_RE.findall(text.lower()) if t not in STOP_WORDS]
+
+
+def iter_passages(pieces, max_words=150, overlap=30):
+    """
+    Splits a stream of text pieces (lines, file chunks) into overlapping
+    passages of at most `max_words` words, without holding the whole text.
+    """
+    window = []
+    carry = ''
+    emitted = False
+    for piece in pieces:
+        # A piece may end mid-word; keep the tail until the next piece arrives
+        text = carry + piece
+        words = text.split()
+        carry = ''
+        if words and not text[-1].isspace():
+            carry = words.pop()
+        window.extend(words)
+        while len(window) >= max_words:
+            yield ' '.join(window[:max_words])
+            emitted = True
+            window = window[max_words - overlap:]
+    if carry:
+        window.append(carry)
+    # After the first passage the leading `overlap` words were already emitted
+    if window and (not emitted or len(window) > overlap):
+        yield ' '.join(window)
+
+
+def reciprocal_rank_fusion(rankings, k=None, c=60):
+    """
+    Merges ranked lists of passage ids into one ranking. Each id scores
+    sum(1 / (c + rank)) over the lists it appears in, so ids found by both
+    keyword and dense retrieval rise to the top.
+    """
+    scores = defaultdict(float)
+    for ranking in rankings:
+        for rank, passage_id in enumerate(ranking):
+            scores[passage_id] += 1.0 / (c + rank + 1)
+    merged = sorted(scores, key=scores.get, reverse=True)
+    return merged[:k] if k else merged
+
+
+@contextmanager
+def writer_lock(lock_path, stale_after=600):
+    """
+    Serialises index publishing across processes with an exclusive lock file.
+    A lock older than `stale_after` seconds is assumed to be left over from a
+    crashed writer and is broken.
+    """
+    os.makedirs(os.path.dirname(lock_path), exist_ok=True)
+    while True:
+        try:
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            try:
+                if time.time() - os.stat(lock_path).st_mtime > stale_after:
+                    os.remove(lock_path)
+                    continue
+            except FileNotFoundError:
+                continue
+            time.sleep(0.05)
+    try:
+        yield
+    finally:
+        os.close(fd)
+        os.remove(lock_path)
+
+
+class BM25Index:
+    """
+    One immutable segment of the Okapi BM25 inverted index over regulatory
+    passages, kept in flat arrays:
+      terms           term -> term id
+      term_offsets    int64, postings of term t span term_offsets[t]:term_offsets[t+1]
+      postings_doc    int32 row in passage_ids
+      postings_tf     int32 term frequency in that passage
+      doc_lengths     int32 passage length in terms
+      passage_ids     int64 RegulatoryPassage primary keys
+    """
+
+    def __init__(self, terms, term_offsets, postings_doc, postings_tf, doc_lengths, passage_ids):
+        self.terms = terms
+        self.term_offsets = term_offsets
+        self.postings_doc = postings_doc
+        self.postings_tf = postings_tf
+        self.doc_lengths = doc_lengths
+        self.passage_ids = passage_ids
+        self.total_length = int(doc_lengths.sum())
+
+    def __len__(self):
+        return len(self.passage_ids)
+
+    @classmethod
+    def build(cls, passages):
+        """Builds a segment from an iterable of (passage_id, text) pairs."""
+        postings = defaultdict(list)
+        passage_ids, doc_lengths = [], []
+        for row, (passage_id, text) in enumerate(passages):
+            tokens = tokenize(text)
+            passage_ids.append(passage_id)
+            doc_lengths.append(len(tokens))
+            for term, tf in Counter(tokens).items():
+                postings[term].append((row, tf))
+
+        terms = {term: i for i, term in enumerate(sorted(postings))}
+        term_offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        postings_doc, postings_tf = [], []
+        for term, term_id in terms.items():
+            entries = postings[term]
+            term_offsets[term_id + 1] = term_offsets[term_id] + len(entries)
+            postings_doc.extend(row for row, _ in entries)
+            postings_tf.extend(tf for _, tf in entries)
+
+        return cls(
+            terms,
+            term_offsets,
+            np.asarray(postings_doc, dtype=np.int32),
+            np.asarray(postings_tf, dtype=np.int32),
+            np.asarray(doc_lengths, dtype=np.int32),
+            np.asarray(passage_ids, dtype=np.int64),
+        )
+
+    def document_frequency(self, term, live=None):
+        """Passages containing `term`, counting only rows set in the `live` mask when given."""
+        term_id = self.terms.get(term)
+        if term_id is None:
+            return 0
+        start, end = self.term_offsets[term_id], self.term_offsets[term_id + 1]
+        if live is None:
+            return int(end - start)
+        return int(live[self.postings_doc[start:end]].sum())
+
+    def score(self, idfs, avg_doc_length, k1, b):
+        """
+        Scores this segment's passages for the query terms in `idfs`
+        (term -> idf computed over the whole index). Returns
+        (passage_ids, scores) for passages containing at least one term.
+        """
+        docs, contributions = [], []
+        for term, idf in idfs.items():
+            term_id = self.terms.get(term)
+            if term_id is None:
+                continue
+            start, end = self.term_offsets[term_id], self.term_offsets[term_id + 1]
+            doc = self.postings_doc[start:end]
+            tf = self.postings_tf[start:end].astype(np.float32)
+            norm = k1 * (1 - b + b * self.doc_lengths[doc] / avg_doc_length)
+            docs.append(doc)
+            contributions.append(idf * tf * (k1 + 1) / (tf + norm))
+        if not docs:
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+        candidates, inverse = np.unique(np.concatenate(docs), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(contributions))
+        return self.passage_ids[candidates], scores
+
+    def save(self, path):
+        """Writes the segment to a single .npz file, replacing any previous one atomically."""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(
+            tmp_path,
+            terms=np.array(sorted(self.terms, key=self.terms.get), dtype=str),
+            term_offsets=self.term_offsets,
+            postings_doc=self.postings_doc,
+            postings_tf=self.postings_tf,
+            doc_lengths=self.doc_lengths,
+            passage_ids=self.passage_ids,
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as arrays:
+            return cls(
+                {str(term): i for i, term in enumerate(arrays['terms'])},
+                arrays['term_offsets'],
+                arrays['postings_doc'],
+                arrays['postings_tf'],
+                arrays['doc_lengths'],
+                arrays['passage_ids'],
+            )
+
+
+class SegmentedBM25Index:
+    """
+    BM25 over a list of immutable segments plus a set of deleted passage ids.
+    New documents are added as a small new segment instead of rebuilding
+    everything; corpus statistics (N, avgdl, df) are summed across segments
+    over live passages only, so scores match a single merged index built
+    without the deleted ones. Query cost depends on the postings of the
+    query terms, not on corpus size.
+    """
+    K1 = 1.5
+    B = 0.75
+
+    def __init__(self, segments, deleted_ids=()):
+        self.segments = list(segments)
+        self.deleted_ids = np.asarray(sorted(deleted_ids), dtype=np.int64)
+        # Row masks of live passages, None for segments without deletions.
+        # Tombstones may name passages that never reached an index (a failed ingest)
+        self.live = []
+        for segment in self.segments:
+            live = ~np.isin(segment.passage_ids, self.deleted_ids) if len(self.deleted_ids) else None
+            self.live.append(None if live is None or live.all() else live)
+        self.n_docs = sum(len(segment) if live is None else int(live.sum())
+                          for segment, live in zip(self.segments, self.live))
+        total_length = sum(segment.total_length if live is None else int(segment.doc_lengths[live].sum())
+                           for segment, live in zip(self.segments, self.live))
+        self.avg_doc_length = total_length / max(self.n_docs, 1)
+
+    def __len__(self):
+        return max(self.n_docs, 0)
+
+    def search(self, query, k=5):
+        """Returns [(passage_id, score), ...] for the k best matching passages."""
+        if self.n_docs <= 0:
+            return []
+        idfs = {}
+        for term in set(tokenize(query)):
+            df = sum(segment.document_frequency(term, live) for segment, live in zip(self.segments, self.live))
+            if df:
+                idfs[term] = math.log(1 + (self.n_docs - df + 0.5) / (df + 0.5))
+        if not idfs:
+            return []
+
+        scored = [segment.score(idfs, self.avg_doc_length, self.K1, self.B) for segment in self.segments]
+        passage_ids = np.concatenate([ids for ids, _ in scored])
+        scores = np.concatenate([s for _, s in scored])
+        if len(self.deleted_ids):
+            live = ~np.isin(passage_ids, self.deleted_ids)
+            passage_ids, scores = passage_ids[live], scores[live]
+        if not len(passage_ids):
+            return []
+        k = min(k, len(passage_ids))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(passage_ids[i]), float(scores[i])) for i in top]
+
+
+class RetrievalIndex:
+    """
+    Process-wide holder for the BM25 index on disk. The published state is a
+    manifest naming the segment files and the deleted passage ids; it is
+    replaced atomically, and readers reload it (loading only segments they
+    have not seen) whenever it changes.
+    """
+    MANIFEST = 'bm25_manifest.json'
+    _index = None
+    _mtime = None
+    _segments = {}
+    _lock = threading.Lock()
+
+    @staticmethod
+    def index_dir():
+        return getattr(settings, 'NLP_INDEX_DIR', os.path.join(settings.BASE_DIR, 'nlp_index'))
+
+    @classmethod
+    def manifest_path(cls):
+        return os.path.join(cls.index_dir(), cls.MANIFEST)
+
+    @classmethod
+    def version(cls):
+        """Changes whenever a new index is published; 0 when there is none."""
+        try:
+            return os.stat(cls.manifest_path()).st_mtime_ns
+        except FileNotFoundError:
+            return 0
+
+    @classmethod
+    def _read_manifest(cls):
+        try:
+            with open(cls.manifest_path()) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {"segments": [], "deleted": [], "next_segment": 1}
+
+    @classmethod
+    def _write_manifest(cls, manifest):
+        tmp_path = f"{cls.manifest_path()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, cls.manifest_path())
+
+    @classmethod
+    def get(cls):
+        """Returns the current SegmentedBM25Index, or None when no index has been built."""
+        mtime = cls.version()
+        if not mtime:
+            return None
+        if cls._index is None or mtime != cls._mtime:
+            with cls._lock:
+                if cls._index is None or mtime != cls._mtime:
+                    manifest = cls._read_manifest()
+                    segments = {
+                        name: cls._segments[name] if name in cls._segments
+                        else BM25Index.load(os.path.join(cls.index_dir(), name))
+                        for name in manifest['segments']
+                    }
+                    cls._segments = segments
+                    cls._index = SegmentedBM25Index(segments.values(), manifest['deleted'])
+                    cls._mtime = mtime
+        return cls._index
+
+    @classmethod
+    def rebuild(cls):
+        """
+        Rebuilds the index from every stored RegulatoryPassage as a single
+        segment and publishes it, compacting away deleted passages.
+        """
+        with writer_lock(os.path.join(cls.index_dir(), '.bm25.lock')):
+            return cls._rebuild()
+
+    @classmethod
+    def _rebuild(cls):
+        manifest = cls._read_manifest()
+        name = f"bm25-{manifest['next_segment']:06d}.npz"
+        passages = RegulatoryPassage.objects.values_list('id', 'text').iterator(chunk_size=2000)
+        segment = BM25Index.build(passages)
+        segment.save(os.path.join(cls.index_dir(), name))
+        cls._write_manifest({"segments": [name], "deleted": [], "next_segment": manifest['next_segment'] + 1})
+        for old in manifest['segments']:
+            try:
+                os.remove(os.path.join(cls.index_dir(), old))
+            except FileNotFoundError:
+                pass
+        print(f"Built BM25 index over {len(segment)} passages")
+        return SegmentedBM25Index([segment])
+
+    @classmethod
+    def add_passages(cls, passages, deleted_ids=()):
+        """
+        Adds (passage_id, text) pairs as a new segment and marks deleted_ids
+        as removed. Once NLP_INDEX_MAX_SEGMENTS is exceeded the segments are
+        merged by a full rebuild.
+        """
+        with writer_lock(os.path.join(cls.index_dir(), '.bm25.lock')):
+            manifest = cls._read_manifest()
+            if len(manifest['segments']) >= getattr(settings, 'NLP_INDEX_MAX_SEGMENTS', 16):
+                return cls._rebuild()
+            segment = BM25Index.build(passages)
+            if len(segment):
+                name = f"bm25-{manifest['next_segment']:06d}.npz"
+                segment.save(os.path.join(cls.index_dir(), name))
+                manifest['segments'].append(name)
+                manifest['next_segment'] += 1
+            manifest['deleted'] = sorted(set(manifest['deleted']) | set(int(i) for i in deleted_ids))
+            cls._write_manifest(manifest)
+            print(f"Added {len(segment)} passages to the BM25 index ({len(manifest['segments'])} segments)")
+            return segment
@@ -0,0 +1,9 @@
+from rest_framework import serializers
+from .models import RegulatoryDocument
+
+class RegulatoryDocumentSerializer(serializers.ModelSerializer):
+    passages = serializers.IntegerField(source='passages.count', read_only=True)
+
+    class Meta:
+        model = RegulatoryDocument
+        fields = ['id', 'key', 'title', 'source', 'content_hash', 'created_at', 'updated_at', 'passages']
@@ -1,16 +1,219 @@
-from transformers import pipeline
+import codecs
+import hashlib
+import os
+import threading
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from .models import RegulatoryDocument, RegulatoryPassage
+from .batching import get_qa_batcher
+from .cache import get_answer_cache
+from .dense import DenseRetrievalIndex
+from .retrieval import RetrievalIndex, iter_passages, reciprocal_rank_fusion
 
-qa_pipeline = pipeline("question-answering", model="distilbert-base-cased-distilled-squad")
 
-class NLPService:
+class QAModelLoader:
+    """
+    Process-wide, thread-safe holder for the question-answering pipeline.
+    transformers (and torch) are only imported when the model is first needed,
+    so processes that never answer a question never load them.
+    """
+    _pipeline = None
+    _error = None
+    _loading = False
+    _lock = threading.Lock()
+
     @staticmethod
-    def answer_question(question: str) -> str:
+    def model_id(quantized=None) -> str:
+        """Names the configured model variant, e.g. for cache keys."""
+        model_name = getattr(settings, 'NLP_QA_MODEL', 'distilbert-base-cased-distilled-squad')
+        if quantized is None:
+            quantized = getattr(settings, 'NLP_QA_QUANTIZED', False)
+        return f"{model_name}+int8" if quantized else model_name
+
+    @staticmethod
+    def call_kwargs() -> dict:
         """
-        Answers a regulatory question using a pre-trained NLP model.
-        In a real system, the 'context' would be pulled from a database of
-        regulatory documents. For this demo, we'll use a hard-coded context.
+        Pipeline arguments capping the sequence length to what a retrieved
+        passage plus the question actually needs.
         """
-        context = """
+        max_seq_len = getattr(settings, 'NLP_QA_MAX_SEQ_LEN', 384)
+        return {"max_seq_len": max_seq_len, "doc_stride": min(128, max_seq_len // 2)}
+
+    @staticmethod
+    def build_pipeline(quantized=None):
+        """
+        Builds a QA pipeline tuned for CPU inference. With quantized=True the
+        Linear layers are dynamically quantized to int8.
+        """
+        import torch
+        from transformers import AutoModelForQuestionAnswering, AutoTokenizer, pipeline
+        if quantized is None:
+            quantized = getattr(settings, 'NLP_QA_QUANTIZED', False)
+        threads = getattr(settings, 'NLP_TORCH_THREADS', None)
+        if threads:
+            torch.set_num_threads(threads)
+
+        model_name = getattr(settings, 'NLP_QA_MODEL', 'distilbert-base-cased-distilled-squad')
+        print(f"Loading QA model: {QAModelLoader.model_id(quantized)}")
+        tokenizer = AutoTokenizer.from_pretrained(model_name)
+        model = AutoModelForQuestionAnswering.from_pretrained(model_name)
+        model.eval()
+        if quantized:
+            model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        return pipeline("question-answering", model=model, tokenizer=tokenizer, device=-1)
+
+    @classmethod
+    def get_pipeline(cls):
+        """Returns the QA pipeline, loading it on first call."""
+        if cls._pipeline is not None:
+            return cls._pipeline
+        if not getattr(settings, 'NLP_ENABLED', True):
+            raise RuntimeError("NLP is disabled for this deployment.")
+        with cls._lock:
+            if cls._pipeline is None:
+                cls._loading = True
+                try:
+                    cls._pipeline = cls.build_pipeline()
+                    cls._error = None
+                except Exception as e:
+                    cls._error = str(e)
+                    raise
+                finally:
+                    cls._loading = False
+        return cls._pipeline
+
+    @classmethod
+    def warm_up(cls):
+        """Starts loading the model on a daemon thread and returns immediately."""
+        if cls._pipeline is not None or cls._loading or not getattr(settings, 'NLP_ENABLED', True):
+            return
+
+        def _load():
+            try:
+                cls.get_pipeline()
+            except Exception as e:
+                print(f"QA model warm-up failed: {e}")
+
+        threading.Thread(target=_load, name='qa-model-warmup', daemon=True).start()
+
+    @classmethod
+    def status(cls) -> dict:
+        return {
+            "enabled": getattr(settings, 'NLP_ENABLED', True),
+            "model": cls.model_id(),
+            "ready": cls._pipeline is not None,
+            "loading": cls._loading,
+            "error": cls._error,
+        }
+
+
+class RegulatoryCorpus:
+    """
+    The store of regulatory documents that questions are answered from.
+    Documents are streamed in chunk by chunk, and only new or changed
+    documents (by content hash) touch the retrieval indexes.
+    """
+    READ_CHUNK_CHARS = 64 * 1024
+    INSERT_BATCH = 500
+
+    @staticmethod
+    def ingest(key: str, title: str, source: str, read_chunks):
+        """
+        Stores a document and adds its passages to the retrieval indexes.
+        `read_chunks` is a zero-argument callable returning a fresh iterator
+        of text chunks; it is read twice, once to hash and once to split, so
+        the whole text is never held in memory. The content hash is stored
+        only once both indexes have the passages, so a failed index update
+        is retried by the next ingest instead of being skipped as unchanged.
+        Returns (document, status) with status 'created', 'updated' or 'unchanged'.
+        """
+        digest = hashlib.sha256()
+        for chunk in read_chunks():
+            digest.update(chunk.encode('utf-8'))
+        content_hash = digest.hexdigest()
+
+        document = RegulatoryDocument.objects.filter(key=key).first()
+        if document is not None and document.content_hash == content_hash:
+            return document, 'unchanged'
+
+        deleted_ids = []
+        with transaction.atomic():
+            if document is None:
+                document = RegulatoryDocument.objects.create(key=key, title=title, source=source)
+                status = 'created'
+            else:
+                deleted_ids = list(document.passages.values_list('id', flat=True))
+                document.passages.all().delete()
+                document.title, document.source, document.content_hash = title, source, ''
+                document.save(update_fields=['title', 'source', 'content_hash', 'updated_at'])
+                status = 'updated'
+
+            passages = iter_passages(
+                read_chunks(),
+                max_words=getattr(settings, 'NLP_PASSAGE_WORDS', 150),
+                overlap=getattr(settings, 'NLP_PASSAGE_OVERLAP', 30),
+            )
+            batch = []
+            for position, text in enumerate(passages):
+                batch.append(RegulatoryPassage(document=document, position=position, text=text))
+                if len(batch) >= RegulatoryCorpus.INSERT_BATCH:
+                    RegulatoryPassage.objects.bulk_create(batch)
+                    batch = []
+            if batch:
+                RegulatoryPassage.objects.bulk_create(batch)
+
+        def new_passages():
+            return document.passages.values_list('id', 'text').iterator(chunk_size=2000)
+
+        RetrievalIndex.add_passages(new_passages(), deleted_ids)
+        DenseRetrievalIndex.add_passages(new_passages(), deleted_ids)
+        document.content_hash = content_hash
+        document.save(update_fields=['content_hash'])
+        return document, status
+
+    @staticmethod
+    def ingest_file(path: str, source: str = '', title: str = None, key: str = None, encoding: str = 'utf-8'):
+        """Ingests a text file from disk, keyed by its file name unless a key is given."""
+        def read_chunks():
+            with open(path, encoding=encoding, errors='replace') as f:
+                while True:
+                    chunk = f.read(RegulatoryCorpus.READ_CHUNK_CHARS)
+                    if not chunk:
+                        break
+                    yield chunk
+
+        name = os.path.basename(path)
+        return RegulatoryCorpus.ingest(key or name, title or os.path.splitext(name)[0], source, read_chunks)
+
+    @staticmethod
+    def ingest_uploaded_file(uploaded_file, source: str = '', title: str = None, key: str = None):
+        """Ingests a Django UploadedFile, decoding its chunks incrementally."""
+        def read_chunks():
+            decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+            for chunk in uploaded_file.chunks():
+                yield decoder.decode(chunk)
+            yield decoder.decode(b'', final=True)
+
+        name = uploaded_file.name
+        return RegulatoryCorpus.ingest(key or name, title or os.path.splitext(name)[0], source, read_chunks)
+
+    @staticmethod
+    def ingest_text(key: str, title: str, source: str, text: str):
+        return RegulatoryCorpus.ingest(key, title, source, lambda: iter([text]))
+
+    @staticmethod
+    def recent_updates(days: int = None) -> int:
+        """Counts documents added or changed within the last `days` days."""
+        days = days or getattr(settings, 'REGULATORY_UPDATES_WINDOW_DAYS', 30)
+        since = timezone.now() - timedelta(days=days)
+        return RegulatoryDocument.objects.filter(updated_at__gte=since).count()
+
+
+class NLPService:
+    # Used until regulatory documents have been loaded and indexed
+    DEMO_CONTEXT = """
         The Markets in Crypto-Assets (MiCA) regulation, effective June 2024,
         requires all Crypto-Asset Service Providers (CASPs) operating within the EU
         to report any transaction exceeding EUR 10,000 to the relevant national
@@ -21,12 +224,85 @@ class NLPService:
         detecting and flagging suspicious insider trading patterns, particularly
         around the announcement of new asset listings.
         """
-        
+
+    @staticmethod
+    def retrieve_passages(question: str, k: int = None) -> list:
+        """
+        Returns the text of the k passages that best match the question,
+        merging BM25 keyword hits with dense semantic hits when a dense index
+        has been built.
+        """
+        k = k or getattr(settings, 'NLP_RETRIEVAL_TOP_K', 3)
+        rankings = []
+        keyword_index = RetrievalIndex.get()
+        if keyword_index is not None:
+            rankings.append([passage_id for passage_id, _ in keyword_index.search(question, 2 * k)])
+        dense_index = DenseRetrievalIndex.get() if getattr(settings, 'NLP_DENSE_RETRIEVAL', True) else None
+        if dense_index is not None:
+            rankings.append([passage_id for passage_id, _ in dense_index.search(question, 2 * k)])
+        if not rankings:
+            return []
+        passage_ids = reciprocal_rank_fusion(rankings, k)
+        passages = RegulatoryPassage.objects.in_bulk(passage_ids)
+        return [passages[passage_id].text for passage_id in passage_ids if passage_id in passages]
+
+    @staticmethod
+    def run_qa(question: str, contexts: list) -> list:
+        """
+        Runs the QA model over each context. Concurrent callers are batched
+        together through the inference queue unless batching is disabled;
+        a batched call raises TimeoutError after NLP_BATCH_TIMEOUT_SECONDS.
+        """
+        if getattr(settings, 'NLP_BATCHING_ENABLED', True):
+            timeout = getattr(settings, 'NLP_BATCH_TIMEOUT_SECONDS', 30)
+            return get_qa_batcher().answer(question, contexts, timeout=timeout)
+        qa_pipeline = QAModelLoader.get_pipeline()
+        results = qa_pipeline(
+            question=[question] * len(contexts),
+            context=list(contexts),
+            **QAModelLoader.call_kwargs(),
+        )
+        return [results] if isinstance(results, dict) else list(results)
+
+    @staticmethod
+    def cache_version() -> str:
+        """Identifies the corpus and model an answer was produced from."""
+        return f"{QAModelLoader.model_id()}:{RetrievalIndex.version()}:{DenseRetrievalIndex.version()}"
+
+    @staticmethod
+    def answer_question(question: str) -> str:
+        """
+        Answers a regulatory question using a pre-trained NLP model.
+        Only the top-k passages retrieved from the regulatory corpus are read
+        by the model, so latency depends on k rather than corpus size.
+        Answers are cached per normalized question and corpus/model version.
+        Raises TimeoutError when the batched QA model does not answer in time.
+        """
         try:
-            result = qa_pipeline(question=question, context=context)
-            if result['score'] < 0.1:
-                return "I'm sorry, I couldn't find a confident answer in the provided documents."
-            return result['answer']
+            use_cache = getattr(settings, 'NLP_ANSWER_CACHE_ENABLED', True)
+            if use_cache:
+                version = NLPService.cache_version()
+                cached = get_answer_cache().get(question, version)
+                if cached is not None:
+                    return cached
+
+            contexts = NLPService.retrieve_passages(question)
+            if not contexts and not RetrievalIndex.get():
+                contexts = [NLPService.DEMO_CONTEXT]
+            if not contexts:
+                answer = "I'm sorry, I couldn't find a confident answer in the provided documents."
+            else:
+                results = NLPService.run_qa(question, contexts)
+                result = max(results, key=lambda r: r['score'])
+                if result['score'] < 0.1:
+                    answer = "I'm sorry, I couldn't find a confident answer in the provided documents."
+                else:
+                    answer = result['answer']
+
+            if use_cache:
+                get_answer_cache().set(question, version, answer)
+            return answer
+        except TimeoutError:
+            raise
         except Exception as e:
             return f"Error processing question: {str(e)}"
-            return "Could not process the question at the moment"
\ No newline at end of file
@@ -1,3 +1,603 @@
-from django.test import TestCase
+import math
+import os
+import shutil
+import tempfile
+import threading
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from django.core.cache import caches
+from django.core.cache.backends.base import BaseCache
+from django.core.management import CommandError, call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.urls import reverse
+
+from . import cache as answer_cache
+from .batching import QABatcher
+from .benchmarking import token_f1
+from .cache import AnswerCache, normalize_question
+from .dense import DenseIndex, DenseRetrievalIndex, EmbeddingModelLoader
+from .models import RegulatoryDocument, RegulatoryPassage
+from .retrieval import (
+    BM25Index, RetrievalIndex, SegmentedBM25Index, iter_passages, reciprocal_rank_fusion, tokenize,
+)
+from .services import NLPService, QAModelLoader, RegulatoryCorpus
+
+LOCMEM_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+UNREACHABLE_CACHE = {**LOCMEM_CACHE, 'down': {'BACKEND': 'nlp_processor.tests.UnreachableCache'}}
+
+
+class UnreachableCache(BaseCache):
+    """A cache backend whose server is down."""
+
+    def __init__(self, location, params):
+        super().__init__(params)
+
+    def get(self, *args, **kwargs):
+        raise ConnectionError('cache server unreachable')
+
+    set = get_many = set_many = delete = clear = get
+
+
+class IndexDirMixin:
+    """Points the BM25 and dense indexes at a fresh directory and forgets any loaded index."""
+
+    def setUp(self):
+        super().setUp()
+        self.index_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.index_dir, ignore_errors=True)
+        settings_override = override_settings(NLP_INDEX_DIR=self.index_dir)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.forget_indexes()
+        self.addCleanup(self.forget_indexes)
+
+    @staticmethod
+    def forget_indexes():
+        RetrievalIndex._index, RetrievalIndex._mtime, RetrievalIndex._segments = None, None, {}
+        DenseRetrievalIndex._index, DenseRetrievalIndex._name = None, None
+
+
+class QAModelLoaderTests(SimpleTestCase):
+    def setUp(self):
+        self.reset()
+        self.addCleanup(self.reset)
+
+    @staticmethod
+    def reset():
+        QAModelLoader._pipeline = None
+        QAModelLoader._error = None
+        QAModelLoader._loading = False
+
+    def test_pipeline_is_built_once_under_concurrent_first_use(self):
+        with mock.patch.object(QAModelLoader, 'build_pipeline', return_value='pipeline') as build:
+            results = []
+            threads = [threading.Thread(target=lambda: results.append(QAModelLoader.get_pipeline())) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        build.assert_called_once_with()
+        self.assertEqual(results, ['pipeline'] * 8)
+        self.assertTrue(QAModelLoader.status()['ready'])
+
+    @override_settings(NLP_ENABLED=False)
+    def test_disabled_deployment_never_loads_the_model(self):
+        with mock.patch.object(QAModelLoader, 'build_pipeline') as build:
+            QAModelLoader.warm_up()
+            with self.assertRaises(RuntimeError):
+                QAModelLoader.get_pipeline()
+
+        build.assert_not_called()
+        self.assertFalse(QAModelLoader.status()['enabled'])
+
+    def test_failed_load_is_reported_and_retried(self):
+        with mock.patch.object(QAModelLoader, 'build_pipeline', side_effect=[OSError('no weights'), 'pipeline']):
+            with self.assertRaises(OSError):
+                QAModelLoader.get_pipeline()
+            self.assertEqual(QAModelLoader.status()['error'], 'no weights')
+            self.assertFalse(QAModelLoader.status()['ready'])
+
+            self.assertEqual(QAModelLoader.get_pipeline(), 'pipeline')
+        self.assertIsNone(QAModelLoader.status()['error'])
+
+    def test_warm_up_loads_in_the_background(self):
+        loaded = threading.Event()
+        with mock.patch.object(QAModelLoader, 'build_pipeline', side_effect=lambda: loaded.set() or 'pipeline'):
+            QAModelLoader.warm_up()
+            self.assertTrue(loaded.wait(5))
+            for thread in threading.enumerate():
+                if thread.name == 'qa-model-warmup':
+                    thread.join(5)
+        self.assertTrue(QAModelLoader.status()['ready'])
+
+    def test_readiness_endpoint_is_unavailable_until_the_model_is_loaded(self):
+        response = self.client.get(reverse('qa-model-ready'))
+        self.assertEqual(response.status_code, 503)
+        self.assertFalse(response.json()['ready'])
+
+        QAModelLoader._pipeline = 'pipeline'
+        response = self.client.get(reverse('qa-model-ready'))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['ready'])
+
+
+class PassageSplittingTests(SimpleTestCase):
+    def test_words_split_across_pieces_are_rejoined(self):
+        passages = list(iter_passages(['anti money laun', 'dering rules'], max_words=10))
+        self.assertEqual(passages, ['anti money laundering rules'])
+
+    def test_passages_overlap_and_cover_every_word(self):
+        words = [f"w{i}" for i in range(25)]
+        passages = list(iter_passages([' '.join(words[:7]) + ' ', ' '.join(words[7:])], max_words=10, overlap=3))
+
+        self.assertEqual(passages[0].split(), words[:10])
+        self.assertEqual(passages[1].split(), words[7:17])
+        self.assertEqual(passages[-1].split()[-1], 'w24')
+        self.assertTrue(all(len(p.split()) <= 10 for p in passages))
+
+
+class BM25Tests(SimpleTestCase):
+    PASSAGES = [
+        (1, 'Crypto asset transfers above the threshold must be reported.'),
+        (2, 'The travel rule covers originator and beneficiary information for crypto transfers.'),
+        (3, 'Insider trading around asset listings must be detected.'),
+    ]
+
+    def test_score_matches_the_okapi_formula(self):
+        index = SegmentedBM25Index([BM25Index.build(self.PASSAGES)])
+        results = dict(index.search('travel', k=3))
+
+        # 'travel' appears once, only in passage 2: tf 1, df 1, N 3
+        lengths = [len(tokenize(text)) for _, text in self.PASSAGES]
+        idf = math.log(1 + (3 - 1 + 0.5) / (1 + 0.5))
+        norm = 1.5 * (1 - 0.75 + 0.75 * lengths[1] / (sum(lengths) / 3))
+        self.assertEqual(list(results), [2])
+        self.assertAlmostEqual(results[2], idf * 2.5 / (1 + norm), places=5)
+
+    def test_segments_score_like_one_merged_index(self):
+        merged = SegmentedBM25Index([BM25Index.build(self.PASSAGES)])
+        segmented = SegmentedBM25Index([BM25Index.build(self.PASSAGES[:1]), BM25Index.build(self.PASSAGES[1:])])
+
+        for query in ('crypto transfers', 'asset', 'insider listings'):
+            expected = merged.search(query, k=3)
+            actual = segmented.search(query, k=3)
+            self.assertEqual([pid for pid, _ in actual], [pid for pid, _ in expected])
+            for (_, a), (_, b) in zip(actual, expected):
+                self.assertAlmostEqual(a, b, places=5)
+
+    def test_deleted_passages_are_never_returned(self):
+        index = SegmentedBM25Index([BM25Index.build(self.PASSAGES)], deleted_ids=[1])
+
+        self.assertEqual(len(index), 2)
+        self.assertNotIn(1, [pid for pid, _ in index.search('crypto reported threshold', k=3)])
+        self.assertEqual(index.search('threshold reported', k=3), [])
+
+    def test_deleted_passages_drop_out_of_the_corpus_statistics(self):
+        tombstoned = SegmentedBM25Index(
+            [BM25Index.build(self.PASSAGES[:2]), BM25Index.build(self.PASSAGES[2:])], deleted_ids=[1])
+        rebuilt = SegmentedBM25Index([BM25Index.build(self.PASSAGES[1:])])
+
+        self.assertAlmostEqual(tombstoned.avg_doc_length, rebuilt.avg_doc_length)
+        for query in ('crypto transfers', 'asset', 'insider listings'):
+            self.assertEqual(
+                [(pid, round(score, 5)) for pid, score in tombstoned.search(query, k=3)],
+                [(pid, round(score, 5)) for pid, score in rebuilt.search(query, k=3)])
+
+    def test_tombstones_for_unindexed_passages_are_ignored(self):
+        index = SegmentedBM25Index([BM25Index.build(self.PASSAGES)], deleted_ids=[99])
+        self.assertEqual(len(index), 3)
+        self.assertEqual([pid for pid, _ in index.search('travel', k=3)], [2])
+
+    def test_unknown_and_stop_word_queries_find_nothing(self):
+        index = SegmentedBM25Index([BM25Index.build(self.PASSAGES)])
+        self.assertEqual(index.search('the and of', k=3), [])
+        self.assertEqual(index.search('blockchain', k=3), [])
+
+    def test_reciprocal_rank_fusion_favours_ids_found_by_both_rankings(self):
+        self.assertEqual(reciprocal_rank_fusion([[1, 2, 3], [3, 4]], k=2), [3, 1])
+
+
+@override_settings(NLP_DENSE_RETRIEVAL=False)
+class RetrievalIndexTests(IndexDirMixin, TestCase):
+    def add_document(self, key, *texts):
+        document = RegulatoryDocument.objects.create(key=key, title=key)
+        return [RegulatoryPassage.objects.create(document=document, position=i, text=t) for i, t in enumerate(texts)]
+
+    def test_no_index_until_one_is_built(self):
+        self.assertIsNone(RetrievalIndex.get())
+        self.assertEqual(NLPService.retrieve_passages('travel rule'), [])
+
+    def test_added_segments_and_tombstones_are_published(self):
+        first = self.add_document('mica', 'Transfers above EUR 10,000 are reported within 24 hours.')
+        RetrievalIndex.rebuild()
+        second = self.add_document('travel', 'The travel rule names originator and beneficiary.')
+        RetrievalIndex.add_passages([(p.id, p.text) for p in second], deleted_ids=[first[0].id])
+
+        index = RetrievalIndex.get()
+        self.assertEqual(len(index.segments), 2)
+        self.assertEqual([pid for pid, _ in index.search('travel rule', k=3)], [second[0].id])
+        self.assertEqual(index.search('reported hours', k=3), [])
+
+    def test_rebuild_compacts_segments_and_deletions(self):
+        passages = self.add_document('mica', 'Reporting threshold for crypto.', 'Travel rule information.')
+        RetrievalIndex.rebuild()
+        RetrievalIndex.add_passages([], deleted_ids=[passages[0].id])
+        passages[0].delete()
+
+        index = RetrievalIndex.rebuild()
+        self.assertEqual(len(index.segments), 1)
+        self.assertEqual(len(RetrievalIndex.get()), 1)
+        self.assertEqual(NLPService.retrieve_passages('travel rule'), ['Travel rule information.'])
+
+    @override_settings(NLP_INDEX_MAX_SEGMENTS=2)
+    def test_too_many_segments_trigger_a_full_rebuild(self):
+        for i in range(3):
+            passages = self.add_document(f"doc-{i}", f"Passage number {i} about sanctions.")
+            RetrievalIndex.add_passages([(p.id, p.text) for p in passages])
+
+        self.assertEqual(len(RetrievalIndex.get().segments), 1)
+        self.assertEqual(len(RetrievalIndex.get()), 3)
+
+
+def unit_vectors(n, dim=8, seed=0):
+    vectors = np.random.default_rng(seed).standard_normal((n, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+class DenseIndexTests(SimpleTestCase):
+    def setUp(self):
+        self.index_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.index_dir, ignore_errors=True)
+
+    def build(self, name, ids, vectors, **kwargs):
+        path = os.path.join(self.index_dir, name)
+        DenseIndex.build(path, ids, vectors, **kwargs)
+        return DenseIndex(path)
+
+    def test_quantized_search_matches_exact_search(self):
+        vectors = unit_vectors(40)
+        query = vectors[7]
+        exact = list(np.argsort(-(vectors @ query))[:5] + 100)
+
+        for dtype in ('float16', 'int8'):
+            index = self.build(dtype, np.arange(40) + 100, vectors, dtype=dtype)
+            results = index.search_vector(query, k=5)
+            self.assertEqual(results[0][0], 107)
+            self.assertAlmostEqual(results[0][1], 1.0, delta=0.02)
+            self.assertEqual(len(set(pid for pid, _ in results) & set(exact)), 5)
+
+    def test_ivf_probing_every_list_is_exhaustive(self):
+        vectors = unit_vectors(60)
+        index = self.build('ivf', np.arange(60), vectors, ivf_lists=4)
+
+        self.assertEqual(len(index.centroids), 4)
+        self.assertEqual(int(index.list_offsets[-1]), 60)
+        flat = self.build('flat', np.arange(60), vectors)
+        self.assertEqual(
+            [pid for pid, _ in index.search_vector(vectors[3], k=5, nprobe=4)],
+            [pid for pid, _ in flat.search_vector(vectors[3], k=5)],
+        )
+
+    def test_extend_appends_rows_and_tombstones_deleted_ones(self):
+        vectors = unit_vectors(12)
+        base = self.build('base', np.arange(10), vectors[:10])
+        base.extend(os.path.join(self.index_dir, 'extended'), [10, 11], vectors[10:], deleted_ids=[0])
+        index = DenseIndex(os.path.join(self.index_dir, 'extended'))
+
+        self.assertEqual(len(index), 11)
+        self.assertEqual(index.search_vector(vectors[11], k=1)[0][0], 11)
+        self.assertNotIn(0, [pid for pid, _ in index.search_vector(vectors[0], k=11)])
+
+        base.extend(os.path.join(self.index_dir, 'unindexed'), [], [], deleted_ids=[99])
+        self.assertEqual(len(DenseIndex(os.path.join(self.index_dir, 'unindexed'))), 10)
+
+        ids, restored = index.vectors()
+        self.assertEqual(sorted(ids), list(range(1, 12)))
+        np.testing.assert_allclose(restored[list(ids).index(11)], vectors[11], atol=1e-2)
+
+
+@override_settings(NLP_DENSE_MAX_DELTA=2)
+class DenseRetrievalIndexTests(IndexDirMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        embed = mock.patch.object(EmbeddingModelLoader, 'embed', side_effect=self.fake_embed)
+        self.embed = embed.start()
+        self.addCleanup(embed.stop)
+
+    @staticmethod
+    def fake_embed(texts, batch_size=32):
+        return np.stack([unit_vectors(1, seed=len(text))[0] for text in texts])
+
+    def add_passages(self, *texts):
+        document = RegulatoryDocument.objects.create(key=f"doc-{texts[0]}", title='Doc')
+        return [RegulatoryPassage.objects.create(document=document, position=i, text=t) for i, t in enumerate(texts)]
+
+    def test_adding_passages_before_a_build_does_nothing(self):
+        self.assertIsNone(DenseRetrievalIndex.add_passages([(1, 'text')]))
+        self.embed.assert_not_called()
+        self.assertEqual(DenseRetrievalIndex.version(), '')
+
+    def test_appends_embed_only_the_new_passages(self):
+        first = self.add_passages('a', 'bb')
+        DenseRetrievalIndex.rebuild()
+        version = DenseRetrievalIndex.version()
+        self.embed.reset_mock()
+
+        second = self.add_passages('ccc')
+        index = DenseRetrievalIndex.add_passages([(p.id, p.text) for p in second], deleted_ids=[first[0].id])
+
+        self.embed.assert_called_once_with(['ccc'], 64)
+        self.assertNotEqual(DenseRetrievalIndex.version(), version)
+        self.assertIs(DenseRetrievalIndex.get(), index)
+        self.assertEqual(len(index), 2)
+        self.assertEqual(index.search('ccc', k=1)[0][0], second[0].id)
+
+    def test_large_delta_is_compacted_without_re_embedding(self):
+        DenseRetrievalIndex.rebuild()
+        passages = self.add_passages('a', 'bb', 'ccc')
+        self.embed.reset_mock()
+
+        index = DenseRetrievalIndex.add_passages([(p.id, p.text) for p in passages])
+
+        self.assertEqual(self.embed.call_count, 1)
+        self.assertEqual(index.meta['delta_count'], 0)
+        self.assertEqual(len(index), 3)
+        builds = [d for d in os.listdir(self.index_dir) if d.startswith('dense-')]
+        self.assertEqual(len(builds), 2)
+
+    def test_publishing_keeps_the_live_and_previous_builds(self):
+        self.add_passages('a', 'bb')
+        # A build left by an older release, named so that it sorts after every numbered one
+        os.makedirs(os.path.join(self.index_dir, 'dense-20991231T235959-1-1'))
+        DenseRetrievalIndex.rebuild()
+        first = DenseRetrievalIndex.version()
+        DenseRetrievalIndex.rebuild()
+        second = DenseRetrievalIndex.version()
+        DenseRetrievalIndex.rebuild()
+
+        builds = sorted(d for d in os.listdir(self.index_dir) if d.startswith('dense-'))
+        self.assertEqual(builds, [second, DenseRetrievalIndex.version()])
+        self.assertLess(first, second)
+        self.assertEqual(len(DenseRetrievalIndex.get()), 2)
+
+
+class QABatcherTests(SimpleTestCase):
+    @staticmethod
+    def echo(calls):
+        def runner(inputs):
+            calls.append(inputs)
+            return [{'answer': i['context'], 'score': 1.0} for i in inputs]
+        return runner
+
+    def test_concurrent_questions_share_one_batch_and_get_their_own_results(self):
+        calls = []
+        batcher = QABatcher(max_batch_size=16, max_wait_ms=200, runner=self.echo(calls))
+
+        first = batcher.submit('q1', ['a', 'b'])
+        second = batcher.submit('q2', ['c'])
+
+        self.assertEqual([r['answer'] for r in first.result(5)], ['a', 'b'])
+        self.assertEqual([r['answer'] for r in second.result(5)], ['c'])
+        self.assertEqual(len(calls), 1)
+        self.assertEqual([i['question'] for i in calls[0]], ['q1', 'q1', 'q2'])
+
+    def test_full_batch_is_sent_without_waiting(self):
+        calls = []
+        batcher = QABatcher(max_batch_size=2, max_wait_ms=60000, runner=self.echo(calls))
+
+        self.assertEqual(len(batcher.answer('q', ['a', 'b'], timeout=5)), 2)
+        self.assertEqual(len(calls), 1)
+
+    def test_runner_errors_reach_every_caller_in_the_batch(self):
+        def runner(inputs):
+            raise RuntimeError('model crashed')
+        batcher = QABatcher(max_wait_ms=100, runner=runner)
+
+        futures = [batcher.submit('q1', ['a']), batcher.submit('q2', ['b'])]
+        for future in futures:
+            with self.assertRaisesRegex(RuntimeError, 'model crashed'):
+                future.result(5)
+
+    def test_timed_out_question_is_dropped_from_the_queue(self):
+        release, calls = threading.Event(), []
+
+        def runner(inputs):
+            calls.append([i['question'] for i in inputs])
+            release.wait(5)
+            return [{'answer': '', 'score': 0.0} for _ in inputs]
+        batcher = QABatcher(max_batch_size=1, runner=runner)
+
+        busy = batcher.submit('busy', ['a'])
+        with self.assertRaises(TimeoutError):
+            batcher.answer('late', ['b'], timeout=0.05)
+        after = batcher.submit('after', ['c'])
+        release.set()
+
+        busy.result(5)
+        after.result(5)
+        self.assertEqual(calls, [['busy'], ['after']])
+
+    def test_search_view_reports_a_busy_model_as_unavailable(self):
+        with mock.patch.object(NLPService, 'answer_question', side_effect=TimeoutError):
+            response = self.client.post(reverse('regulatory-search'), {'question': 'Travel rule?'})
+        self.assertEqual(response.status_code, 503)
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+@override_settings(CACHES=UNREACHABLE_CACHE)
+class AnswerCacheTests(SimpleTestCase):
+    def setUp(self):
+        caches['default'].clear()
+
+    def test_questions_are_normalized(self):
+        self.assertEqual(normalize_question('  What is   the TRAVEL rule?? '), 'what is the travel rule')
+        self.assertEqual(normalize_question('Ｔravel rule.'), 'travel rule')
+
+    def test_local_tier_is_a_bounded_lru(self):
+        answers = AnswerCache(max_entries=2)
+        answers.set('a', 'v1', 'A')
+        answers.set('b', 'v1', 'B')
+        answers.get('a', 'v1')
+        answers.set('c', 'v1', 'C')
+
+        self.assertEqual(answers.stats()['local_entries'], 2)
+        answers.get('b', 'v1')  # evicted locally, still in the shared cache
+        self.assertEqual(answers.stats()['shared_hits'], 1)
+
+    def test_shared_tier_serves_other_processes(self):
+        AnswerCache().set('What is MiCA?', 'v1', 'A regulation')
+        other = AnswerCache()
+
+        self.assertEqual(other.get('what is mica', 'v1'), 'A regulation')
+        self.assertEqual(other.get('what is mica', 'v1'), 'A regulation')
+        stats = other.stats()
+        self.assertEqual((stats['shared_hits'], stats['local_hits'], stats['misses']), (1, 1, 0))
+        self.assertEqual(stats['hit_rate'], 1.0)
+
+    def test_new_version_makes_old_answers_unreachable(self):
+        answers = AnswerCache()
+        answers.set('What is MiCA?', 'v1', 'A regulation')
+
+        self.assertIsNone(answers.get('What is MiCA?', 'v2'))
+        self.assertEqual(answers.stats()['misses'], 1)
+
+    def test_unreachable_shared_tier_falls_back_to_the_local_tier(self):
+        answers = AnswerCache(alias='down')
+        answers.set('What is MiCA?', 'v1', 'A regulation')
+
+        self.assertEqual(answers.get('What is MiCA?', 'v1'), 'A regulation')
+        self.assertIsNone(answers.get('What is DORA?', 'v1'))
+        stats = answers.stats()
+        self.assertEqual((stats['local_hits'], stats['misses'], stats['shared_errors']), (1, 1, 2))
+
+
+@override_settings(CACHES=UNREACHABLE_CACHE, NLP_DENSE_RETRIEVAL=False)
+class CachedAnswerTests(IndexDirMixin, SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        caches['default'].clear()
+        answer_cache._answer_cache = None
+        self.addCleanup(setattr, answer_cache, '_answer_cache', None)
+        patches = [
+            mock.patch.object(NLPService, 'retrieve_passages', return_value=['MiCA applies from June 2024.']),
+            mock.patch.object(NLPService, 'run_qa', return_value=[{'answer': 'June 2024', 'score': 0.9}]),
+        ]
+        self.run_qa = patches[1].start()
+        patches[0].start()
+        for patch in patches:
+            self.addCleanup(patch.stop)
+
+    def test_repeated_question_is_answered_from_the_cache(self):
+        self.assertEqual(NLPService.answer_question('When does MiCA apply?'), 'June 2024')
+        self.assertEqual(NLPService.answer_question('when does mica apply'), 'June 2024')
+        self.run_qa.assert_called_once()
+
+    def test_corpus_change_invalidates_cached_answers(self):
+        NLPService.answer_question('When does MiCA apply?')
+        with mock.patch.object(RetrievalIndex, 'version', return_value='new-build'):
+            NLPService.answer_question('When does MiCA apply?')
+        self.assertEqual(self.run_qa.call_count, 2)
+
+    @override_settings(NLP_ANSWER_CACHE_ALIAS='down')
+    def test_questions_are_answered_while_the_shared_cache_is_down(self):
+        self.assertEqual(NLPService.answer_question('When does MiCA apply?'), 'June 2024')
+        self.assertEqual(NLPService.answer_question('When does MiCA apply?'), 'June 2024')
+        self.run_qa.assert_called_once()
+
+    @override_settings(NLP_ANSWER_CACHE_ENABLED=False)
+    def test_disabled_cache_always_runs_the_model(self):
+        NLPService.answer_question('When does MiCA apply?')
+        NLPService.answer_question('When does MiCA apply?')
+        self.assertEqual(self.run_qa.call_count, 2)
+
+
+class FakeQAPipeline:
+    def __init__(self, answer):
+        import torch
+        self.model = torch.nn.Linear(2, 2)
+        self.answer = answer
+
+    def __call__(self, question, context, **kwargs):
+        return [{'answer': self.answer, 'score': 0.9} for _ in context]
+
+
+@override_settings(NLP_DENSE_RETRIEVAL=False)
+class QuantizationGuardrailTests(IndexDirMixin, SimpleTestCase):
+    def test_token_f1(self):
+        self.assertEqual(token_f1('June 2024', 'june 2024.'), 1.0)
+        self.assertEqual(token_f1('EUR 10,000', '24 hours'), 0.0)
+        self.assertAlmostEqual(token_f1('within 24 hours', '24 hours'), 0.8)
+        self.assertEqual(token_f1('', ''), 1.0)
+
+    def test_quantized_model_has_its_own_cache_identity(self):
+        self.assertNotEqual(QAModelLoader.model_id(quantized=True), QAModelLoader.model_id(quantized=False))
+        self.assertTrue(QAModelLoader.model_id(quantized=True).endswith('+int8'))
+
+    def run_benchmark(self, int8_answer):
+        pipelines = {False: FakeQAPipeline('June 2024'), True: FakeQAPipeline(int8_answer)}
+        out = StringIO()
+        with mock.patch.object(QAModelLoader, 'build_pipeline', side_effect=lambda quantized: pipelines[quantized]):
+            call_command('benchmark_qa_quantization', repeats=1, stdout=out)
+        return out.getvalue()
+
+    def test_agreeing_models_pass_the_guardrail(self):
+        output = self.run_benchmark('June 2024')
+        self.assertIn('exact 100%', output)
+        self.assertIn('within the agreement guardrail', output)
+
+    def test_diverging_models_fail_the_guardrail(self):
+        with self.assertRaisesRegex(CommandError, 'keep NLP_QA_QUANTIZED off'):
+            self.run_benchmark('the Travel Rule')
+
+
+@override_settings(NLP_DENSE_RETRIEVAL=False, NLP_PASSAGE_WORDS=10, NLP_PASSAGE_OVERLAP=2)
+class RegulatoryIngestTests(IndexDirMixin, TestCase):
+    TEXT = 'Crypto asset service providers report transfers above EUR 10,000 within 24 hours. ' * 3
+
+    def test_unchanged_document_is_not_reindexed(self):
+        document, status = RegulatoryCorpus.ingest_text('mica', 'MiCA', 'EU', self.TEXT)
+        self.assertEqual(status, 'created')
+        self.assertEqual(document.passages.count(), len(RetrievalIndex.get()))
+
+        with mock.patch.object(RetrievalIndex, 'add_passages') as add_passages:
+            _, status = RegulatoryCorpus.ingest_text('mica', 'MiCA', 'EU', self.TEXT)
+        self.assertEqual(status, 'unchanged')
+        add_passages.assert_not_called()
+
+    def test_changed_document_replaces_its_passages(self):
+        RegulatoryCorpus.ingest_text('mica', 'MiCA', 'EU', self.TEXT)
+        document, status = RegulatoryCorpus.ingest_text('mica', 'MiCA 2', 'EU', 'The travel rule applies.')
+
+        self.assertEqual(status, 'updated')
+        self.assertEqual(RegulatoryDocument.objects.get().title, 'MiCA 2')
+        self.assertEqual(len(RetrievalIndex.get()), 1)
+        self.assertEqual(NLPService.retrieve_passages('report transfers'), [])
+        self.assertEqual(NLPService.retrieve_passages('travel rule'), ['The travel rule applies.'])
+
+    def test_failed_index_update_is_retried_by_the_next_ingest(self):
+        with mock.patch.object(RetrievalIndex, 'add_passages', side_effect=OSError('disk full')):
+            with self.assertRaises(OSError):
+                RegulatoryCorpus.ingest_text('mica', 'MiCA', 'EU', self.TEXT)
+        self.assertEqual(RegulatoryDocument.objects.get().content_hash, '')
+
+        _, status = RegulatoryCorpus.ingest_text('mica', 'MiCA', 'EU', self.TEXT)
+        self.assertEqual(status, 'updated')
+        self.assertEqual(len(RetrievalIndex.get()), RegulatoryPassage.objects.count())
+
+    def test_upload_endpoint_reports_the_ingest_status(self):
+        def upload():
+            return self.client.post(reverse('regulatory-document-list'), {
+                'file': SimpleUploadedFile('mica.txt', self.TEXT.encode('utf-8')), 'source': 'EU',
+            })
+
+        first = upload()
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(first.json()['status'], 'created')
+        second = upload()
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.json()['status'], 'unchanged')
+        self.assertEqual(RegulatoryDocument.objects.get().key, 'mica.txt')
@@ -1,7 +1,10 @@
 from django.urls import path
-from .views import RegulatorySearchView
+from .views import RegulatorySearchView, QAModelReadinessView, AnswerCacheStatsView, RegulatoryDocumentList
 
 urlpatterns = [
     path('search/', RegulatorySearchView.as_view(), name='regulatory-search'),
+    path('ready/', QAModelReadinessView.as_view(), name='qa-model-ready'),
+    path('cache/stats/', AnswerCacheStatsView.as_view(), name='answer-cache-stats'),
+    path('documents/', RegulatoryDocumentList.as_view(), name='regulatory-document-list'),
 ]
 
@@ -1,7 +1,10 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-from .services import NLPService
+from .cache import get_answer_cache
+from .models import RegulatoryDocument
+from .serializers import RegulatoryDocumentSerializer
+from .services import NLPService, QAModelLoader, RegulatoryCorpus
 
 class RegulatorySearchView(APIView):
     """
@@ -15,5 +18,58 @@ class RegulatorySearchView(APIView):
                 {"error": "A 'question' field is required."},
                 status=status.HTTP_400_BAD_REQUEST
             )
-        answer = NLPService.answer_question(question)
-        return Response({"answer": answer}, status=status.HTTP_200_OK)
\ No newline at end of file
+        try:
+            answer = NLPService.answer_question(question)
+        except TimeoutError:
+            return Response(
+                {"error": "The QA model is busy; please retry shortly."},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE
+            )
+        return Response({"answer": answer}, status=status.HTTP_200_OK)
+
+class QAModelReadinessView(APIView):
+    """
+    Reports whether the QA model is loaded. Returns 503 until it is ready,
+    so load balancers can hold traffic back from a warming NLP server.
+    """
+    def get(self, request, *args, **kwargs):
+        model_status = QAModelLoader.status()
+        http_status = status.HTTP_200_OK if model_status["ready"] else status.HTTP_503_SERVICE_UNAVAILABLE
+        return Response(model_status, status=http_status)
+
+
+class AnswerCacheStatsView(APIView):
+    """
+    Reports hit rates of this process's answer cache.
+    """
+    def get(self, request, *args, **kwargs):
+        return Response(get_answer_cache().stats(), status=status.HTTP_200_OK)
+
+
+class RegulatoryDocumentList(APIView):
+    """
+    Lists stored regulatory documents, or ingests an uploaded text file.
+    Re-uploading an unchanged file is a no-op; a changed file replaces the
+    stored passages of the document with the same key.
+    """
+    def get(self, request, format=None):
+        documents = RegulatoryDocument.objects.order_by('-updated_at')
+        serializer = RegulatoryDocumentSerializer(documents, many=True)
+        return Response(serializer.data)
+
+    def post(self, request, format=None):
+        uploaded_file = request.FILES.get('file')
+        if uploaded_file is None:
+            return Response(
+                {"error": "A 'file' upload is required."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        document, result = RegulatoryCorpus.ingest_uploaded_file(
+            uploaded_file,
+            source=request.data.get('source', ''),
+            title=request.data.get('title') or None,
+            key=request.data.get('key') or None,
+        )
+        serializer = RegulatoryDocumentSerializer(document)
+        http_status = status.HTTP_201_CREATED if result == 'created' else status.HTTP_200_OK
+        return Response({"status": result, "document": serializer.data}, status=http_status)
@@ -1,3 +1,17 @@
 from django.contrib import admin
+from .models import KeyPair, DataKey
 
-# Register your models here.
+# Key material is never shown in the admin
+class KeyPairAdmin(admin.ModelAdmin):
+    list_display = ('id', 'algorithm', 'status', 'created_at', 'retired_at')
+    list_filter = ('status', 'algorithm')
+    exclude = ('public_key', 'wrapped_secret_key')
+
+
+class DataKeyAdmin(admin.ModelAdmin):
+    list_display = ('id', 'keypair', 'created_at')
+    exclude = ('encapsulated_key',)
+
+
+admin.site.register(KeyPair, KeyPairAdmin)
+admin.site.register(DataKey, DataKeyAdmin)
@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class PrivacyVaultConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'privacy_vault'
+
+    def ready(self):
+        # Resolve the KEM backend once, instead of probing for liboqs per call
+        from .kem import KEMBackend
+        KEMBackend.resolve()
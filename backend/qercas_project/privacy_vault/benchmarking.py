@@ -0,0 +1,28 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+
+def measure(operation, iterations: int, threads: int = 1) -> dict:
+    """
+    Runs `operation` `iterations` times across `threads` threads after one
+    warm-up call. Returns throughput and per-call latency percentiles.
+    """
+    operation()
+
+    def timed(_):
+        start = time.perf_counter()
+        operation()
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    if threads == 1:
+        latencies = [timed(i) for i in range(iterations)]
+    else:
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            latencies = list(pool.map(timed, range(iterations)))
+    elapsed = time.perf_counter() - start
+
+    p50, p99 = np.percentile(np.asarray(latencies) * 1e6, [50, 99])
+    return {"ops_per_sec": iterations / elapsed, "p50_us": float(p50), "p99_us": float(p99)}
@@ -0,0 +1,193 @@
+import base64
+import hmac
+import hashlib
+
+from Crypto.Hash import SHA256
+from Crypto.Protocol.KDF import HKDF
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from django.db import models
+from django.db.models.query_utils import DeferredAttribute
+
+from .keystore import Envelope, KeyStore
+
+_blind_index_key = None
+
+
+def blind_index_key() -> bytes:
+    global _blind_index_key
+    if _blind_index_key is None:
+        configured = getattr(settings, 'PRIVACY_VAULT_BLIND_INDEX_KEY', '')
+        if configured:
+            _blind_index_key = base64.b64decode(configured)
+        else:
+            _blind_index_key = HKDF(KeyStore.master_key(), 32, b"", SHA256, context=b"qercas-vault-blind-index")
+    return _blind_index_key
+
+
+def blind_index(value: str, domain: str) -> str:
+    """
+    Keyed HMAC of a plaintext value, used for equality lookups on encrypted
+    columns. Values hash alike only within the same domain, so e.g. source
+    and destination accounts (both domain 'account') can be joined.
+    """
+    mac = hmac.new(blind_index_key(), f"{domain}\x00{value}".encode('utf-8'), hashlib.sha256)
+    return mac.hexdigest()[:32]
+
+
+def associated_data(model_label: str, field_name: str, pk) -> bytes:
+    """Binds a sealed value to its row and column, so it cannot be moved."""
+    return f"{model_label}.{field_name}:{pk}".encode('utf-8')
+
+
+class OpenedValue(str):
+    """
+    Plaintext read from an encrypted column. It keeps the envelope it was
+    opened from, which raw saves such as loaddata write back unchanged.
+    """
+
+    def __new__(cls, value, envelope):
+        opened = super().__new__(cls, value)
+        opened.envelope = envelope
+        return opened
+
+
+class SealedAttribute(DeferredAttribute):
+    """
+    Holds the sealed envelope as loaded from the database and decrypts it
+    on first access only, so rows that are never rendered are never decrypted.
+    """
+
+    def __get__(self, instance, cls=None):
+        if instance is None:
+            return self
+        value = super().__get__(instance, cls)
+        if isinstance(value, bytes):
+            value = self.field.open(instance, value)
+            instance.__dict__[self.field.attname] = value
+        return value
+
+    def __set__(self, instance, value):
+        instance.__dict__[self.field.attname] = value
+
+
+class EncryptedTextField(models.BinaryField):
+    """
+    A text field stored as a privacy_vault envelope. Assign and read plain
+    strings; the column only ever holds AES-GCM ciphertext bound to the row.
+    Pair it with a BlindIndexField for lookups.
+    """
+    descriptor_class = SealedAttribute
+
+    def __init__(self, *args, max_length=None, **kwargs):
+        # max_length limits the plaintext and is enforced by forms/serializers
+        self.plaintext_max_length = max_length
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        if self.plaintext_max_length is not None:
+            kwargs['max_length'] = self.plaintext_max_length
+        return name, path, args, kwargs
+
+    def associated_data(self, instance) -> bytes:
+        return associated_data(self.model._meta.label, self.name, instance.pk)
+
+    def open(self, instance, envelope: bytes) -> str:
+        return OpenedValue(Envelope.open(envelope, self.associated_data(instance)).decode('utf-8'), envelope)
+
+    def from_db_value(self, value, expression, connection):
+        return bytes(value) if value is not None else None
+
+    def seal(self, instance, value: str) -> bytes:
+        return Envelope.seal(value.encode('utf-8'), self.associated_data(instance))
+
+    def pre_save(self, model_instance, add):
+        value = model_instance.__dict__.get(self.attname)
+        if isinstance(value, str):
+            return self.seal(model_instance, value)
+        return value
+
+    def get_prep_value(self, value):
+        # Only pre_save can seal, as the envelope is bound to the row's pk;
+        # QuerySet.update() and lookups would otherwise write or match plaintext.
+        # Raw saves skip pre_save and pass what they read back in.
+        if isinstance(value, OpenedValue):
+            value = value.envelope
+        elif isinstance(value, str):
+            raise TypeError(
+                f"{self.model._meta.label}.{self.name} only takes sealed envelopes here; "
+                f"assign the plaintext to an instance and save() it instead"
+            )
+        return super().get_prep_value(value)
+
+    def to_python(self, value):
+        if isinstance(value, str):
+            return base64.b64decode(value.encode('ascii'))
+        return bytes(value) if isinstance(value, memoryview) else value
+
+    def value_to_string(self, obj):
+        # Serialized as the base64 envelope, so fixtures never hold plaintext
+        # and loaddata restores the row as it was
+        if self.attname in obj.__dict__:
+            value = obj.__dict__[self.attname]
+        else:
+            value = getattr(obj, self.attname)
+        if isinstance(value, OpenedValue):
+            value = value.envelope
+        elif isinstance(value, str):
+            value = self.seal(obj, value)
+        return base64.b64encode(value).decode('ascii') if value is not None else ''
+
+
+class BlindIndexField(models.CharField):
+    """Keyed HMAC of another field's plaintext, kept up to date on save."""
+
+    def __init__(self, *args, source=None, domain=None, **kwargs):
+        self.source = source
+        self.domain = domain or source
+        kwargs.setdefault('max_length', 32)
+        kwargs.setdefault('db_index', True)
+        kwargs.setdefault('editable', False)
+        kwargs.setdefault('default', '')
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        kwargs['source'] = self.source
+        kwargs['domain'] = self.domain
+        return name, path, args, kwargs
+
+    def pre_save(self, model_instance, add):
+        value = model_instance.__dict__.get(self.source)
+        if isinstance(value, str):
+            setattr(model_instance, self.attname, blind_index(value, self.domain))
+        return getattr(model_instance, self.attname)
+
+
+def decrypt_fields(instances, field_names):
+    """
+    Decrypts the named encrypted fields of many instances with one batch
+    call, so rendering a list costs one data key lookup per key rather than
+    per row. Names that are not encrypted fields are ignored.
+    """
+    pending = []
+    for instance in instances:
+        for name in field_names:
+            try:
+                field = instance._meta.get_field(name)
+            except FieldDoesNotExist:
+                continue
+            if not isinstance(field, EncryptedTextField):
+                continue
+            value = instance.__dict__.get(field.attname)
+            if isinstance(value, bytes):
+                pending.append((instance, field, value))
+    if not pending:
+        return
+    plaintexts = Envelope.open_many(
+        [envelope for _, _, envelope in pending],
+        [field.associated_data(instance) for instance, field, _ in pending],
+    )
+    for (instance, field, envelope), plaintext in zip(pending, plaintexts):
+        instance.__dict__[field.attname] = OpenedValue(plaintext.decode('utf-8'), envelope)
@@ -0,0 +1,149 @@
+import logging
+import queue
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class KEMBackend:
+    """
+    Resolves once per process whether liboqs provides the PQC KEM, and caches
+    the answer, so hosts without liboqs do not retry the import (or log a
+    warning) on every operation.
+    """
+    ALGORITHM = "Kyber768"  # A NIST-selected PQC algorithm
+    _resolved = None
+    _lock = threading.Lock()
+
+    @classmethod
+    def resolve(cls) -> dict:
+        if cls._resolved is None:
+            with cls._lock:
+                if cls._resolved is None:
+                    cls._resolved = cls._probe()
+                    if cls._resolved['pq']:
+                        logger.info(f"PQC backend: liboqs {cls._resolved['detail']}")
+                    else:
+                        logger.warning(f"PQC not available ({cls._resolved['detail']}), using classical fallback")
+        return cls._resolved
+
+    @classmethod
+    def _probe(cls) -> dict:
+        try:
+            import oqs
+        # liboqs-python without the native library tries to build it on import
+        # and then raises SystemExit, which must not take the worker down
+        except (ImportError, RuntimeError, SystemExit) as e:
+            detail = 'liboqs native library not available' if isinstance(e, SystemExit) else str(e)
+            return {'pq': False, 'algorithm': cls.ALGORITHM, 'detail': detail}
+        enabled = oqs.get_enabled_kem_mechanisms()
+        if cls.ALGORITHM not in enabled:
+            return {'pq': False, 'algorithm': cls.ALGORITHM, 'detail': f"{cls.ALGORITHM} not enabled in liboqs"}
+        return {'pq': True, 'algorithm': cls.ALGORITHM, 'detail': getattr(oqs, 'oqs_version', lambda: '')()}
+
+    @classmethod
+    def pq_available(cls) -> bool:
+        return cls.resolve()['pq']
+
+
+class _SecretContext:
+    """A decapsulation context for one keypair; `freed` is set under `lock` on eviction."""
+    __slots__ = ('kem', 'lock', 'freed')
+
+    def __init__(self, kem):
+        self.kem = kem
+        self.lock = threading.Lock()
+        self.freed = False
+
+    def free(self):
+        # Waits for a decapsulation in progress on another thread
+        with self.lock:
+            self.kem.free()
+            self.freed = True
+
+
+class KEMContextPool:
+    """
+    Reusable oqs.KeyEncapsulation contexts. Contexts without a secret key are
+    interchangeable and serve keygen and encapsulation; decapsulation
+    contexts are kept per keypair. A context is used by one thread at a time.
+    """
+
+    def __init__(self, algorithm=KEMBackend.ALGORITHM, size=4, max_secret_contexts=16):
+        self.algorithm = algorithm
+        self._idle = queue.LifoQueue(maxsize=size)
+        self._secret_contexts = OrderedDict()  # keypair id -> _SecretContext
+        self._max_secret_contexts = max_secret_contexts
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def context(self):
+        import oqs
+        try:
+            kem = self._idle.get_nowait()
+        except queue.Empty:
+            kem = oqs.KeyEncapsulation(self.algorithm)
+        try:
+            yield kem
+        finally:
+            try:
+                self._idle.put_nowait(kem)
+            except queue.Full:
+                kem.free()
+
+    def ciphertext_length(self) -> int:
+        with self.context() as kem:
+            return kem.details['length_ciphertext']
+
+    def generate_keypair(self):
+        """Returns (public_key, secret_key) using a fresh context, since keygen binds the secret to it."""
+        import oqs
+        with oqs.KeyEncapsulation(self.algorithm) as kem:
+            return kem.generate_keypair(), kem.export_secret_key()
+
+    def encapsulate(self, public_key):
+        with self.context() as kem:
+            return kem.encap_secret(public_key)
+
+    def decapsulate(self, keypair_id, secret_key, ciphertext):
+        import oqs
+        if keypair_id is None:
+            with oqs.KeyEncapsulation(self.algorithm, secret_key) as kem:
+                return kem.decap_secret(ciphertext)
+        evicted = []
+        with self._lock:
+            entry = self._secret_contexts.get(keypair_id)
+            if entry is None:
+                entry = _SecretContext(oqs.KeyEncapsulation(self.algorithm, secret_key))
+                self._secret_contexts[keypair_id] = entry
+                while len(self._secret_contexts) > self._max_secret_contexts:
+                    evicted.append(self._secret_contexts.popitem(last=False)[1])
+            self._secret_contexts.move_to_end(keypair_id)
+        for old in evicted:
+            old.free()
+        with entry.lock:
+            if not entry.freed:
+                return entry.kem.decap_secret(ciphertext)
+        # Evicted between the lookup and taking its lock
+        with oqs.KeyEncapsulation(self.algorithm, secret_key) as kem:
+            return kem.decap_secret(ciphertext)
+
+
+_kem_pool = None
+_kem_pool_lock = threading.Lock()
+
+
+def get_kem_pool():
+    """Returns the process-wide KEMContextPool, or None without liboqs."""
+    global _kem_pool
+    if not KEMBackend.pq_available():
+        return None
+    if _kem_pool is None:
+        with _kem_pool_lock:
+            if _kem_pool is None:
+                _kem_pool = KEMContextPool(size=getattr(settings, 'PRIVACY_VAULT_KEM_WORKERS', 2) * 2)
+    return _kem_pool
@@ -0,0 +1,328 @@
+import base64
+import logging
+import os
+import struct
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from Crypto.Cipher import AES
+from Crypto.Hash import SHA256
+from Crypto.Protocol.DH import key_agreement, import_x25519_private_key, import_x25519_public_key
+from Crypto.Protocol.KDF import HKDF
+from Crypto.PublicKey import ECC
+from Crypto.Random import get_random_bytes
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.utils import timezone
+
+from .kem import KEMBackend, get_kem_pool
+from .models import KeyPair, DataKey
+
+logger = logging.getLogger(__name__)
+
+_X25519_KEY_BYTES = 32
+
+
+def _identity(secret):
+    return secret
+
+
+class HybridKEM:
+    """
+    Kyber768 combined with X25519. Both shared secrets feed one HKDF, so the
+    derived key holds as long as either primitive does. When liboqs is not
+    installed the Kyber half is left out and the keypair is X25519 only.
+
+    Key and encapsulation blobs are the X25519 part (32 bytes) followed by
+    the Kyber part, if any.
+    """
+    PQ_ALGORITHM = KEMBackend.ALGORITHM
+
+    @staticmethod
+    def algorithm_name(pq: bool) -> str:
+        return f"{HybridKEM.PQ_ALGORITHM}+X25519" if pq else "X25519"
+
+    @staticmethod
+    def generate_keypair():
+        """Returns (algorithm, public_key, secret_key)."""
+        pool = get_kem_pool()
+        classical = ECC.generate(curve='curve25519')
+        public_key = classical.public_key().export_key(format='raw')
+        secret_key = classical.seed
+        if pool is not None:
+            pq_public_key, pq_secret_key = pool.generate_keypair()
+            public_key += pq_public_key
+            secret_key += pq_secret_key
+        return HybridKEM.algorithm_name(pool is not None), public_key, secret_key
+
+    @staticmethod
+    def _pool():
+        pool = get_kem_pool()
+        if pool is None:
+            raise RuntimeError(f"Data was sealed with {HybridKEM.PQ_ALGORITHM} but liboqs is not available")
+        return pool
+
+    @staticmethod
+    def _derive(classical_secret, pq_secret, encapsulation):
+        return HKDF(classical_secret + pq_secret, 32, encapsulation, SHA256, context=b"qercas-vault-data-key")
+
+    @staticmethod
+    def encapsulate(algorithm, public_key):
+        """Returns (encapsulation, shared_key) for the given public key."""
+        ephemeral = ECC.generate(curve='curve25519')
+        classical_secret = key_agreement(
+            eph_priv=ephemeral,
+            static_pub=import_x25519_public_key(public_key[:_X25519_KEY_BYTES]),
+            kdf=_identity,
+        )
+        encapsulation = ephemeral.public_key().export_key(format='raw')
+        pq_secret = b""
+        if algorithm != "X25519":
+            pq_ciphertext, pq_secret = HybridKEM._pool().encapsulate(public_key[_X25519_KEY_BYTES:])
+            encapsulation += pq_ciphertext
+        return encapsulation, HybridKEM._derive(classical_secret, pq_secret, encapsulation)
+
+    @staticmethod
+    def decapsulate(algorithm, secret_key, encapsulation, keypair_id=None):
+        """Recovers the shared key from an encapsulation."""
+        classical_secret = key_agreement(
+            static_priv=import_x25519_private_key(secret_key[:_X25519_KEY_BYTES]),
+            eph_pub=import_x25519_public_key(encapsulation[:_X25519_KEY_BYTES]),
+            kdf=_identity,
+        )
+        pq_secret = b""
+        if algorithm != "X25519":
+            pq_secret = HybridKEM._pool().decapsulate(
+                keypair_id, secret_key[_X25519_KEY_BYTES:], encapsulation[_X25519_KEY_BYTES:]
+            )
+        return HybridKEM._derive(classical_secret, pq_secret, encapsulation)
+
+
+class KeyStore:
+    """
+    Long-lived, rotatable KEM keypairs and the AES-256 data keys derived
+    from them.
+
+    A process encapsulates once against the active keypair and reuses the
+    resulting data key for every payload until the rotation window closes,
+    so encrypting an item costs one AES-GCM call rather than a keygen and
+    an encapsulation. Data keys are recovered for decryption by
+    decapsulating their stored encapsulation, and kept in a bounded cache.
+    """
+    _lock = threading.Lock()
+    _encapsulate_lock = threading.Lock()
+    _current = None          # (data_key_id, key, created_monotonic, uses)
+    _current_pid = None
+    _keys = OrderedDict()    # data_key_id -> key, for decryption
+    _master_key = None
+
+    @classmethod
+    def master_key(cls) -> bytes:
+        """
+        The key that wraps stored KEM secret keys, from PRIVACY_VAULT_MASTER_KEY.
+        Only a DEBUG deployment may run without one; it then derives a key from
+        SECRET_KEY, which makes every stored keypair as weak as that setting.
+        """
+        if cls._master_key is None:
+            configured = getattr(settings, 'PRIVACY_VAULT_MASTER_KEY', '')
+            if configured:
+                cls._master_key = base64.b64decode(configured)
+            elif not settings.DEBUG:
+                raise ImproperlyConfigured(
+                    "PRIVACY_VAULT_MASTER_KEY must be set to a base64-encoded 32-byte key when DEBUG is off"
+                )
+            else:
+                logger.warning(
+                    "PRIVACY_VAULT_MASTER_KEY is not set: wrapping vault keys with a key derived from SECRET_KEY. "
+                    "Anyone with SECRET_KEY can decrypt the vault. Never run like this outside development."
+                )
+                cls._master_key = HKDF(settings.SECRET_KEY.encode('utf-8'), 32, b"", SHA256, context=b"qercas-vault-master-key")
+        return cls._master_key
+
+    @classmethod
+    def _wrap(cls, secret_key: bytes) -> bytes:
+        nonce = get_random_bytes(12)
+        cipher = AES.new(cls.master_key(), AES.MODE_GCM, nonce=nonce)
+        ciphertext, tag = cipher.encrypt_and_digest(secret_key)
+        return nonce + tag + ciphertext
+
+    @classmethod
+    def _unwrap(cls, wrapped: bytes) -> bytes:
+        wrapped = bytes(wrapped)
+        cipher = AES.new(cls.master_key(), AES.MODE_GCM, nonce=wrapped[:12])
+        return cipher.decrypt_and_verify(wrapped[28:], wrapped[12:28])
+
+    @classmethod
+    def rotate_keypair(cls) -> KeyPair:
+        """Generates a new active keypair and retires the previous ones."""
+        algorithm, public_key, secret_key = HybridKEM.generate_keypair()
+        with transaction.atomic():
+            KeyPair.objects.filter(status=KeyPair.Status.ACTIVE).update(
+                status=KeyPair.Status.RETIRED, retired_at=timezone.now()
+            )
+            keypair = KeyPair.objects.create(
+                algorithm=algorithm,
+                public_key=public_key,
+                wrapped_secret_key=cls._wrap(secret_key),
+            )
+        with cls._lock:
+            cls._current = None
+        logger.info(f"Rotated vault keypair: #{keypair.pk} ({algorithm})")
+        return keypair
+
+    @classmethod
+    def active_keypair(cls) -> KeyPair:
+        """Returns the active keypair, rotating it once it is too old."""
+        keypair = KeyPair.objects.filter(status=KeyPair.Status.ACTIVE).order_by('-created_at').first()
+        max_age = timedelta(days=getattr(settings, 'PRIVACY_VAULT_KEYPAIR_ROTATION_DAYS', 90))
+        if keypair is None or timezone.now() - keypair.created_at > max_age:
+            keypair = cls.rotate_keypair()
+        return keypair
+
+    @classmethod
+    def current_data_key(cls, uses: int = 1):
+        """
+        Returns (data_key_id, key) for encrypting `uses` payloads. A new data
+        key is encapsulated when the rotation window or use limit is reached.
+        """
+        current = cls._take_current(uses)
+        if current is not None:
+            return current
+        # One thread encapsulates; others arriving meanwhile reuse its key
+        with cls._encapsulate_lock:
+            current = cls._take_current(uses)
+            if current is not None:
+                return current
+            keypair = cls.active_keypair()
+            encapsulation, key = HybridKEM.encapsulate(keypair.algorithm, bytes(keypair.public_key))
+            data_key = DataKey.objects.create(keypair=keypair, encapsulated_key=encapsulation)
+            with cls._lock:
+                cls._current = (data_key.pk, key, time.monotonic(), uses)
+                cls._current_pid = os.getpid()
+                cls._remember(data_key.pk, key)
+        return data_key.pk, key
+
+    @classmethod
+    def _take_current(cls, uses):
+        window = getattr(settings, 'PRIVACY_VAULT_DATA_KEY_ROTATION_SECONDS', 3600)
+        max_uses = getattr(settings, 'PRIVACY_VAULT_DATA_KEY_MAX_USES', 2 ** 20)
+        with cls._lock:
+            current = cls._current
+            # Forked workers get their own data key and usage count
+            if (current is not None and cls._current_pid == os.getpid()
+                    and time.monotonic() - current[2] < window and current[3] + uses <= max_uses):
+                cls._current = (current[0], current[1], current[2], current[3] + uses)
+                return current[0], current[1]
+        return None
+
+    @classmethod
+    def data_key(cls, data_key_id: int) -> bytes:
+        """Returns the AES key for a stored data key, decapsulating it if needed."""
+        with cls._lock:
+            key = cls._keys.get(data_key_id)
+            if key is not None:
+                cls._keys.move_to_end(data_key_id)
+                return key
+        data_key = DataKey.objects.select_related('keypair').get(pk=data_key_id)
+        keypair = data_key.keypair
+        key = HybridKEM.decapsulate(
+            keypair.algorithm, cls._unwrap(keypair.wrapped_secret_key), bytes(data_key.encapsulated_key),
+            keypair_id=keypair.pk,
+        )
+        with cls._lock:
+            cls._remember(data_key_id, key)
+        return key
+
+    @classmethod
+    def _remember(cls, data_key_id, key):
+        cls._keys[data_key_id] = key
+        cls._keys.move_to_end(data_key_id)
+        while len(cls._keys) > getattr(settings, 'PRIVACY_VAULT_DATA_KEY_CACHE_SIZE', 256):
+            cls._keys.popitem(last=False)
+
+
+class Envelope:
+    """
+    Envelope layout: version (1 byte), data key id (8 bytes), nonce
+    (12 bytes), GCM tag (16 bytes), ciphertext.
+    """
+    VERSION = 1
+    HEADER = struct.Struct(">BQ12s16s")
+
+    @staticmethod
+    def _seal_with(data_key_id, key, plaintext, associated_data=b""):
+        nonce = get_random_bytes(12)
+        cipher = AES.new(key, AES.MODE_GCM, nonce=nonce)
+        cipher.update(associated_data)
+        ciphertext, tag = cipher.encrypt_and_digest(plaintext)
+        return Envelope.HEADER.pack(Envelope.VERSION, data_key_id, nonce, tag) + ciphertext
+
+    @staticmethod
+    def _open_with(key, envelope, associated_data=b""):
+        _, _, nonce, tag = Envelope.HEADER.unpack_from(envelope)
+        cipher = AES.new(key, AES.MODE_GCM, nonce=nonce)
+        cipher.update(associated_data)
+        return cipher.decrypt_and_verify(memoryview(envelope)[Envelope.HEADER.size:], tag)
+
+    @staticmethod
+    def data_key_id(envelope) -> int:
+        version, data_key_id, _, _ = Envelope.HEADER.unpack_from(envelope)
+        if version != Envelope.VERSION:
+            raise ValueError(f"Unsupported envelope version: {version}")
+        return data_key_id
+
+    @staticmethod
+    def seal(plaintext: bytes, associated_data: bytes = b"") -> bytes:
+        data_key_id, key = KeyStore.current_data_key()
+        return Envelope._seal_with(data_key_id, key, plaintext, associated_data)
+
+    @staticmethod
+    def open(envelope: bytes, associated_data: bytes = b"") -> bytes:
+        key = KeyStore.data_key(Envelope.data_key_id(envelope))
+        return Envelope._open_with(key, envelope, associated_data)
+
+    @staticmethod
+    def _map(function, args, total_bytes):
+        # AES-GCM runs outside the GIL, so large batches are spread over threads
+        workers = getattr(settings, 'PRIVACY_VAULT_BATCH_WORKERS', 4)
+        if workers > 1 and total_bytes >= getattr(settings, 'PRIVACY_VAULT_PARALLEL_MIN_BYTES', 1024 * 1024):
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                return list(pool.map(function, *args))
+        return list(map(function, *args))
+
+    @staticmethod
+    def seal_many(plaintexts, associated_data=None) -> list:
+        """
+        Seals a list of payloads under one data key lookup.
+        `associated_data` is either None or a list aligned with `plaintexts`.
+        """
+        if not plaintexts:
+            return []
+        data_key_id, key = KeyStore.current_data_key(uses=len(plaintexts))
+        associated_data = associated_data or [b""] * len(plaintexts)
+
+        def seal(plaintext, aad):
+            return Envelope._seal_with(data_key_id, key, plaintext, aad)
+
+        return Envelope._map(seal, (plaintexts, associated_data), sum(len(p) for p in plaintexts))
+
+    @staticmethod
+    def open_many(envelopes, associated_data=None) -> list:
+        """Opens a list of envelopes, resolving each distinct data key once."""
+        if not envelopes:
+            return []
+        keys = {}
+        for envelope in envelopes:
+            data_key_id = Envelope.data_key_id(envelope)
+            if data_key_id not in keys:
+                keys[data_key_id] = KeyStore.data_key(data_key_id)
+        associated_data = associated_data or [b""] * len(envelopes)
+
+        def open_one(envelope, aad):
+            return Envelope._open_with(keys[Envelope.data_key_id(envelope)], envelope, aad)
+
+        return Envelope._map(open_one, (envelopes, associated_data), sum(len(e) for e in envelopes))
@@ -0,0 +1,127 @@
+import contextlib
+import io
+import os
+
+from django.core.management.base import BaseCommand
+from privacy_vault.benchmarking import measure
+from privacy_vault.kem import KEMBackend, get_kem_pool
+from privacy_vault.keystore import Envelope, HybridKEM, KeyStore
+from privacy_vault.services import CryptoService
+
+
+def _int_list(value):
+    return [int(v) for v in value.split(',') if v]
+
+
+class Command(BaseCommand):
+    help = (
+        'Micro-benchmarks the vault cryptography: KEM keygen/encapsulate/decapsulate, '
+        'the legacy per-transaction path and AES-CBC fallback, envelope encryption, '
+        'and the batch and streaming modes. Reports ops/sec and p50/p99 latency.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=200)
+        parser.add_argument('--sizes', type=_int_list, default=[64, 1024, 64 * 1024],
+                            help='Comma-separated payload sizes in bytes')
+        parser.add_argument('--threads', type=_int_list, default=[1, 4],
+                            help='Comma-separated thread counts')
+        parser.add_argument('--batch-size', type=int, default=256)
+        parser.add_argument('--stream-mb', type=int, default=16)
+
+    def handle(self, *args, **options):
+        backend = KEMBackend.resolve()
+        self.stdout.write(
+            f"KEM backend: {'liboqs ' + backend['algorithm'] if backend['pq'] else 'classical fallback'} "
+            f"({backend['detail']})"
+        )
+        self.stdout.write(f"{'case':<28}{'size':>9}{'threads':>9}{'ops/s':>12}{'p50 us':>11}{'p99 us':>11}")
+
+        iterations = options['iterations']
+        for threads in options['threads']:
+            self._kem_cases(iterations, threads)
+            for size in options['sizes']:
+                self._payload_cases(iterations, threads, size, options['batch_size'])
+        self._stream_cases(options['stream_mb'])
+        self.stdout.write("Batch rows report records/s; their latencies are per batch call.")
+
+    def _report(self, case, size, threads, result, unit_bytes=None):
+        line = (
+            f"{case:<28}{size:>9}{threads:>9}{result['ops_per_sec']:>12.1f}"
+            f"{result['p50_us']:>11.1f}{result['p99_us']:>11.1f}"
+        )
+        if unit_bytes:
+            line += f"  ({result['ops_per_sec'] * unit_bytes / 1e6:.1f} MB/s)"
+        self.stdout.write(line)
+
+    def _kem_cases(self, iterations, threads):
+        algorithm, public_key, secret_key = HybridKEM.generate_keypair()
+        encapsulation, _ = HybridKEM.encapsulate(algorithm, public_key)
+        cases = [
+            (f'{algorithm} keygen', HybridKEM.generate_keypair),
+            (f'{algorithm} encapsulate', lambda: HybridKEM.encapsulate(algorithm, public_key)),
+            (f'{algorithm} decapsulate', lambda: HybridKEM.decapsulate(algorithm, secret_key, encapsulation)),
+        ]
+        pool = get_kem_pool()
+        if pool is not None:
+            pq_public, pq_secret = pool.generate_keypair()
+            pq_ciphertext, _ = pool.encapsulate(pq_public)
+            cases += [
+                ('Kyber768 keygen', pool.generate_keypair),
+                ('Kyber768 encapsulate', lambda: pool.encapsulate(pq_public)),
+                ('Kyber768 decapsulate', lambda: pool.decapsulate(None, pq_secret, pq_ciphertext)),
+            ]
+        for case, operation in cases:
+            self._report(case, 0, threads, measure(operation, iterations, threads))
+
+    def _payload_cases(self, iterations, threads, size, batch_size):
+        payload = os.urandom(size)
+        text = payload.hex()[:size]
+        aes_key = os.urandom(32)
+        KeyStore.current_data_key(0)
+        envelope = Envelope.seal(payload)
+
+        def legacy_per_transaction():
+            # What analyze_transaction_risk used to do for every BLOCKED transaction
+            public_key, secret_key = CryptoService.generate_pqc_keys()
+            CryptoService.decrypt_pqc(secret_key, CryptoService.encrypt_pqc(public_key, text))
+
+        def aes_cbc_fallback():
+            CryptoService.decrypt_pqc(aes_key, CryptoService.encrypt_pqc(aes_key, text))
+
+        batch = [payload] * batch_size
+        sealed_batch = Envelope.seal_many(batch)
+        cases = [
+            ('legacy per-transaction', legacy_per_transaction, 1),
+            ('AES-CBC fallback', aes_cbc_fallback, 1),
+            ('envelope seal', lambda: Envelope.seal(payload), 1),
+            ('envelope open', lambda: Envelope.open(envelope), 1),
+            (f'batch seal x{batch_size}', lambda: Envelope.seal_many(batch), batch_size),
+            (f'batch open x{batch_size}', lambda: Envelope.open_many(sealed_batch), batch_size),
+        ]
+        # The legacy helpers print on every call
+        with contextlib.redirect_stdout(io.StringIO()):
+            results = [
+                (case, measure(operation, max(3, iterations // per_call), threads), per_call)
+                for case, operation, per_call in cases
+            ]
+        for case, result, per_call in results:
+            if per_call > 1:
+                result = dict(result, ops_per_sec=result['ops_per_sec'] * per_call)
+            self._report(case, size, threads, result, unit_bytes=size)
+
+    def _stream_cases(self, stream_mb):
+        data = memoryview(os.urandom(stream_mb * 1024 * 1024))
+        sealed = io.BytesIO()
+        CryptoService.encrypt_stream(data, sealed)
+        sealed = memoryview(sealed.getvalue())
+
+        class _Discard:
+            def write(self, chunk):
+                return len(chunk)
+
+        for case, operation in (
+            ('stream seal', lambda: CryptoService.encrypt_stream(data, _Discard())),
+            ('stream open', lambda: CryptoService.decrypt_stream(sealed, _Discard())),
+        ):
+            self._report(case, len(data), 1, measure(operation, 5), unit_bytes=len(data))
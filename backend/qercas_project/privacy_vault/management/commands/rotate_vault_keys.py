@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from privacy_vault.services import CryptoService
+
+
+class Command(BaseCommand):
+    help = 'Generates a new active vault keypair. Data encrypted under retired keypairs stays decryptable.'
+
+    def handle(self, *args, **options):
+        keypair = CryptoService.rotate_keys()
+        self.stdout.write(self.style.SUCCESS(f"Active keypair is now #{keypair.pk} ({keypair.algorithm})."))
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:22
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='KeyPair',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('algorithm', models.CharField(max_length=50)),
+                ('public_key', models.BinaryField()),
+                ('wrapped_secret_key', models.BinaryField()),
+                ('status', models.CharField(choices=[('ACTIVE', 'Active'), ('RETIRED', 'Retired')], db_index=True, default='ACTIVE', max_length=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('retired_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DataKey',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('encapsulated_key', models.BinaryField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('keypair', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='data_keys', to='privacy_vault.keypair')),
+            ],
+        ),
+    ]
@@ -1,3 +1,41 @@
 from django.db import models
 
-# Create your models here.
+
+class KeyPair(models.Model):
+    """
+    A long-lived hybrid KEM keypair. The secret half is stored wrapped
+    under the vault master key. Retired keypairs are kept so that data
+    encrypted under them can still be decrypted.
+    """
+
+    class Status(models.TextChoices):
+        ACTIVE = 'ACTIVE', 'Active'
+        RETIRED = 'RETIRED', 'Retired'
+
+    algorithm = models.CharField(max_length=50)
+    public_key = models.BinaryField()
+    wrapped_secret_key = models.BinaryField()
+    status = models.CharField(
+        max_length=10,
+        choices=Status.choices,
+        default=Status.ACTIVE,
+        db_index=True
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    retired_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.algorithm} keypair #{self.pk} [{self.status}]"
+
+
+class DataKey(models.Model):
+    """
+    One KEM encapsulation against a keypair. The AES data key derived from it
+    is never stored; it is recovered by decapsulating `encapsulated_key`.
+    """
+    keypair = models.ForeignKey(KeyPair, on_delete=models.PROTECT, related_name='data_keys')
+    encapsulated_key = models.BinaryField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Data key #{self.pk} under keypair #{self.keypair_id}"
@@ -0,0 +1,16 @@
+from django.db import models
+from rest_framework import serializers
+
+from .fields import decrypt_fields
+
+
+class DecryptingListSerializer(serializers.ListSerializer):
+    """
+    Decrypts, in one batch, the encrypted fields the child serializer
+    actually renders before the rows are serialized one by one.
+    """
+
+    def to_representation(self, data):
+        instances = list(data.all() if isinstance(data, models.manager.BaseManager) else data)
+        decrypt_fields(instances, [field.source for field in self.child._readable_fields])
+        return super().to_representation(instances)
@@ -3,6 +3,9 @@ from Crypto.Cipher import AES
 from Crypto.Random import get_random_bytes
 from Crypto.Util.Padding import pad, unpad
 import base64
+from .kem import KEMBackend, get_kem_pool
+from .keystore import Envelope, KeyStore
+from .streaming import StreamEnvelope
 
 logger = logging.getLogger(__name__)
 
@@ -10,51 +13,95 @@ class CryptoService:
     """
     Provides methods for quantum-resistant cryptography with fallback to classical encryption.
     """
-    _KEM_ALGORITHM = "Kyber768" # A NIST-selected PQC algorithm
+    _KEM_ALGORITHM = KEMBackend.ALGORITHM # A NIST-selected PQC algorithm
 
     @staticmethod
     def _use_fallback_crypto():
-        """Use AES-256 as fallback when PQC is not available"""
-        logger.warning("PQC not available, using AES-256 fallback")
-        return True
+        """Whether AES-256 is used because PQC is not available (resolved once per process)"""
+        return not KEMBackend.pq_available()
+
+    @staticmethod
+    def encrypt(plain_text, associated_data: bytes = b"") -> bytes:
+        """
+        Envelope-encrypts a payload with the current data key from the
+        keystore (hybrid Kyber768+X25519 KEM, AES-256-GCM). Only the first
+        payload of a rotation window pays for a KEM encapsulation.
+        """
+        if isinstance(plain_text, str):
+            plain_text = plain_text.encode('utf-8')
+        return Envelope.seal(plain_text, associated_data)
+
+    @staticmethod
+    def decrypt(envelope: bytes, associated_data: bytes = b"") -> bytes:
+        """Decrypts an envelope produced by `encrypt`."""
+        return Envelope.open(bytes(envelope), associated_data)
+
+    @staticmethod
+    def encrypt_batch(records, associated_data=None) -> list:
+        """
+        Encrypts a list of str/bytes records in one call. All records share
+        a single data key lookup; large batches are encrypted on a thread pool.
+        `associated_data`, if given, is a list aligned with `records`.
+        """
+        payloads = [r.encode('utf-8') if isinstance(r, str) else r for r in records]
+        return Envelope.seal_many(payloads, associated_data)
+
+    @staticmethod
+    def decrypt_batch(envelopes, associated_data=None) -> list:
+        """Decrypts a list of envelopes, decapsulating each data key at most once."""
+        return Envelope.open_many(envelopes, associated_data)
+
+    @staticmethod
+    def encrypt_stream(source, destination, associated_data: bytes = b"", chunk_size: int = None) -> int:
+        """
+        Encrypts a file-like object or memoryview into `destination` chunk by
+        chunk, so memory use does not grow with the payload.
+        """
+        return StreamEnvelope.seal(source, destination, associated_data, chunk_size)
+
+    @staticmethod
+    def decrypt_stream(source, destination, associated_data: bytes = b"") -> int:
+        """Decrypts a stream written by `encrypt_stream` into `destination`."""
+        return StreamEnvelope.open(source, destination, associated_data)
+
+    @staticmethod
+    def rotate_keys():
+        """Retires the active keypair; existing envelopes stay decryptable."""
+        return KeyStore.rotate_keypair()
 
     @staticmethod
     def generate_pqc_keys():
         """Generates a new PQC public and private key pair."""
-        try:
-            import oqs
-            with oqs.KeyEncapsulation(CryptoService._KEM_ALGORITHM) as kem:
-                public_key = kem.generate_keypair()
-                secret_key = kem.export_secret_key()
-                return public_key, secret_key
-        except (ImportError, AttributeError) as e:
-            logger.warning(f"PQC key generation failed: {e}")
-            # Fallback: Generate AES key
-            key = get_random_bytes(32)  # 256-bit key
-            return key, key  # Use same key as both public and private for demo
+        pool = get_kem_pool()
+        if pool is not None:
+            return pool.generate_keypair()
+        # Fallback: Generate AES key
+        key = get_random_bytes(32)  # 256-bit key
+        return key, key  # Use same key as both public and private for demo
 
     @staticmethod
     def encrypt_pqc(public_key, plain_text: str):
         """
-        Encrypts a string using PQC or fallback encryption.
+        Encrypts a string for a one-off keypair from `generate_pqc_keys`, using
+        a pooled KEM context or the AES fallback resolved at startup.
+        Prefer `encrypt`, which reuses the keystore's data key.
         """
-        try:
-            import oqs
-            with oqs.KeyEncapsulation(CryptoService._KEM_ALGORITHM) as kem:
-                ciphertext, shared_secret = kem.encapsulate(public_key)
-                print("--- PQC: Data Encrypted ---")
-                return ciphertext
-        except (ImportError, AttributeError) as e:
-            logger.warning(f"PQC encryption failed: {e}, using AES fallback")
-            # Fallback: Use AES encryption
-            cipher = AES.new(public_key[:32], AES.MODE_CBC)
-            iv = cipher.iv
-            padded_text = pad(plain_text.encode('utf-8'), AES.block_size)
-            ciphertext = cipher.encrypt(padded_text)
-            # Combine IV and ciphertext
-            result = iv + ciphertext
-            print("--- AES Fallback: Data Encrypted ---")
-            return base64.b64encode(result)
+        pool = get_kem_pool()
+        if pool is not None:
+            kem_ciphertext, shared_secret = pool.encapsulate(public_key)
+            cipher = AES.new(shared_secret[:32], AES.MODE_GCM)
+            ciphertext, tag = cipher.encrypt_and_digest(plain_text.encode('utf-8'))
+            print("--- PQC: Data Encrypted ---")
+            return kem_ciphertext + cipher.nonce + tag + ciphertext
+        # Fallback: Use AES encryption
+        cipher = AES.new(public_key[:32], AES.MODE_CBC)
+        iv = cipher.iv
+        padded_text = pad(plain_text.encode('utf-8'), AES.block_size)
+        ciphertext = cipher.encrypt(padded_text)
+        # Combine IV and ciphertext
+        result = iv + ciphertext
+        print("--- AES Fallback: Data Encrypted ---")
+        return base64.b64encode(result)
 
     @staticmethod
     def decrypt_pqc(secret_key, ciphertext):
@@ -62,24 +109,23 @@ class CryptoService:
         Decrypts PQC ciphertext or fallback encryption.
         """
         try:
-            import oqs
-            with oqs.KeyEncapsulation(CryptoService._KEM_ALGORITHM) as kem:
-                kem.import_secret_key(secret_key)
-                shared_secret = kem.decapsulate(ciphertext)
-                print("--- PQC: Data Decrypted (shared secret recovered) ---")
-                return shared_secret
-        except (ImportError, AttributeError) as e:
-            logger.warning(f"PQC decryption failed: {e}, using AES fallback")
+            pool = get_kem_pool()
+            if pool is not None:
+                kem_size = pool.ciphertext_length()
+                shared_secret = pool.decapsulate(None, secret_key, ciphertext[:kem_size])
+                nonce, tag = ciphertext[kem_size:kem_size + 16], ciphertext[kem_size + 16:kem_size + 32]
+                cipher = AES.new(shared_secret[:32], AES.MODE_GCM, nonce=nonce)
+                print("--- PQC: Data Decrypted ---")
+                return cipher.decrypt_and_verify(ciphertext[kem_size + 32:], tag)
             # Fallback: Use AES decryption
-            try:
-                encrypted_data = base64.b64decode(ciphertext)
-                iv = encrypted_data[:16]  # AES block size
-                actual_ciphertext = encrypted_data[16:]
-                cipher = AES.new(secret_key[:32], AES.MODE_CBC, iv)
-                decrypted_padded = cipher.decrypt(actual_ciphertext)
-                decrypted_text = unpad(decrypted_padded, AES.block_size)
-                print("--- AES Fallback: Data Decrypted ---")
-                return decrypted_text
-            except Exception as decrypt_error:
-                logger.error(f"Fallback decryption failed: {decrypt_error}")
-                return b"decryption_failed"
\ No newline at end of file
+            encrypted_data = base64.b64decode(ciphertext)
+            iv = encrypted_data[:16]  # AES block size
+            actual_ciphertext = encrypted_data[16:]
+            cipher = AES.new(secret_key[:32], AES.MODE_CBC, iv)
+            decrypted_padded = cipher.decrypt(actual_ciphertext)
+            decrypted_text = unpad(decrypted_padded, AES.block_size)
+            print("--- AES Fallback: Data Decrypted ---")
+            return decrypted_text
+        except Exception as decrypt_error:
+            logger.error(f"Decryption failed: {decrypt_error}")
+            return b"decryption_failed"
@@ -0,0 +1,132 @@
+import struct
+
+from Crypto.Cipher import AES
+from Crypto.Random import get_random_bytes
+from django.conf import settings
+
+from .keystore import KeyStore
+
+_TAG_SIZE = 16
+
+
+class _MemoryReader:
+    """Minimal readinto() over a bytes-like object, without copying it up front."""
+
+    def __init__(self, data):
+        self._view = memoryview(data).cast('B')
+        self._offset = 0
+
+    def readinto(self, buffer):
+        n = min(len(buffer), len(self._view) - self._offset)
+        buffer[:n] = self._view[self._offset:self._offset + n]
+        self._offset += n
+        return n
+
+
+def _as_reader(source):
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return _MemoryReader(source)
+    return source
+
+
+def _fill(reader, view) -> int:
+    """Reads until `view` is full or the source is exhausted."""
+    filled = 0
+    while filled < len(view):
+        if hasattr(reader, 'readinto'):
+            n = reader.readinto(view[filled:])
+        else:
+            data = reader.read(len(view) - filled)
+            n = len(data)
+            view[filled:filled + n] = data
+        if not n:
+            break
+        filled += n
+    return filled
+
+
+def _chunks(reader, size):
+    """
+    Yields (memoryview, is_last) over fixed-size chunks, reading one chunk
+    ahead so the final chunk is known. Two buffers are reused throughout.
+    """
+    buffers = [memoryview(bytearray(size)), memoryview(bytearray(size))]
+    current = _fill(reader, buffers[0])
+    index = 0
+    while True:
+        following = _fill(reader, buffers[1 - index]) if current == size else 0
+        yield buffers[index][:current], following == 0
+        if following == 0:
+            return
+        index, current = 1 - index, following
+
+
+class StreamEnvelope:
+    """
+    Chunked AES-256-GCM for payloads too large to hold in memory. Each chunk
+    is sealed with a nonce of prefix (7 bytes), counter (4 bytes) and a
+    final-chunk flag (1 byte), so chunks cannot be reordered, dropped or the
+    stream truncated without failing authentication.
+
+    Header layout: version (1 byte), data key id (8 bytes), nonce prefix
+    (7 bytes), chunk size (4 bytes). Each chunk is followed by its GCM tag.
+    """
+    VERSION = 2
+    HEADER = struct.Struct(">BQ7sI")
+
+    @staticmethod
+    def _nonce(prefix, counter, last):
+        return prefix + struct.pack(">IB", counter, 1 if last else 0)
+
+    @staticmethod
+    def seal(source, destination, associated_data: bytes = b"", chunk_size: int = None) -> int:
+        """
+        Encrypts `source` (a file-like object or bytes-like buffer) into the
+        writable `destination`. Returns the number of bytes written.
+        """
+        chunk_size = chunk_size or getattr(settings, 'PRIVACY_VAULT_STREAM_CHUNK_SIZE', 64 * 1024)
+        data_key_id, key = KeyStore.current_data_key()
+        prefix = get_random_bytes(7)
+        header = StreamEnvelope.HEADER.pack(StreamEnvelope.VERSION, data_key_id, prefix, chunk_size)
+        destination.write(header)
+        written = len(header)
+
+        output = memoryview(bytearray(chunk_size))
+        for counter, (chunk, last) in enumerate(_chunks(_as_reader(source), chunk_size)):
+            cipher = AES.new(key, AES.MODE_GCM, nonce=StreamEnvelope._nonce(prefix, counter, last))
+            cipher.update(associated_data)
+            out = output[:len(chunk)]
+            cipher.encrypt(chunk, output=out)
+            destination.write(out)
+            destination.write(cipher.digest())
+            written += len(chunk) + _TAG_SIZE
+        return written
+
+    @staticmethod
+    def open(source, destination, associated_data: bytes = b"") -> int:
+        """
+        Decrypts a stream produced by `seal` into `destination`, verifying
+        each chunk before it is written. Returns the plaintext size.
+        """
+        reader = _as_reader(source)
+        header = bytearray(StreamEnvelope.HEADER.size)
+        if _fill(reader, memoryview(header)) != len(header):
+            raise ValueError("Truncated stream header")
+        version, data_key_id, prefix, chunk_size = StreamEnvelope.HEADER.unpack(header)
+        if version != StreamEnvelope.VERSION:
+            raise ValueError(f"Unsupported stream envelope version: {version}")
+        key = KeyStore.data_key(data_key_id)
+
+        output = memoryview(bytearray(chunk_size))
+        written = 0
+        for counter, (chunk, last) in enumerate(_chunks(reader, chunk_size + _TAG_SIZE)):
+            if len(chunk) < _TAG_SIZE:
+                raise ValueError("Truncated stream chunk")
+            cipher = AES.new(key, AES.MODE_GCM, nonce=StreamEnvelope._nonce(prefix, counter, last))
+            cipher.update(associated_data)
+            out = output[:len(chunk) - _TAG_SIZE]
+            cipher.decrypt(chunk[:-_TAG_SIZE], output=out)
+            cipher.verify(chunk[-_TAG_SIZE:])
+            destination.write(out)
+            written += len(out)
+        return written
@@ -1,3 +1,442 @@
-from django.test import TestCase
+import base64
+import hashlib
+import io
+import os
+import sys
+import threading
+import types
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.core import serializers
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.db import transaction
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from transactions.models import Transaction
+
+from . import fields, kem
+from .benchmarking import measure
+
+from .fields import blind_index, decrypt_fields
+from .kem import KEMBackend, KEMContextPool
+from .keystore import Envelope, HybridKEM, KeyStore
+from .models import DataKey, KeyPair
+from .services import CryptoService
+from .streaming import StreamEnvelope
+
+VAULT_KEY = base64.b64encode(bytes(range(32))).decode()
+
+
+def reset_keystore():
+    KeyStore._current = None
+    KeyStore._current_pid = None
+    KeyStore._keys.clear()
+    KeyStore._master_key = None
+    fields._blind_index_key = None
+
+
+class VaultTestCase(TestCase):
+    def setUp(self):
+        super().setUp()
+        reset_keystore()
+        self.addCleanup(reset_keystore)
+        settings_override = override_settings(PRIVACY_VAULT_MASTER_KEY=VAULT_KEY)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+
+class MasterKeyTests(TestCase):
+    def setUp(self):
+        reset_keystore()
+        self.addCleanup(reset_keystore)
+
+    @override_settings(PRIVACY_VAULT_MASTER_KEY='', DEBUG=False)
+    def test_missing_master_key_is_refused_outside_debug(self):
+        with self.assertRaises(ImproperlyConfigured):
+            KeyStore.master_key()
+
+    @override_settings(PRIVACY_VAULT_MASTER_KEY='', DEBUG=True)
+    def test_debug_derives_a_master_key_from_secret_key(self):
+        with self.assertLogs('privacy_vault.keystore', 'WARNING'):
+            self.assertEqual(len(KeyStore.master_key()), 32)
+
+    @override_settings(PRIVACY_VAULT_MASTER_KEY=VAULT_KEY)
+    def test_configured_master_key_wraps_secret_keys(self):
+        self.assertEqual(KeyStore.master_key(), bytes(range(32)))
+        self.assertEqual(KeyStore._unwrap(KeyStore._wrap(b'secret')), b'secret')
+
+
+class EnvelopeTests(VaultTestCase):
+    def test_roundtrip_with_associated_data(self):
+        envelope = CryptoService.encrypt('IBAN DE89', associated_data=b'tx:1')
+        self.assertNotIn(b'IBAN', envelope)
+        self.assertEqual(CryptoService.decrypt(envelope, associated_data=b'tx:1'), b'IBAN DE89')
+
+    def test_tampered_envelope_or_wrong_associated_data_is_rejected(self):
+        envelope = bytearray(CryptoService.encrypt(b'payload', associated_data=b'tx:1'))
+        with self.assertRaises(ValueError):
+            CryptoService.decrypt(envelope, associated_data=b'tx:2')
+        envelope[-1] ^= 1
+        with self.assertRaises(ValueError):
+            CryptoService.decrypt(envelope, associated_data=b'tx:1')
+
+    def test_unknown_envelope_version_is_rejected(self):
+        envelope = bytearray(CryptoService.encrypt(b'payload'))
+        envelope[0] = 9
+        with self.assertRaisesRegex(ValueError, 'version'):
+            CryptoService.decrypt(envelope)
+
+    def test_payloads_share_one_encapsulation(self):
+        envelopes = [CryptoService.encrypt(b'a'), CryptoService.encrypt(b'b')]
+        envelopes += CryptoService.encrypt_batch([b'c', 'd'])
+
+        self.assertEqual(DataKey.objects.count(), 1)
+        self.assertEqual(len({Envelope.data_key_id(e) for e in envelopes}), 1)
+        self.assertEqual(CryptoService.decrypt_batch(envelopes), [b'a', b'b', b'c', b'd'])
+
+    @override_settings(PRIVACY_VAULT_DATA_KEY_MAX_USES=2)
+    def test_data_key_is_replaced_after_its_use_limit(self):
+        CryptoService.encrypt(b'a')
+        CryptoService.encrypt(b'b')
+        CryptoService.encrypt(b'c')
+        self.assertEqual(DataKey.objects.count(), 2)
+
+    def test_envelopes_survive_keypair_rotation_and_a_cold_cache(self):
+        envelope = CryptoService.encrypt(b'before rotation')
+        CryptoService.rotate_keys()
+        after = CryptoService.encrypt(b'after rotation')
+        reset_keystore()
+
+        self.assertEqual(CryptoService.decrypt(envelope), b'before rotation')
+        self.assertEqual(CryptoService.decrypt(after), b'after rotation')
+        self.assertEqual(KeyPair.objects.filter(status=KeyPair.Status.ACTIVE).count(), 1)
+        self.assertNotEqual(Envelope.data_key_id(envelope), Envelope.data_key_id(after))
+
+    @override_settings(PRIVACY_VAULT_KEYPAIR_ROTATION_DAYS=30)
+    def test_expired_keypair_is_rotated_on_use(self):
+        old = KeyStore.rotate_keypair()
+        KeyPair.objects.filter(pk=old.pk).update(created_at=timezone.now() - timedelta(days=31))
+
+        self.assertNotEqual(KeyStore.active_keypair().pk, old.pk)
+        old.refresh_from_db()
+        self.assertEqual(old.status, KeyPair.Status.RETIRED)
+
+
+class StreamEnvelopeTests(VaultTestCase):
+    def seal(self, payload, chunk_size=64, associated_data=b''):
+        sealed = io.BytesIO()
+        written = CryptoService.encrypt_stream(io.BytesIO(payload), sealed, associated_data, chunk_size=chunk_size)
+        self.assertEqual(written, len(sealed.getvalue()))
+        return sealed.getvalue()
+
+    def open(self, sealed, associated_data=b''):
+        opened = io.BytesIO()
+        size = CryptoService.decrypt_stream(io.BytesIO(sealed), opened, associated_data)
+        self.assertEqual(size, len(opened.getvalue()))
+        return opened.getvalue()
+
+    def test_roundtrip_across_chunk_boundaries(self):
+        for length in (0, 1, 63, 64, 65, 640, 1000):
+            payload = bytes(i % 251 for i in range(length))
+            with self.subTest(length=length):
+                sealed = self.seal(payload, associated_data=b'export')
+                chunks = max(1, -(-length // 64))
+                self.assertEqual(len(sealed), StreamEnvelope.HEADER.size + length + 16 * chunks)
+                self.assertEqual(self.open(sealed, associated_data=b'export'), payload)
+
+    def test_buffers_are_sealed_without_a_file_object(self):
+        sealed = io.BytesIO()
+        StreamEnvelope.seal(memoryview(b'x' * 200), sealed, chunk_size=64)
+        self.assertEqual(self.open(sealed.getvalue()), b'x' * 200)
+
+    def test_tampered_chunk_is_rejected(self):
+        sealed = bytearray(self.seal(b'y' * 200))
+        sealed[StreamEnvelope.HEADER.size + 70] ^= 1
+        with self.assertRaises(ValueError):
+            self.open(bytes(sealed))
+
+    def test_truncated_or_reordered_streams_are_rejected(self):
+        sealed = self.seal(b'z' * 256)
+        header, record = StreamEnvelope.HEADER.size, 64 + 16
+        chunks = [sealed[header + i:header + i + record] for i in range(0, len(sealed) - header, record)]
+
+        with self.assertRaises(ValueError):
+            self.open(sealed[:header] + b''.join(chunks[:2]))
+        with self.assertRaises(ValueError):
+            self.open(sealed[:header] + chunks[1] + chunks[0] + b''.join(chunks[2:]))
+        with self.assertRaises(ValueError):
+            self.open(sealed[:header - 1])
+
+    def test_wrong_associated_data_is_rejected(self):
+        with self.assertRaises(ValueError):
+            self.open(self.seal(b'payload', associated_data=b'a'), associated_data=b'b')
+
+
+class EncryptedFieldTests(VaultTestCase):
+    def create(self, tx_id, client='Alice Example', source='DE89 3704', destination='FR76 3000'):
+        return Transaction.objects.create(
+            transaction_id_str=tx_id, amount=10, currency='EUR',
+            client_name=client, source_account=source, destination_account=destination,
+        )
+
+    def test_columns_hold_only_ciphertext(self):
+        self.create('TX-1')
+        stored = Transaction.objects.values_list('client_name', 'source_account').get()
+
+        self.assertTrue(all(isinstance(value, bytes) for value in stored))
+        self.assertNotIn(b'Alice', stored[0])
+        self.assertNotIn(b'DE89', stored[1])
+
+    def test_values_are_decrypted_on_first_access_only(self):
+        self.create('TX-1')
+        tx = Transaction.objects.get()
+
+        with mock.patch.object(Envelope, 'open', wraps=Envelope.open) as open_envelope:
+            self.assertEqual(tx.client_name, 'Alice Example')
+            self.assertEqual(tx.client_name, 'Alice Example')
+        open_envelope.assert_called_once()
+
+    def test_blind_index_finds_an_account_in_either_column(self):
+        self.create('TX-1', source='DE89 3704', destination='FR76 3000')
+        self.create('TX-2', source='FR76 3000', destination='NL91 4000')
+        index = blind_index('FR76 3000', 'account')
+
+        self.assertEqual(Transaction.objects.get(destination_account_index=index).transaction_id_str, 'TX-1')
+        self.assertEqual(Transaction.objects.get(source_account_index=index).transaction_id_str, 'TX-2')
+        self.assertNotEqual(index, blind_index('FR76 3000', 'client'))
+
+    def test_updating_a_value_refreshes_its_blind_index(self):
+        tx = self.create('TX-1')
+        tx.source_account = 'NL91 4000'
+        tx.save()
+
+        self.assertTrue(Transaction.objects.filter(source_account_index=blind_index('NL91 4000', 'account')).exists())
+        self.assertEqual(Transaction.objects.get().source_account, 'NL91 4000')
+
+    def test_ciphertext_moved_to_another_row_does_not_decrypt(self):
+        first, second = self.create('TX-1'), self.create('TX-2', client='Bob Example')
+        Transaction.objects.filter(pk=second.pk).update(
+            client_name=Transaction.objects.values_list('client_name', flat=True).get(pk=first.pk),
+        )
+
+        with self.assertRaises(ValueError):
+            Transaction.objects.get(pk=second.pk).client_name
+
+    def test_fixtures_hold_envelopes_and_load_back(self):
+        self.create('TX-1')
+        tx = Transaction.objects.get()
+        self.assertEqual(tx.client_name, 'Alice Example')  # opened before it is dumped
+        dumped = serializers.serialize('json', [tx])
+        Transaction.objects.all().delete()
+
+        self.assertNotIn('Alice', dumped)
+        self.assertNotIn('DE89', dumped)
+        for obj in serializers.deserialize('json', dumped):
+            obj.save()
+        loaded = Transaction.objects.get()
+        self.assertEqual((loaded.client_name, loaded.source_account), ('Alice Example', 'DE89 3704'))
+
+    def test_queryset_update_refuses_plaintext(self):
+        self.create('TX-1')
+
+        with self.assertRaises(TypeError), transaction.atomic():
+            Transaction.objects.update(client_name='Mallory')
+        self.assertEqual(Transaction.objects.get().client_name, 'Alice Example')
+
+    def test_decrypt_fields_opens_many_rows_in_one_batch(self):
+        for i in range(3):
+            self.create(f"TX-{i}", client=f"Client {i}")
+        rows = list(Transaction.objects.order_by('transaction_id_str'))
+
+        with mock.patch.object(Envelope, 'open_many', wraps=Envelope.open_many) as open_many:
+            decrypt_fields(rows, ['client_name', 'source_account', 'amount'])
+        open_many.assert_called_once()
+        self.assertEqual([tx.__dict__['client_name'] for tx in rows], ['Client 0', 'Client 1', 'Client 2'])
+        self.assertEqual(rows[0].__dict__['source_account'], 'DE89 3704')
+
+
+class FakeKeyEncapsulation:
+    """Stands in for oqs.KeyEncapsulation; the public key is a hash of the secret key."""
+    created = []
+
+    def __init__(self, algorithm, secret_key=None):
+        self.secret_key = secret_key
+        self.freed = False
+        self.details = {'length_ciphertext': 32}
+        FakeKeyEncapsulation.created.append(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.free()
+
+    def generate_keypair(self):
+        self.secret_key = os.urandom(32)
+        return hashlib.sha256(self.secret_key).digest()
+
+    def export_secret_key(self):
+        return self.secret_key
+
+    def encap_secret(self, public_key):
+        ciphertext = os.urandom(32)
+        return ciphertext, hashlib.sha256(public_key + ciphertext).digest()
+
+    def decap_secret(self, ciphertext):
+        assert not self.freed, 'decapsulating with a freed context'
+        return hashlib.sha256(hashlib.sha256(self.secret_key).digest() + ciphertext).digest()
+
+    def free(self):
+        self.freed = True
+
+
+def fake_oqs(mechanisms=('Kyber768',)):
+    return types.SimpleNamespace(
+        KeyEncapsulation=FakeKeyEncapsulation,
+        get_enabled_kem_mechanisms=lambda: list(mechanisms),
+        oqs_version=lambda: 'fake',
+    )
+
+
+class FakeOQSMixin:
+    def setUp(self):
+        super().setUp()
+        FakeKeyEncapsulation.created = []
+        modules = mock.patch.dict(sys.modules, {'oqs': fake_oqs()})
+        modules.start()
+        self.addCleanup(modules.stop)
+        self.reset_backend()
+        self.addCleanup(self.reset_backend)
+
+    @staticmethod
+    def reset_backend():
+        KEMBackend._resolved = None
+        kem._kem_pool = None
+
+
+class KEMBackendTests(FakeOQSMixin, TestCase):
+    def test_backend_is_resolved_once(self):
+        with mock.patch.object(KEMBackend, '_probe', wraps=KEMBackend._probe) as probe:
+            self.assertTrue(KEMBackend.pq_available())
+            self.assertTrue(KEMBackend.pq_available())
+        probe.assert_called_once()
+
+    def test_missing_or_incomplete_liboqs_falls_back_to_classical(self):
+        with mock.patch.dict(sys.modules, {'oqs': None}):
+            self.assertFalse(KEMBackend._probe()['pq'])
+        with mock.patch.dict(sys.modules, {'oqs': fake_oqs(mechanisms=('Kyber512',))}):
+            self.assertIn('not enabled', KEMBackend._probe()['detail'])
+
+    def test_liboqs_that_exits_on_import_does_not_take_the_process_down(self):
+        def exiting_import(name, *args, **kwargs):
+            if name == 'oqs':
+                raise SystemExit(1)
+            return original_import(name, *args, **kwargs)
+        original_import = __import__
+        with mock.patch.dict(sys.modules), mock.patch('builtins.__import__', exiting_import):
+            sys.modules.pop('oqs', None)
+            self.assertFalse(KEMBackend._probe()['pq'])
+
+
+class KEMContextPoolTests(FakeOQSMixin, TestCase):
+    def test_encapsulation_contexts_are_reused(self):
+        pool = KEMContextPool(size=2)
+        public_key, secret_key = pool.generate_keypair()
+        created = len(FakeKeyEncapsulation.created)
+
+        for _ in range(5):
+            ciphertext, shared = pool.encapsulate(public_key)
+            self.assertEqual(pool.decapsulate(None, secret_key, ciphertext), shared)
+        self.assertEqual(
+            len([k for k in FakeKeyEncapsulation.created[created:] if k.secret_key is None]), 1,
+        )
+
+    def test_decapsulation_contexts_are_kept_per_keypair_and_evicted(self):
+        pool = KEMContextPool(max_secret_contexts=1)
+        first, second = pool.generate_keypair(), pool.generate_keypair()
+        ciphertext, shared = pool.encapsulate(first[0])
+
+        self.assertEqual(pool.decapsulate(1, first[1], ciphertext), shared)
+        first_context = pool._secret_contexts[1]
+        self.assertEqual(pool.decapsulate(1, first[1], ciphertext), shared)
+        self.assertIs(pool._secret_contexts[1], first_context)
+
+        pool.decapsulate(2, second[1], pool.encapsulate(second[0])[0])
+        self.assertEqual(list(pool._secret_contexts), [2])
+        self.assertTrue(first_context.freed)
+
+    def test_context_in_use_is_not_freed_by_a_concurrent_eviction(self):
+        pool = KEMContextPool(max_secret_contexts=1)
+        first, second = pool.generate_keypair(), pool.generate_keypair()
+        ciphertext, shared = pool.encapsulate(first[0])
+        pool.decapsulate(1, first[1], ciphertext)
+        in_use = pool._secret_contexts[1]
+
+        with in_use.lock:  # a decapsulation holding the context
+            evicting = threading.Thread(target=pool.decapsulate, args=(2, second[1], pool.encapsulate(second[0])[0]))
+            evicting.start()
+            evicting.join(0.2)
+            self.assertFalse(in_use.kem.freed)
+        evicting.join(5)
+        self.assertTrue(in_use.freed)
+
+        # A caller that looked up the evicted context falls back to a fresh one
+        self.assertEqual(pool.decapsulate(1, first[1], ciphertext), shared)
+
+
+class HybridKEMTests(FakeOQSMixin, VaultTestCase):
+    def test_hybrid_keypair_seals_and_opens_envelopes(self):
+        keypair = KeyStore.rotate_keypair()
+        self.assertEqual(keypair.algorithm, 'Kyber768+X25519')
+
+        envelope = CryptoService.encrypt(b'hybrid')
+        reset_keystore()
+        self.assertEqual(CryptoService.decrypt(envelope), b'hybrid')
+
+    def test_hybrid_data_needs_liboqs_to_open(self):
+        envelope = CryptoService.encrypt(b'hybrid')
+        reset_keystore()
+        KEMBackend._resolved = {'pq': False, 'algorithm': 'Kyber768', 'detail': 'removed'}
+
+        with self.assertRaisesRegex(RuntimeError, 'liboqs is not available'):
+            CryptoService.decrypt(envelope)
+
+    def test_classical_keypairs_stay_readable_with_liboqs(self):
+        KEMBackend._resolved = {'pq': False, 'algorithm': 'Kyber768', 'detail': 'removed'}
+        envelope = CryptoService.encrypt(b'classical')
+        self.assertEqual(KeyStore.active_keypair().algorithm, HybridKEM.algorithm_name(False))
+        reset_keystore()
+        self.reset_backend()
+
+        self.assertEqual(CryptoService.decrypt(envelope), b'classical')
+
+
+class CryptoBenchmarkTests(VaultTestCase):
+    def test_measure_counts_every_call_after_a_warm_up(self):
+        calls = []
+        lock = threading.Lock()
+
+        def operation():
+            with lock:
+                calls.append(1)
+
+        for threads in (1, 3):
+            calls.clear()
+            result = measure(operation, iterations=10, threads=threads)
+            self.assertEqual(len(calls), 11)
+            self.assertGreater(result['ops_per_sec'], 0)
+            self.assertLessEqual(result['p50_us'], result['p99_us'])
+
+    def test_benchmark_command_reports_every_case(self):
+        out = io.StringIO()
+        call_command(
+            'benchmark_crypto', iterations=3, sizes=[64], threads=[1, 2], batch_size=4, stream_mb=1, stdout=out,
+        )
+        output = out.getvalue()
+
+        self.assertIn('KEM backend:', output)
+        for case in ('X25519 encapsulate', 'legacy per-transaction', 'envelope open', 'batch seal x4', 'stream open'):
+            self.assertIn(case, output)
+        self.assertEqual(DataKey.objects.count(), 1)
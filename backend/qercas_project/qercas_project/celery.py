@@ -1,6 +1,7 @@
 import os
 from celery import Celery
 from celery.schedules import crontab
+from celery.signals import worker_init
 
 # Set the default Django settings module
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'qercas_project.settings')
@@ -12,7 +13,38 @@ app = Celery('qercas_project')
 app.config_from_object('django.conf:settings', namespace='CELERY')
 
 # Load task modules from all registered Django app configs.
-app.autodiscover_tasks(['transactions'])
+app.autodiscover_tasks(['transactions', 'gnn_analyzer', 'federated_learning'])
+
+@worker_init.connect
+def preload_role_modules(**kwargs):
+    """Imports the role's heavy modules before the pool forks, so children share them."""
+    from qercas_project.roles import preload
+    preload()
+
+def _forks_children(worker):
+    """Whether the worker's pool runs tasks in child processes."""
+    from celery.concurrency import get_implementation
+    return get_implementation(worker.pool_cls).__module__ == 'celery.concurrency.prefork'
+
+@worker_init.connect
+def start_metrics_exporter(sender=None, **kwargs):
+    """
+    Serves the worker's Prometheus metrics over HTTP when METRICS_WORKER_PORT
+    is set. A prefork pool records its metrics in the children, so without
+    PROMETHEUS_MULTIPROC_DIR the exporter (in the parent) would serve empty
+    values; it is not started then.
+    """
+    from django.conf import settings
+    port = getattr(settings, 'METRICS_WORKER_PORT', None)
+    if not port:
+        return
+    if sender is not None and _forks_children(sender) and not os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        print("Not starting the metrics exporter: the prefork pool needs PROMETHEUS_MULTIPROC_DIR "
+              "set to an empty directory, or the exporter only sees the parent process.")
+        return
+    from prometheus_client import start_http_server
+    from qercas_project.metrics import collector_registry
+    start_http_server(int(port), registry=collector_registry())
 
 # Windows-specific settings
 if os.name == 'nt':
@@ -32,4 +64,21 @@ app.conf.beat_schedule = {
         'task': 'federated_learning.tasks.run_federated_training',
         'schedule': crontab(hour=3, minute=0),  # Run daily at 3 AM
     },
+    'apply-confirmed-labels-every-five-minutes': {
+        'task': 'federated_learning.tasks.run_online_update',
+        'schedule': crontab(minute='*/5'),
+        'options': {'expires': 4 * 60},  # Drop runs that would overlap the next one
+    },
+    'archive-old-transactions-every-day': {
+        'task': 'transactions.archive_transactions',
+        'schedule': crontab(hour=2, minute=0),  # Run daily at 2 AM, before training
+    },
+    'prune-status-rollups-every-day': {
+        'task': 'transactions.prune_rollups',
+        'schedule': crontab(hour=2, minute=30),
+    },
+    'write-graph-snapshot-every-hour': {
+        'task': 'gnn_analyzer.tasks.write_graph_snapshot',
+        'schedule': crontab(minute=15),  # Run hourly at quarter past
+    },
 }
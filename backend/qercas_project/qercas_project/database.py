@@ -0,0 +1,74 @@
+"""
+Database profiles selected with the DB_PROFILE environment variable.
+
+- sqlite: the development default, SQLite with its default rollback journal.
+- sqlite-wal: single-node production. WAL lets readers run alongside the
+  writer; IMMEDIATE transactions take the write lock up front, so
+  concurrent Celery writers wait on busy_timeout instead of failing with
+  "database is locked" when a read transaction tries to upgrade.
+- postgres: PostgreSQL with persistent connections, or a psycopg 3
+  connection pool when DB_POOL_MAX_SIZE is set.
+"""
+import os
+
+PROFILES = ('sqlite', 'sqlite-wal', 'postgres')
+
+SQLITE_WAL_PRAGMAS = (
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous=NORMAL',  # durable at checkpoints; safe against corruption in WAL mode
+    'PRAGMA busy_timeout=20000',
+    'PRAGMA temp_store=MEMORY',
+    'PRAGMA cache_size=-65536',  # 64 MiB page cache per connection
+    'PRAGMA mmap_size=268435456',
+)
+
+
+def sqlite_database(name, wal=False):
+    database = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': name,
+    }
+    if wal:
+        database['OPTIONS'] = {
+            'timeout': 20,
+            'init_command': ';'.join(SQLITE_WAL_PRAGMAS),
+            'transaction_mode': 'IMMEDIATE',
+        }
+    return database
+
+
+def postgres_database(environ=os.environ):
+    database = {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': environ.get('POSTGRES_DB', 'qercas'),
+        'USER': environ.get('POSTGRES_USER', 'qercas'),
+        'PASSWORD': environ.get('POSTGRES_PASSWORD', ''),
+        'HOST': environ.get('POSTGRES_HOST', 'localhost'),
+        'PORT': environ.get('POSTGRES_PORT', '5432'),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {},
+    }
+    pool_max_size = int(environ.get('DB_POOL_MAX_SIZE', '0'))
+    if pool_max_size:
+        # Pooled connections are returned after each request or task, so
+        # persistent connections must stay off
+        database['CONN_MAX_AGE'] = 0
+        database['OPTIONS']['pool'] = {
+            'min_size': int(environ.get('DB_POOL_MIN_SIZE', '2')),
+            'max_size': pool_max_size,
+            'timeout': 10,
+        }
+    else:
+        database['CONN_MAX_AGE'] = int(environ.get('DB_CONN_MAX_AGE', '600'))
+    return database
+
+
+def database_profile(profile, sqlite_path, environ=os.environ):
+    """Returns the DATABASES entry for a profile."""
+    if profile == 'sqlite':
+        return sqlite_database(sqlite_path)
+    if profile == 'sqlite-wal':
+        return sqlite_database(sqlite_path, wal=True)
+    if profile == 'postgres':
+        return postgres_database(environ)
+    raise ValueError(f"Unknown DB_PROFILE {profile!r}; expected one of {', '.join(PROFILES)}")
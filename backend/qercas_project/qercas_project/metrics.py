@@ -0,0 +1,71 @@
+"""
+Prometheus metrics for the transaction analysis pipeline.
+
+Metrics are aggregated in-process by prometheus_client. When several
+processes serve the same host (Celery prefork children, multiple web
+workers), set PROMETHEUS_MULTIPROC_DIR to an empty directory before they
+start; every process then writes its values to memory-mapped files there
+and each exposition merges them.
+
+Model versions change with every promotion, so they are not a label on the
+per-stage metrics; MODEL_VERSION reports the version each process serves.
+"""
+import os
+import time
+from contextlib import contextmanager
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess,
+)
+
+# From sub-millisecond inference up to slow graph rendering
+STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+STAGE_SECONDS = Histogram(
+    'qercas_stage_duration_seconds',
+    'Wall-clock time spent in each transaction analysis stage',
+    ['stage'],
+    buckets=STAGE_BUCKETS,
+)
+STAGE_FAILURES = Counter(
+    'qercas_stage_failures',
+    'Stages that raised an exception',
+    ['stage'],
+)
+TRANSACTIONS_ANALYZED = Counter(
+    'qercas_transactions_analyzed',
+    'Transactions scored, by outcome status',
+    ['status'],
+)
+MODEL_VERSION = Gauge(
+    'qercas_model_version',
+    'Registry version of the risk model this process serves; 0 for the legacy joblib model',
+    multiprocess_mode='liveall',
+)
+
+
+@contextmanager
+def timed(stage):
+    """Observes the duration of the block in STAGE_SECONDS, counting failures."""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        STAGE_FAILURES.labels(stage).inc()
+        raise
+    finally:
+        STAGE_SECONDS.labels(stage).observe(time.perf_counter() - start)
+
+
+def collector_registry():
+    """The registry to expose: every process's values in multiprocess mode, else this process's."""
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return registry
+    return REGISTRY
+
+
+def render():
+    """Returns (body, content type) in the Prometheus text format."""
+    return generate_latest(collector_registry()), CONTENT_TYPE_LATEST
@@ -0,0 +1,120 @@
+"""
+Process roles. Every process serves one role, named by the QERCAS_ROLE
+environment variable ('all' by default, which serves everything):
+
+  web      the REST API, admin and graph images (gunicorn/runserver)
+  nlp      the regulatory search endpoints, with the QA model warmed up
+  scoring  Celery worker for the 'scoring' queue
+  graph    Celery worker for the 'graph' queue
+
+A role decides which URL groups are routed (/metrics always is), which
+heavy modules are imported up front (Celery workers do it before forking,
+so children share them), and which modules it must never import at
+startup. The benchmark_startup command checks those, and the startup time
+and peak RSS against STARTUP_BUDGETS.
+"""
+import importlib
+import json
+import os
+import sys
+import time
+
+from django.core.exceptions import ImproperlyConfigured
+
+HEAVY_MODULES = ('torch', 'transformers', 'shap', 'sklearn', 'matplotlib', 'networkx')
+
+ROLES = {
+    'all': {
+        'urls': ('admin', 'api', 'gnn', 'nlp'),
+        'celery': True,
+        'preload': (),
+        'forbidden': (),
+    },
+    'web': {
+        'urls': ('admin', 'api', 'gnn'),
+        'celery': False,
+        'preload': (),
+        'forbidden': HEAVY_MODULES,
+    },
+    'nlp': {
+        'urls': ('nlp',),
+        'celery': False,
+        'preload': (),  # the QA model is loaded in the background (NLP_WARMUP_ON_START)
+        'forbidden': ('shap', 'sklearn', 'matplotlib', 'networkx'),
+    },
+    'scoring': {
+        'urls': (),
+        'celery': True,
+        'preload': ('torch', 'federated_learning.fedavg'),
+        'forbidden': ('transformers', 'shap', 'sklearn', 'matplotlib', 'networkx'),
+    },
+    'graph': {
+        'urls': (),
+        'celery': True,
+        'preload': ('networkx', 'gnn_analyzer.services:_pyplot'),
+        'forbidden': ('torch', 'transformers', 'shap', 'sklearn'),
+    },
+}
+
+
+def current_role() -> str:
+    role = os.environ.get('QERCAS_ROLE', 'all')
+    if role not in ROLES:
+        raise ImproperlyConfigured(f"Unknown QERCAS_ROLE {role!r}; expected one of {', '.join(ROLES)}")
+    return role
+
+
+def get_role(role=None) -> dict:
+    return ROLES[role or current_role()]
+
+
+def preload(role=None):
+    """
+    Imports the role's heavy modules ahead of the first request or task.
+    Entries are module names, or 'module:function' to call a loader.
+    """
+    for entry in get_role(role)['preload']:
+        module, _, function = entry.partition(':')
+        module = importlib.import_module(module)
+        if function:
+            getattr(module, function)()
+
+
+def loaded_modules(modules) -> list:
+    return [module for module in modules if module in sys.modules]
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB, or None where unsupported."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024
+
+
+def bootstrap():
+    """
+    Imports what a process of the current role imports before it serves
+    anything (Django, the URLconf and views, Celery task modules and the
+    role's preloads), then prints a JSON line with the elapsed time, peak
+    RSS and any forbidden modules that were imported.
+    """
+    start = time.perf_counter()
+    import django
+    django.setup()
+    role = get_role()
+    if role['urls']:
+        from django.urls import get_resolver
+        get_resolver().url_patterns
+    if role['celery']:
+        from qercas_project.celery import app
+        app.loader.import_default_modules()
+    preload()
+    print(json.dumps({
+        'role': current_role(),
+        'seconds': time.perf_counter() - start,
+        'rss_mb': peak_rss_mb(),
+        'forbidden_loaded': loaded_modules(role['forbidden']),
+    }))
@@ -13,6 +13,9 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 from pathlib import Path
 import os
 
+from .database import database_profile
+from .roles import current_role
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -83,11 +86,13 @@ WSGI_APPLICATION = 'qercas_project.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# DB_PROFILE: 'sqlite' (development), 'sqlite-wal' (single-node production)
+# or 'postgres' (POSTGRES_* variables; DB_POOL_MAX_SIZE enables pooling).
+# See qercas_project/database.py.
+DB_PROFILE = os.environ.get('DB_PROFILE', 'sqlite')
+
 DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+    'default': database_profile(DB_PROFILE, BASE_DIR / 'db.sqlite3'),
 }
 
 
@@ -134,6 +139,15 @@ CORS_ALLOWED_ORIGINS = ["http://localhost:5173",
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Cache shared by every process: graph layout positions, the answer cache's
+# second tier and Celery's django-cache. Redis is already required as the broker.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ.get('CACHE_URL', 'redis://localhost:6379/1'),
+    }
+}
+
 # Celery Configuration
 CELERY_BROKER_URL = 'redis://localhost:6379/0'
 CELERY_RESULT_BACKEND = 'django-db'  # Use Django database as result backend
@@ -145,6 +159,26 @@ CELERY_TIMEZONE = 'UTC'
 CELERY_TASK_TRACK_STARTED = True
 CELERY_TASK_TIME_LIMIT = 30 * 60  # 30 minutes
 
+# Each pipeline stage has its own queue, so stages scale independently by
+# starting workers with -Q <queue>. Scoring never waits behind analytics.
+CELERY_TASK_ROUTES = {
+    'transactions.analyze_transaction_risk': {'queue': 'scoring'},
+    'transactions.explain_transaction': {'queue': 'explanation'},
+    'transactions.analyze_transaction_graph': {'queue': 'graph'},
+    'gnn_analyzer.tasks.*': {'queue': 'graph'},
+    'transactions.secure_review_note': {'queue': 'crypto'},
+    'federated_learning.tasks.*': {'queue': 'training'},
+    'transactions.archive_transactions': {'queue': 'training'},
+}
+# Message priorities on Redis (0 is consumed first); see FOLLOW_UP_PRIORITY
+CELERY_BROKER_TRANSPORT_OPTIONS = {
+    'queue_order_strategy': 'priority',
+    'priority_steps': list(range(10)),
+    'sep': ':',
+}
+CELERY_TASK_DEFAULT_PRIORITY = 5
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1  # prefetched messages would bypass priorities
+
 # Use Django's test database for development
 if DEBUG:
     CELERY_TASK_ALWAYS_EAGER = True  # Run tasks synchronously in development
@@ -155,4 +189,108 @@ if os.name == 'nt':
     CELERY_WORKER_POOL = 'solo'  # Use solo pool instead of prefork on Windows
 
 MEDIA_URL = '/media/gnn_graphs/'
-MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
\ No newline at end of file
+MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+
+# GNN graph layout
+GNN_LAYOUT_SEED = 42
+GNN_LAYOUT_PARTIAL_ITERATIONS = 15  # only nodes new to the cache move; cached ones are pinned
+GNN_LAYOUT_CACHE_TIMEOUT = 7 * 24 * 60 * 60
+
+# Memory-mapped account graph snapshots
+GNN_SNAPSHOT_DIR = os.path.join(BASE_DIR, 'graph_snapshots')
+GNN_SNAPSHOTS_RETAINED = 2  # older snapshots stay until workers have switched over
+GNN_REPLAY_OVERLAP_SECONDS = 60  # replay re-reads this window, for transactions that commit late
+
+# Process role (qercas_project/roles.py): routed URLs, preloaded and forbidden modules
+QERCAS_ROLE = current_role()
+# Seconds and peak MB for `manage.py benchmark_startup --check`
+STARTUP_BUDGETS = {
+    'web': {'seconds': 1.5, 'rss_mb': 120},
+    'nlp': {'seconds': 1.5, 'rss_mb': 120},
+    'scoring': {'seconds': 4.5, 'rss_mb': 750},  # torch is preloaded
+    'graph': {'seconds': 2.0, 'rss_mb': 180},
+}
+
+# NLP regulatory search
+NLP_ENABLED = os.environ.get('NLP_ENABLED', '1' if QERCAS_ROLE in ('all', 'nlp') else '0') == '1'  # '0' keeps transformers/torch out of the process
+NLP_QA_MODEL = 'distilbert-base-cased-distilled-squad'
+NLP_QA_QUANTIZED = os.environ.get('NLP_QA_QUANTIZED', '0') == '1'  # int8 dynamic quantization for CPU nodes
+NLP_TORCH_THREADS = int(os.environ.get('NLP_TORCH_THREADS', '0')) or None  # None keeps torch's default
+NLP_QA_MAX_SEQ_LEN = 320  # a 150-word passage plus the question fits comfortably
+NLP_WARMUP_ON_START = os.environ.get('NLP_WARMUP_ON_START', '1' if QERCAS_ROLE == 'nlp' else '0') == '1'
+NLP_INDEX_DIR = os.path.join(BASE_DIR, 'nlp_index')
+NLP_RETRIEVAL_TOP_K = 3  # passages read by the QA model per question
+NLP_PASSAGE_WORDS = 150
+NLP_PASSAGE_OVERLAP = 30
+NLP_DENSE_RETRIEVAL = True  # merge semantic hits from the dense index when one is built
+NLP_EMBEDDING_MODEL = 'sentence-transformers/all-MiniLM-L6-v2'
+NLP_DENSE_DTYPE = 'float16'  # or 'int8', half the size of float16 (4x smaller than float32)
+NLP_DENSE_IVF_MIN_PASSAGES = 50000  # above this, partition into sqrt(n) IVF lists
+NLP_DENSE_IVF_NPROBE = 8
+NLP_BATCHING_ENABLED = True  # batch concurrent questions into one forward pass
+NLP_BATCH_MAX_SIZE = 16      # question/passage pairs per batch
+NLP_BATCH_MAX_WAIT_MS = 10   # how long the first request waits for company
+NLP_BATCH_TIMEOUT_SECONDS = 30  # a request gets a 503 instead of waiting longer for the queue
+NLP_ANSWER_CACHE_ENABLED = True
+NLP_ANSWER_CACHE_SIZE = 1024               # in-process LRU entries
+NLP_ANSWER_CACHE_TIMEOUT = 24 * 60 * 60    # shared tier, seconds
+NLP_ANSWER_CACHE_ALIAS = 'default'         # a CACHES alias every NLP process can reach
+NLP_INDEX_MAX_SEGMENTS = 16    # BM25 segments before they are merged by a full rebuild
+NLP_DENSE_MAX_DELTA = 20000    # appended dense rows before they are re-partitioned
+REGULATORY_UPDATES_WINDOW_DAYS = 30  # dashboard "regulatory updates" window
+
+# Privacy vault: hybrid KEM keypairs and AES-GCM data keys
+PRIVACY_VAULT_MASTER_KEY = os.environ.get('PRIVACY_VAULT_MASTER_KEY', '')  # base64, 32 bytes; required unless DEBUG
+PRIVACY_VAULT_KEYPAIR_ROTATION_DAYS = 90
+PRIVACY_VAULT_DATA_KEY_ROTATION_SECONDS = 3600  # one KEM encapsulation per process per window
+PRIVACY_VAULT_DATA_KEY_MAX_USES = 2 ** 20       # keeps random GCM nonces far from collision bounds
+PRIVACY_VAULT_DATA_KEY_CACHE_SIZE = 256         # decapsulated data keys kept for decryption
+PRIVACY_VAULT_BATCH_WORKERS = 4                 # threads for large batches (AES-GCM releases the GIL)
+PRIVACY_VAULT_PARALLEL_MIN_BYTES = 1024 * 1024  # smaller batches are encrypted inline
+PRIVACY_VAULT_STREAM_CHUNK_SIZE = 64 * 1024
+PRIVACY_VAULT_BLIND_INDEX_KEY = os.environ.get('PRIVACY_VAULT_BLIND_INDEX_KEY', '')  # base64; changing it invalidates stored blind indexes
+PRIVACY_VAULT_KEM_WORKERS = 2  # concurrent KEM operations per process; twice as many liboqs contexts are pooled
+
+# Hot/cold transaction storage: older rows move to compressed columnar segments
+TRANSACTION_RETENTION_DAYS = 365  # transactions older than this leave the live table
+TRANSACTION_ARCHIVE_DIR = os.path.join(BASE_DIR, 'archive')
+TRANSACTION_ARCHIVE_SEGMENT_ROWS = 100000  # per segment file; a month can span several
+
+# Status rollups for alert analytics (day buckets are kept forever)
+ROLLUP_MINUTE_RETENTION_DAYS = 7
+ROLLUP_HOUR_RETENTION_DAYS = 180
+ROLLUP_DEFAULT_RANGE_HOURS = 24  # analytics range when the request gives no start
+
+# Federated learning (FedAvg over simulated institutions)
+FL_CLIENTS = 4
+FL_SAMPLES_PER_CLIENT = 5000
+FL_ROUNDS = 5
+FL_LOCAL_EPOCHS = 2
+FL_BATCH_SIZE = 64
+FL_LEARNING_RATE = 0.05
+FL_WORKERS = None  # None uses one process per core
+FL_DATA_DIR = os.path.join(BASE_DIR, 'fl_data')  # scratch space for per-bank training partitions
+FL_LOADER_CHUNK_SIZE = 10000  # rows fetched and featurized per database round trip
+FL_MIN_TRAINING_ROWS = 1000  # below this, train on simulated bank data
+FL_TRAINING_HISTORY_DAYS = None  # train on transactions from the last N days, archived ones included; None for all
+FL_MODEL_REGISTRY_DIR = os.path.join(BASE_DIR, 'ml_models', 'registry')
+FL_MODEL_REGISTRY_KEEP = 10  # retired versions kept for rollback
+FL_MODEL_REFRESH_SECONDS = 30  # how often workers check for a newly active version
+FL_UPDATE_TOP_K = None  # fraction of each update's entries clients upload, e.g. 0.1; None sends all
+FL_UPDATE_QUANTIZE = False  # quantize uploaded updates to 8 bits
+FL_UPDATE_ERROR_FEEDBACK = True  # carry what compression dropped into the next round
+
+# Online updates from analyst-confirmed labels between nightly retrains
+FL_ONLINE_MAX_BATCH = 5000  # confirmed labels consumed per step
+FL_ONLINE_EPOCHS = 1
+FL_ONLINE_LEARNING_RATE = 0.01
+FL_ONLINE_HOLDOUT_FRACTION = 0.2  # share of transactions reserved for evaluation, never used for training
+FL_ONLINE_WINDOW_HOURS = 72  # held-out labels compared on promotion
+FL_ONLINE_WINDOW_MAX_ROWS = 100000
+FL_ONLINE_MIN_HOLDOUT = 50
+FL_ONLINE_PROMOTION_MARGIN = 0.002  # log-loss improvement the shadow needs over the live model
+
+# Prometheus metrics. Web processes serve /metrics; Celery workers serve their
+# own when METRICS_WORKER_PORT is set. With several processes per host, also
+# set PROMETHEUS_MULTIPROC_DIR (an empty directory) so values are merged.
+METRICS_WORKER_PORT = os.environ.get('METRICS_WORKER_PORT')
@@ -2,12 +2,19 @@ from django.contrib import admin
 from django.urls import path,include
 from django.conf import settings
 from django.conf.urls.static import static
+from .roles import get_role
+from .views import metrics
 
-urlpatterns = [
-    path('admin/', admin.site.urls),
-    path('api/', include('transactions.urls')),
-    path('gnn/', include('gnn_analyzer.urls')),
-    path('nlp/', include('nlp_processor.urls')),
+# URL groups; a process only imports the views of its role's groups
+ROUTES = {
+    'admin': lambda: path('admin/', admin.site.urls),
+    'api': lambda: path('api/', include('transactions.urls')),
+    'gnn': lambda: path('gnn/', include('gnn_analyzer.urls')),
+    'nlp': lambda: path('nlp/', include('nlp_processor.urls')),
+}
+
+urlpatterns = [ROUTES[group]() for group in get_role()['urls']] + [
+    path('metrics', metrics, name='metrics'),
 ]
 
 
@@ -0,0 +1,10 @@
+from django.http import HttpResponse
+from django.views.decorators.http import require_GET
+from .metrics import render
+
+
+@require_GET
+def metrics(request):
+    """Prometheus scrape endpoint."""
+    body, content_type = render()
+    return HttpResponse(body, content_type=content_type)
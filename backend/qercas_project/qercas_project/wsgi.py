@@ -14,3 +14,11 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'qercas_project.settings')
 
 application = get_wsgi_application()
+
+# Optionally start loading the QA model in the background so the first
+# question doesn't pay for it. Only server processes import this module.
+from django.conf import settings
+
+if settings.NLP_WARMUP_ON_START:
+    from nlp_processor.services import QAModelLoader
+    QAModelLoader.warm_up()
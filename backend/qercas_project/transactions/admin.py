@@ -1,3 +1,19 @@
 from django.contrib import admin
+from .models import ArchiveSegment, StatusRollup
 
-# Register your models here.
+
+class ArchiveSegmentAdmin(admin.ModelAdmin):
+    list_display = ('min_timestamp', 'max_timestamp', 'row_count', 'size_bytes', 'created_at')
+    readonly_fields = (
+        'path', 'row_count', 'size_bytes', 'checksum', 'min_timestamp', 'max_timestamp',
+        'min_amount', 'max_amount', 'min_labeled_at', 'max_labeled_at', 'status_counts', 'created_at',
+    )
+
+
+class StatusRollupAdmin(admin.ModelAdmin):
+    list_display = ('granularity', 'bucket_start', 'dimension', 'key', 'status', 'transaction_count', 'volume')
+    list_filter = ('granularity', 'dimension', 'status')
+
+
+admin.site.register(ArchiveSegment, ArchiveSegmentAdmin)
+admin.site.register(StatusRollup, StatusRollupAdmin)
@@ -0,0 +1,307 @@
+import hashlib
+import json
+import os
+import tempfile
+import uuid
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from privacy_vault.fields import associated_data
+from privacy_vault.keystore import Envelope
+
+from .models import ArchiveSegment, Transaction, XaiExplanation
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+AMOUNT_SCALE = 4  # Transaction.amount has four decimal places
+NULL_TIME = -1    # labeled_at of rows without an analyst label
+
+# Variable-length columns: a flat uint8 array plus `<name>_offsets`
+ENCRYPTED_COLUMNS = ('client_name', 'source_account', 'destination_account')
+BLOB_COLUMNS = ENCRYPTED_COLUMNS + ('explanation',)
+
+TEXT_COLUMNS = (
+    'transaction_id_str', 'transaction_type', 'currency', 'status', 'analyst_label',
+    'source_account_index', 'destination_account_index',
+)
+COLUMNS = ('id', 'timestamp', 'amount', 'labeled_at') + TEXT_COLUMNS + BLOB_COLUMNS
+
+_FIELDS = (
+    'id', 'transaction_id_str', 'timestamp', 'transaction_type', 'amount', 'currency',
+    'client_name', 'source_account', 'destination_account',
+    'source_account_index', 'destination_account_index', 'status', 'analyst_label', 'labeled_at',
+)
+_DELETE_BATCH = 500  # ids per DELETE, below SQLite's bound parameter limit
+
+
+def to_micros(value: datetime) -> int:
+    return (value - EPOCH) // timedelta(microseconds=1)
+
+
+def from_micros(value) -> datetime:
+    return EPOCH + timedelta(microseconds=int(value))
+
+
+def _pack(values):
+    """Concatenates byte strings into (data, offsets) arrays."""
+    offsets = np.zeros(len(values) + 1, dtype=np.int64)
+    np.cumsum([len(v) for v in values], out=offsets[1:])
+    return np.frombuffer(b''.join(values), dtype=np.uint8), offsets
+
+
+def _file_checksum(path) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class TransactionArchive:
+    """
+    Hot/cold storage for transactions. Rows older than the retention window
+    are moved, with their explanations, from the live table into compressed
+    columnar segments; audits and training scan them back through the
+    segment index instead of the table.
+
+    A segment is an .npz file holding up to TRANSACTION_ARCHIVE_SEGMENT_ROWS
+    transactions of one calendar month, one zlib-compressed member per
+    column, so a scan only decompresses the columns it reads:
+      id                     uint8 (rows x 16) UUID bytes
+      timestamp, labeled_at  int64 microseconds since the epoch (labeled_at -1 when unset)
+      amount                 int64 amount x 10^4
+      text columns           unicode, '' for null (TEXT_COLUMNS)
+      client_name, source_account, destination_account
+                             the sealed envelopes exactly as stored; PII stays encrypted
+      explanation            JSON of the XaiExplanation, empty when there is none
+    Each segment has an ArchiveSegment row with its min/max index.
+    """
+
+    @staticmethod
+    def directory():
+        return getattr(settings, 'TRANSACTION_ARCHIVE_DIR', os.path.join(settings.BASE_DIR, 'archive'))
+
+    @staticmethod
+    def retention_cutoff():
+        return timezone.now() - timedelta(days=getattr(settings, 'TRANSACTION_RETENTION_DAYS', 365))
+
+    @classmethod
+    def archive(cls, before=None) -> list:
+        """
+        Archives every transaction with a timestamp before `before` (default:
+        the retention cutoff), oldest month first. Returns the new segments.
+        """
+        cutoff = before or cls.retention_cutoff()
+        limit = getattr(settings, 'TRANSACTION_ARCHIVE_SEGMENT_ROWS', 100000)
+        segments = []
+        while True:
+            oldest = (
+                Transaction.objects.filter(timestamp__lt=cutoff)
+                .order_by('timestamp').values_list('timestamp', flat=True).first()
+            )
+            if oldest is None:
+                break
+            month = oldest.astimezone(dt_timezone.utc).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+            next_month = (month + timedelta(days=32)).replace(day=1)
+            segment = cls._archive_batch(month, min(next_month, cutoff), limit)
+            if segment is not None:
+                segments.append(segment)
+        print(f"Archived {sum(s.row_count for s in segments)} transactions into {len(segments)} segments")
+        return segments
+
+    @classmethod
+    def _archive_batch(cls, start, end, limit):
+        """
+        Writes the oldest `limit` transactions in [start, end) to a segment
+        and deletes them, in one database transaction. The file is in place
+        before the commit and removed again if the commit fails.
+        """
+        path = None
+        try:
+            with transaction.atomic():
+                rows = list(
+                    Transaction.objects.select_for_update()
+                    .filter(timestamp__gte=start, timestamp__lt=end)
+                    .order_by('timestamp', 'id').values_list(*_FIELDS)[:limit]
+                )
+                if not rows:
+                    return None
+                ids = [row[0] for row in rows]
+                explanations = {}
+                for i in range(0, len(ids), _DELETE_BATCH):
+                    for explanation in XaiExplanation.objects.filter(transaction_id__in=ids[i:i + _DELETE_BATCH]):
+                        explanations[explanation.transaction_id] = explanation
+
+                columns, index = cls._columns(rows, explanations)
+                path, checksum, size = cls._write_segment(columns, start)
+                segment = ArchiveSegment.objects.create(
+                    path=path, row_count=len(rows), size_bytes=size, checksum=checksum, **index,
+                )
+                for i in range(0, len(ids), _DELETE_BATCH):
+                    batch = ids[i:i + _DELETE_BATCH]
+                    XaiExplanation.objects.filter(transaction_id__in=batch).delete()
+                    Transaction.objects.filter(id__in=batch).delete()
+        except BaseException:
+            if path and os.path.exists(path):
+                os.remove(path)
+            raise
+        return segment
+
+    @staticmethod
+    def _columns(rows, explanations):
+        """Columnar arrays for (_FIELDS) rows, and the segment's index fields."""
+        fields = dict(zip(_FIELDS, zip(*rows)))
+        timestamps = np.array([to_micros(ts) for ts in fields['timestamp']], dtype=np.int64)
+        labeled_at = np.array(
+            [to_micros(ts) if ts is not None else NULL_TIME for ts in fields['labeled_at']], dtype=np.int64)
+        amounts = np.array([int(a.scaleb(AMOUNT_SCALE)) for a in fields['amount']], dtype=np.int64)
+
+        columns = {
+            'id': np.frombuffer(b''.join(pk.bytes for pk in fields['id']), dtype=np.uint8).reshape(-1, 16),
+            'timestamp': timestamps,
+            'amount': amounts,
+            'labeled_at': labeled_at,
+        }
+        for name in TEXT_COLUMNS:
+            columns[name] = np.array([value or '' for value in fields[name]], dtype=str)
+        for name in ENCRYPTED_COLUMNS:
+            columns[name], columns[f'{name}_offsets'] = _pack([bytes(v or b'') for v in fields[name]])
+        blobs = []
+        for pk in fields['id']:
+            explanation = explanations.get(pk)
+            blobs.append(json.dumps({
+                'base_value': explanation.base_value,
+                'shap_values': explanation.shap_values,
+                'feature_names': explanation.feature_names,
+                'feature_values': explanation.feature_values,
+                'created_at': explanation.created_at.isoformat(),
+            }).encode('utf-8') if explanation else b'')
+        columns['explanation'], columns['explanation_offsets'] = _pack(blobs)
+
+        labeled = labeled_at[labeled_at != NULL_TIME]
+        statuses, counts = np.unique(columns['status'], return_counts=True)
+        index = {
+            'min_timestamp': from_micros(timestamps.min()),
+            'max_timestamp': from_micros(timestamps.max()),
+            'min_amount': min(fields['amount']),
+            'max_amount': max(fields['amount']),
+            'min_labeled_at': from_micros(labeled.min()) if len(labeled) else None,
+            'max_labeled_at': from_micros(labeled.max()) if len(labeled) else None,
+            'status_counts': {str(s): int(c) for s, c in zip(statuses, counts)},
+        }
+        return columns, index
+
+    @classmethod
+    def _write_segment(cls, columns, month):
+        directory = os.path.join(cls.directory(), f"{month:%Y-%m}")
+        os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(prefix='.segment-', suffix='.npz', dir=directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez_compressed(f, **columns)
+                f.flush()
+                os.fsync(f.fileno())
+            checksum, size = _file_checksum(temp_path), os.path.getsize(temp_path)
+            path = os.path.join(directory, f"segment-{uuid.uuid4().hex}.npz")
+            os.replace(temp_path, path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        return path, checksum, size
+
+    @staticmethod
+    def segments(start=None, end=None, statuses=None, min_amount=None, max_amount=None, labeled_since=None):
+        """Segments whose index overlaps the bounds; `end` is exclusive."""
+        queryset = ArchiveSegment.objects.all()
+        if start is not None:
+            queryset = queryset.filter(max_timestamp__gte=start)
+        if end is not None:
+            queryset = queryset.filter(min_timestamp__lt=end)
+        if min_amount is not None:
+            queryset = queryset.filter(max_amount__gte=min_amount)
+        if max_amount is not None:
+            queryset = queryset.filter(min_amount__lte=max_amount)
+        if labeled_since is not None:
+            queryset = queryset.filter(max_labeled_at__gte=labeled_since)
+        if statuses:
+            queryset = queryset.filter(status_counts__has_any_keys=list(statuses))
+        return queryset
+
+    @classmethod
+    def scan(cls, columns, start=None, end=None, statuses=None, min_amount=None, max_amount=None,
+             labeled_since=None, transaction_id_str=None):
+        """
+        Yields (segment, {column: values}) for each matching segment, holding
+        only the rows inside the bounds. Segments ruled out by their index
+        are never opened, and only filtered and requested columns are read.
+        Blob columns come back as lists of bytes.
+        """
+        bounds = {
+            'start': start, 'end': end, 'statuses': statuses,
+            'min_amount': min_amount, 'max_amount': max_amount, 'labeled_since': labeled_since,
+        }
+        for segment in cls.segments(**bounds):
+            with np.load(segment.path) as data:
+                mask = cls._mask(segment, data, transaction_id_str=transaction_id_str, **bounds)
+                if not mask.any():
+                    continue
+                yield segment, {name: cls._read(data, name, mask) for name in columns}
+
+    @staticmethod
+    def _mask(segment, data, start, end, statuses, min_amount, max_amount, labeled_since, transaction_id_str):
+        # Bounds the whole segment already satisfies are not checked row by row
+        mask = np.ones(segment.row_count, dtype=bool)
+        if start is not None and segment.min_timestamp < start:
+            mask &= data['timestamp'] >= to_micros(start)
+        if end is not None and segment.max_timestamp >= end:
+            mask &= data['timestamp'] < to_micros(end)
+        if min_amount is not None and segment.min_amount < min_amount:
+            mask &= data['amount'] >= int(Decimal(min_amount).scaleb(AMOUNT_SCALE))
+        if max_amount is not None and segment.max_amount > max_amount:
+            mask &= data['amount'] <= int(Decimal(max_amount).scaleb(AMOUNT_SCALE))
+        if labeled_since is not None:
+            mask &= data['labeled_at'] >= to_micros(labeled_since)
+        if statuses and set(segment.status_counts) - set(statuses):
+            mask &= np.isin(data['status'], list(statuses))
+        if transaction_id_str is not None:
+            mask &= data['transaction_id_str'] == transaction_id_str
+        return mask
+
+    @staticmethod
+    def _read(data, name, mask):
+        if name in BLOB_COLUMNS:
+            values, offsets = data[name], data[f'{name}_offsets']
+            return [values[offsets[i]:offsets[i + 1]].tobytes() for i in np.flatnonzero(mask)]
+        return data[name][mask]
+
+    @classmethod
+    def records(cls, decrypt=False, **bounds):
+        """
+        Yields archived transactions as dicts of model field values, with the
+        explanation as a dict (or None). PII is only decrypted when `decrypt`
+        is set; otherwise those fields are None. Takes the bounds of scan().
+        """
+        label = Transaction._meta.label
+        for _, columns in cls.scan(COLUMNS, **bounds):
+            pks = [uuid.UUID(bytes=row.tobytes()) for row in columns['id']]
+            pii = {name: [None] * len(pks) for name in ENCRYPTED_COLUMNS}
+            if decrypt:
+                for name in ENCRYPTED_COLUMNS:
+                    plaintexts = Envelope.open_many(
+                        columns[name], [associated_data(label, name, pk) for pk in pks])
+                    pii[name] = [p.decode('utf-8') for p in plaintexts]
+            for i, pk in enumerate(pks):
+                record = {name: str(columns[name][i]) for name in TEXT_COLUMNS}
+                record.update(
+                    id=pk,
+                    timestamp=from_micros(columns['timestamp'][i]),
+                    amount=Decimal(int(columns['amount'][i])).scaleb(-AMOUNT_SCALE),
+                    analyst_label=record['analyst_label'] or None,
+                    labeled_at=from_micros(columns['labeled_at'][i]) if columns['labeled_at'][i] != NULL_TIME else None,
+                    explanation=json.loads(columns['explanation'][i]) if columns['explanation'][i] else None,
+                    **{name: values[i] for name, values in pii.items()},
+                )
+                yield record
@@ -0,0 +1,23 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from transactions.archive import TransactionArchive
+
+
+class Command(BaseCommand):
+    help = (
+        'Moves transactions older than the retention window (TRANSACTION_RETENTION_DAYS) and their '
+        'explanations out of the live table into compressed columnar archive segments.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than-days', type=int, default=None,
+                            help='Archive transactions older than this many days instead')
+
+    def handle(self, *args, **options):
+        days = options['older_than_days']
+        before = timezone.now() - timedelta(days=days) if days is not None else None
+        segments = TransactionArchive.archive(before=before)
+        for segment in segments:
+            self.stdout.write(f"{segment}: {segment.size_bytes} bytes -> {segment.path}")
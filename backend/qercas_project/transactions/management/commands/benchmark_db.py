@@ -0,0 +1,121 @@
+import os
+import random
+import tempfile
+import threading
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connections
+from qercas_project.database import PROFILES, database_profile
+from transactions.models import Transaction
+
+
+def _profile_list(value):
+    profiles = [v for v in value.split(',') if v]
+    unknown = set(profiles) - set(PROFILES)
+    if unknown:
+        raise CommandError(f"Unknown profiles: {', '.join(sorted(unknown))}")
+    return profiles
+
+
+class Command(BaseCommand):
+    help = (
+        'End-to-end write benchmark of the database profiles. Concurrent workers ingest transactions, '
+        'read them back, record the scoring result and poll the dashboard counts, once with full-row '
+        'saves and once with status-only writes. Each profile runs against a throwaway test database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--transactions', type=int, default=2000, help='Transactions per run')
+        parser.add_argument('--workers', type=int, default=4, help='Concurrent writer threads')
+        parser.add_argument('--profiles', type=_profile_list, default=['sqlite', 'sqlite-wal'],
+                            help=f"Comma-separated subset of {', '.join(PROFILES)}")
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{'profile':<12}{'writes':<14}{'tx/s':>10}{'p99 ms':>10}{'errors':>8}")
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for profile in options['profiles']:
+                alias = f"benchmark_{profile.replace('-', '_')}"
+                try:
+                    old_name = self._create_database(alias, profile, tmp_dir)
+                except Exception as e:
+                    self.stdout.write(f"{profile:<12}skipped: {e}")
+                    continue
+                try:
+                    for narrow in (False, True):
+                        result = self._run(alias, options['transactions'], options['workers'], narrow)
+                        self.stdout.write(
+                            f"{profile:<12}{'status only' if narrow else 'full row':<14}"
+                            f"{result['tx_per_sec']:>10.1f}{result['p99_ms']:>10.1f}{result['errors']:>8}"
+                        )
+                finally:
+                    connections[alias].creation.destroy_test_db(old_name, verbosity=0)
+                    connections[alias].close()
+
+    @staticmethod
+    def _create_database(alias, profile, tmp_dir):
+        config = database_profile(profile, os.path.join(tmp_dir, f'{alias}.sqlite3'))
+        # A file, not the in-memory default, so every worker thread shares it
+        config['TEST'] = {'NAME': os.path.join(tmp_dir, f'{alias}.sqlite3')} if 'sqlite' in config['ENGINE'] else {}
+        connections.settings[alias] = connections.configure_settings({'default': {}, alias: config})[alias]
+        connection = connections[alias]
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        return old_name
+
+    @staticmethod
+    def _run(alias, total, workers, narrow):
+        per_worker = total // workers
+        latencies, errors, lock = [], [0], threading.Lock()
+        statuses = [Transaction.Status.COMPLIANT, Transaction.Status.HIGH_RISK, Transaction.Status.BLOCKED]
+        run_id = f"{'n' if narrow else 'f'}{time.monotonic_ns()}"
+
+        def worker(worker_id):
+            rng = random.Random(worker_id)
+            local_latencies, local_errors = [], 0
+            try:
+                for i in range(per_worker):
+                    start = time.perf_counter()
+                    try:
+                        # Ingest, as the API does
+                        tx = Transaction(
+                            transaction_id_str=f"{run_id}-{worker_id}-{i}",
+                            transaction_type=rng.choice(Transaction.TransactionType.values),
+                            amount=rng.randint(10, 1_000_000), currency='USD',
+                            client_name=f"Client {rng.randint(1, 500)}",
+                            source_account=f"ACC{rng.randint(10000, 10500)}",
+                            destination_account=f"ACC{rng.randint(10000, 10500)}",
+                        )
+                        tx.save(using=alias)
+                        # The scoring task loads the row and records its status
+                        tx = Transaction.objects.using(alias).get(pk=tx.pk)
+                        tx.status = rng.choice(statuses)
+                        if narrow:
+                            tx.save(using=alias, update_fields=['status'])
+                        else:
+                            tx.save(using=alias)
+                        if i % 10 == 0:
+                            Transaction.objects.using(alias).filter(status=Transaction.Status.BLOCKED).count()
+                    except OperationalError:
+                        local_errors += 1
+                    local_latencies.append(time.perf_counter() - start)
+            finally:
+                connections[alias].close()
+                with lock:
+                    latencies.extend(local_latencies)
+                    errors[0] += local_errors
+
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(workers)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        latencies.sort()
+        return {
+            'tx_per_sec': per_worker * workers / elapsed,
+            'p99_ms': latencies[int(0.99 * (len(latencies) - 1))] * 1000 if latencies else 0.0,
+            'errors': errors[0],
+        }
@@ -0,0 +1,106 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from qercas_project.roles import ROLES
+
+BOOTSTRAP = 'from qercas_project.roles import bootstrap; bootstrap()'
+
+
+def _role_list(value):
+    roles = [v for v in value.split(',') if v]
+    unknown = set(roles) - set(ROLES)
+    if unknown:
+        raise CommandError(f"Unknown roles: {', '.join(sorted(unknown))}")
+    return roles
+
+
+def import_breakdown(stderr) -> Counter:
+    """Self time in ms per top-level package, from `-X importtime` output."""
+    totals = Counter()
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, _, name = line[len('import time:'):].split('|')
+        totals[name.strip().split('.')[0]] += int(self_us) / 1000
+    return totals
+
+
+class Command(BaseCommand):
+    help = (
+        'Starts a fresh interpreter per process role (QERCAS_ROLE) and reports its startup time, peak RSS '
+        'and the top-level packages that dominate `-X importtime`. With --check, fails when a role exceeds '
+        'STARTUP_BUDGETS or imports a module its role forbids, so it can run as a regression test.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--roles', type=_role_list, default=['web', 'nlp', 'scoring', 'graph'],
+                            help=f"Comma-separated subset of {', '.join(ROLES)}")
+        parser.add_argument('--repeat', type=int, default=3, help='Timed starts per role; the median is reported')
+        parser.add_argument('--top', type=int, default=6, help='Packages listed per role')
+        parser.add_argument('--check', action='store_true', help='Exit with an error when a budget is exceeded')
+        parser.add_argument('--json', action='store_true', help='Print the results as JSON')
+
+    def handle(self, *args, **options):
+        budgets = getattr(settings, 'STARTUP_BUDGETS', {})
+        results = []
+        for role in options['roles']:
+            runs = [self._start(role) for _ in range(options['repeat'])]
+            _, breakdown = self._start(role, importtime=True)
+            results.append({
+                'role': role,
+                'seconds': statistics.median(run['wall_seconds'] for run, _ in runs),
+                'rss_mb': max((run['rss_mb'] or 0) for run, _ in runs) or None,
+                'forbidden_loaded': runs[0][0]['forbidden_loaded'],
+                'imports_ms': dict(breakdown.most_common(options['top'])),
+                'budget': budgets.get(role, {}),
+            })
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+        else:
+            self._print(results)
+
+        if options['check']:
+            failures = []
+            for result in results:
+                budget = result['budget']
+                if result['forbidden_loaded']:
+                    failures.append(f"{result['role']} imported {', '.join(result['forbidden_loaded'])}")
+                if 'seconds' in budget and result['seconds'] > budget['seconds']:
+                    failures.append(f"{result['role']} started in {result['seconds']:.2f}s > {budget['seconds']}s")
+                if 'rss_mb' in budget and result['rss_mb'] and result['rss_mb'] > budget['rss_mb']:
+                    failures.append(f"{result['role']} peaked at {result['rss_mb']:.0f} MB > {budget['rss_mb']} MB")
+            if failures:
+                raise CommandError('Startup budget exceeded: ' + '; '.join(failures))
+
+    @staticmethod
+    def _start(role, importtime=False):
+        """Runs the role's bootstrap in a new interpreter; returns (its report, import breakdown)."""
+        command = [sys.executable] + (['-X', 'importtime'] if importtime else []) + ['-c', BOOTSTRAP]
+        env = dict(os.environ, QERCAS_ROLE=role, NLP_WARMUP_ON_START='0')
+        start = time.perf_counter()
+        process = subprocess.run(command, cwd=settings.BASE_DIR, env=env, capture_output=True, text=True)
+        wall_seconds = time.perf_counter() - start
+        if process.returncode != 0:
+            raise CommandError(f"{role} failed to start:\n{process.stderr[-2000:]}")
+        report = json.loads([line for line in process.stdout.splitlines() if line.startswith('{')][-1])
+        report['wall_seconds'] = wall_seconds
+        return report, import_breakdown(process.stderr) if importtime else Counter()
+
+    def _print(self, results):
+        self.stdout.write(f"{'role':<10}{'startup s':>10}{'budget':>8}{'peak MB':>10}{'budget':>8}  forbidden imports")
+        for result in results:
+            budget = result['budget']
+            self.stdout.write(
+                f"{result['role']:<10}{result['seconds']:>10.2f}{budget.get('seconds', '-'):>8}"
+                f"{result['rss_mb'] or 0:>10.0f}{budget.get('rss_mb', '-'):>8}  "
+                f"{', '.join(result['forbidden_loaded']) or '-'}"
+            )
+            self.stdout.write('    ' + ', '.join(f"{name} {ms:.0f}ms" for name, ms in result['imports_ms'].items()))
@@ -0,0 +1,44 @@
+import csv
+import json
+from datetime import datetime, timezone as dt_timezone
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from transactions.archive import ENCRYPTED_COLUMNS, TEXT_COLUMNS, TransactionArchive
+
+
+def _datetime(value):
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        raise CommandError(f"Not an ISO date or datetime: {value}")
+    return parsed if timezone.is_aware(parsed) else timezone.make_aware(parsed, dt_timezone.utc)
+
+
+class Command(BaseCommand):
+    help = (
+        'Writes archived transactions in a time range to stdout as CSV, for audits. Only archive '
+        'segments whose index overlaps the filters are read. PII stays sealed unless --decrypt is given.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', type=_datetime, help='Inclusive ISO date or datetime (UTC when naive)')
+        parser.add_argument('--end', type=_datetime, help='Exclusive ISO date or datetime (UTC when naive)')
+        parser.add_argument('--status', action='append', dest='statuses', help='Repeat for several statuses')
+        parser.add_argument('--transaction-id', dest='transaction_id_str')
+        parser.add_argument('--decrypt', action='store_true', help='Include decrypted client and account fields')
+
+    def handle(self, *args, **options):
+        fields = ['id', 'timestamp', 'amount', 'labeled_at', *TEXT_COLUMNS, 'explanation']
+        if options['decrypt']:
+            fields += ENCRYPTED_COLUMNS
+        writer = csv.DictWriter(self.stdout, fieldnames=fields, extrasaction='ignore')
+        writer.writeheader()
+        records = TransactionArchive.records(
+            decrypt=options['decrypt'], start=options['start'], end=options['end'],
+            statuses=options['statuses'], transaction_id_str=options['transaction_id_str'],
+        )
+        for record in records:
+            if record['explanation'] is not None:
+                record['explanation'] = json.dumps(record['explanation'])
+            writer.writerow(record)
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from transactions.rollups import StatusRollups
+
+
+class Command(BaseCommand):
+    help = (
+        'Recomputes the minute, hour and day status rollups from the live transactions and the archive. '
+        'Run once after deploying rollups, or after changing their retention.'
+    )
+
+    def handle(self, *args, **options):
+        buckets = StatusRollups.rebuild()
+        self.stdout.write(f"Wrote {buckets} rollup buckets")
@@ -0,0 +1,309 @@
+import base64
+import hashlib
+import hmac
+import struct
+
+from Crypto.Cipher import AES
+from Crypto.Hash import SHA256
+from Crypto.Protocol.DH import key_agreement, import_x25519_private_key, import_x25519_public_key
+from Crypto.Protocol.KDF import HKDF
+from Crypto.PublicKey import ECC
+from Crypto.Random import get_random_bytes
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import migrations, models
+import privacy_vault.fields
+
+PII_FIELDS = ('client_name', 'source_account', 'destination_account')
+ACCOUNT_FIELDS = ('source_account', 'destination_account')
+BATCH_SIZE = 1000
+
+
+def _in_batches(queryset):
+    batch = []
+    for tx in queryset.iterator(chunk_size=BATCH_SIZE):
+        batch.append(tx)
+        if len(batch) >= BATCH_SIZE:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _identity(secret):
+    return secret
+
+
+class FrozenVault:
+    """
+    A copy of the privacy_vault envelope (version 1) and blind index formats
+    as they were when this migration was written, working on the historical
+    KeyPair and DataKey models of the migrating database. It must not follow
+    later changes to privacy_vault, which still has to read what it wrote.
+    """
+    PQ_ALGORITHM = 'Kyber768'
+    X25519_KEY_BYTES = 32
+    VERSION = 1
+    HEADER = struct.Struct(">BQ12s16s")
+
+    def __init__(self, apps, alias):
+        self.keypairs = apps.get_model('privacy_vault', 'KeyPair').objects.using(alias)
+        self.data_keys = apps.get_model('privacy_vault', 'DataKey').objects.using(alias)
+        self._master_key = None  # resolved on first use, so an empty table needs no key
+        self._blind_index_key = None
+        self._current = None  # (data_key_id, key)
+        self._keys = {}
+
+    @property
+    def master_key(self):
+        if self._master_key is None:
+            configured = getattr(settings, 'PRIVACY_VAULT_MASTER_KEY', '')
+            if configured:
+                self._master_key = base64.b64decode(configured)
+            elif not settings.DEBUG:
+                raise ImproperlyConfigured(
+                    "PRIVACY_VAULT_MASTER_KEY must be set to a base64-encoded 32-byte key when DEBUG is off"
+                )
+            else:
+                self._master_key = HKDF(
+                    settings.SECRET_KEY.encode('utf-8'), 32, b"", SHA256, context=b"qercas-vault-master-key",
+                )
+        return self._master_key
+
+    @property
+    def blind_index_key(self):
+        if self._blind_index_key is None:
+            configured = getattr(settings, 'PRIVACY_VAULT_BLIND_INDEX_KEY', '')
+            if configured:
+                self._blind_index_key = base64.b64decode(configured)
+            else:
+                self._blind_index_key = HKDF(self.master_key, 32, b"", SHA256, context=b"qercas-vault-blind-index")
+        return self._blind_index_key
+
+    @classmethod
+    def _oqs(cls):
+        try:
+            import oqs
+        except (ImportError, RuntimeError, SystemExit):
+            return None
+        return oqs if cls.PQ_ALGORITHM in oqs.get_enabled_kem_mechanisms() else None
+
+    @staticmethod
+    def _derive(classical_secret, pq_secret, encapsulation):
+        return HKDF(classical_secret + pq_secret, 32, encapsulation, SHA256, context=b"qercas-vault-data-key")
+
+    def blind_index(self, value, domain):
+        mac = hmac.new(self.blind_index_key, f"{domain}\x00{value}".encode('utf-8'), hashlib.sha256)
+        return mac.hexdigest()[:32]
+
+    @staticmethod
+    def associated_data(field_name, pk):
+        return f"transactions.Transaction.{field_name}:{pk}".encode('utf-8')
+
+    def _active_keypair(self):
+        keypair = self.keypairs.filter(status='ACTIVE').order_by('-created_at').first()
+        if keypair is not None:
+            return keypair
+        oqs = self._oqs()
+        classical = ECC.generate(curve='curve25519')
+        public_key = classical.public_key().export_key(format='raw')
+        secret_key = classical.seed
+        if oqs is not None:
+            with oqs.KeyEncapsulation(self.PQ_ALGORITHM) as kem:
+                public_key += kem.generate_keypair()
+                secret_key += kem.export_secret_key()
+        nonce = get_random_bytes(12)
+        ciphertext, tag = AES.new(self.master_key, AES.MODE_GCM, nonce=nonce).encrypt_and_digest(secret_key)
+        return self.keypairs.create(
+            algorithm=f"{self.PQ_ALGORITHM}+X25519" if oqs is not None else "X25519",
+            public_key=public_key,
+            wrapped_secret_key=nonce + tag + ciphertext,
+        )
+
+    def _current_data_key(self):
+        if self._current is None:
+            keypair = self._active_keypair()
+            public_key = bytes(keypair.public_key)
+            ephemeral = ECC.generate(curve='curve25519')
+            classical_secret = key_agreement(
+                eph_priv=ephemeral,
+                static_pub=import_x25519_public_key(public_key[:self.X25519_KEY_BYTES]),
+                kdf=_identity,
+            )
+            encapsulation = ephemeral.public_key().export_key(format='raw')
+            pq_secret = b""
+            if keypair.algorithm != "X25519":
+                oqs = self._oqs()
+                if oqs is None:
+                    raise RuntimeError(f"The active keypair uses {self.PQ_ALGORITHM} but liboqs is not available")
+                with oqs.KeyEncapsulation(self.PQ_ALGORITHM) as kem:
+                    pq_ciphertext, pq_secret = kem.encap_secret(public_key[self.X25519_KEY_BYTES:])
+                encapsulation += pq_ciphertext
+            data_key = self.data_keys.create(keypair=keypair, encapsulated_key=encapsulation)
+            self._current = (data_key.pk, self._derive(classical_secret, pq_secret, encapsulation))
+        return self._current
+
+    def _data_key(self, data_key_id):
+        if data_key_id not in self._keys:
+            data_key = self.data_keys.select_related('keypair').get(pk=data_key_id)
+            keypair = data_key.keypair
+            wrapped = bytes(keypair.wrapped_secret_key)
+            cipher = AES.new(self.master_key, AES.MODE_GCM, nonce=wrapped[:12])
+            secret_key = cipher.decrypt_and_verify(wrapped[28:], wrapped[12:28])
+            encapsulation = bytes(data_key.encapsulated_key)
+            classical_secret = key_agreement(
+                static_priv=import_x25519_private_key(secret_key[:self.X25519_KEY_BYTES]),
+                eph_pub=import_x25519_public_key(encapsulation[:self.X25519_KEY_BYTES]),
+                kdf=_identity,
+            )
+            pq_secret = b""
+            if keypair.algorithm != "X25519":
+                oqs = self._oqs()
+                if oqs is None:
+                    raise RuntimeError(f"Data was sealed with {self.PQ_ALGORITHM} but liboqs is not available")
+                with oqs.KeyEncapsulation(self.PQ_ALGORITHM, secret_key[self.X25519_KEY_BYTES:]) as kem:
+                    pq_secret = kem.decap_secret(encapsulation[self.X25519_KEY_BYTES:])
+            self._keys[data_key_id] = self._derive(classical_secret, pq_secret, encapsulation)
+        return self._keys[data_key_id]
+
+    def seal(self, plaintext, associated_data):
+        data_key_id, key = self._current_data_key()
+        nonce = get_random_bytes(12)
+        cipher = AES.new(key, AES.MODE_GCM, nonce=nonce)
+        cipher.update(associated_data)
+        ciphertext, tag = cipher.encrypt_and_digest(plaintext)
+        return self.HEADER.pack(self.VERSION, data_key_id, nonce, tag) + ciphertext
+
+    def open(self, envelope, associated_data):
+        version, data_key_id, nonce, tag = self.HEADER.unpack_from(envelope)
+        if version != self.VERSION:
+            raise ValueError(f"Unsupported envelope version: {version}")
+        cipher = AES.new(self._data_key(data_key_id), AES.MODE_GCM, nonce=nonce)
+        cipher.update(associated_data)
+        return cipher.decrypt_and_verify(envelope[self.HEADER.size:], tag)
+
+
+def encrypt_pii(apps, schema_editor):
+    alias = schema_editor.connection.alias
+    vault = FrozenVault(apps, alias)
+    Transaction = apps.get_model('transactions', 'Transaction')
+    transactions = Transaction.objects.using(alias)
+    updated = [f'{name}_sealed' for name in PII_FIELDS] + [f'{name}_index' for name in ACCOUNT_FIELDS]
+    for batch in _in_batches(transactions.only('id', *PII_FIELDS)):
+        for tx in batch:
+            for name in PII_FIELDS:
+                setattr(tx, f'{name}_sealed', vault.seal(
+                    getattr(tx, name).encode('utf-8'), vault.associated_data(name, tx.pk),
+                ))
+            for name in ACCOUNT_FIELDS:
+                setattr(tx, f'{name}_index', vault.blind_index(getattr(tx, name), 'account'))
+        transactions.bulk_update(batch, updated)
+
+
+def decrypt_pii(apps, schema_editor):
+    alias = schema_editor.connection.alias
+    vault = FrozenVault(apps, alias)
+    Transaction = apps.get_model('transactions', 'Transaction')
+    transactions = Transaction.objects.using(alias)
+    sealed = [f'{name}_sealed' for name in PII_FIELDS]
+    for batch in _in_batches(transactions.only('id', *sealed)):
+        for tx in batch:
+            for name in PII_FIELDS:
+                envelope = bytes(getattr(tx, f'{name}_sealed'))
+                setattr(tx, name, vault.open(envelope, vault.associated_data(name, tx.pk)).decode('utf-8'))
+        transactions.bulk_update(batch, list(PII_FIELDS))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactions', '0002_transaction_timestamp_index'),
+        ('privacy_vault', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transaction',
+            name='client_name_sealed',
+            field=models.BinaryField(null=True),
+        ),
+        migrations.AddField(
+            model_name='transaction',
+            name='source_account_sealed',
+            field=models.BinaryField(null=True),
+        ),
+        migrations.AddField(
+            model_name='transaction',
+            name='destination_account_sealed',
+            field=models.BinaryField(null=True),
+        ),
+        migrations.AddField(
+            model_name='transaction',
+            name='source_account_index',
+            field=privacy_vault.fields.BlindIndexField(db_index=True, default='', domain='account', editable=False, max_length=32, source='source_account'),
+        ),
+        migrations.AddField(
+            model_name='transaction',
+            name='destination_account_index',
+            field=privacy_vault.fields.BlindIndexField(db_index=True, default='', domain='account', editable=False, max_length=32, source='destination_account'),
+        ),
+        # Nullable first, so reversing can re-add the plaintext columns before refilling them
+        migrations.AlterField(
+            model_name='transaction',
+            name='client_name',
+            field=models.CharField(max_length=255, null=True),
+        ),
+        migrations.AlterField(
+            model_name='transaction',
+            name='source_account',
+            field=models.CharField(max_length=100, null=True),
+        ),
+        migrations.AlterField(
+            model_name='transaction',
+            name='destination_account',
+            field=models.CharField(max_length=100, null=True),
+        ),
+        migrations.RunPython(encrypt_pii, decrypt_pii),
+        migrations.RemoveField(
+            model_name='transaction',
+            name='client_name',
+        ),
+        migrations.RemoveField(
+            model_name='transaction',
+            name='source_account',
+        ),
+        migrations.RemoveField(
+            model_name='transaction',
+            name='destination_account',
+        ),
+        migrations.RenameField(
+            model_name='transaction',
+            old_name='client_name_sealed',
+            new_name='client_name',
+        ),
+        migrations.RenameField(
+            model_name='transaction',
+            old_name='source_account_sealed',
+            new_name='source_account',
+        ),
+        migrations.RenameField(
+            model_name='transaction',
+            old_name='destination_account_sealed',
+            new_name='destination_account',
+        ),
+        migrations.AlterField(
+            model_name='transaction',
+            name='client_name',
+            field=privacy_vault.fields.EncryptedTextField(max_length=255),
+        ),
+        migrations.AlterField(
+            model_name='transaction',
+            name='source_account',
+            field=privacy_vault.fields.EncryptedTextField(max_length=100),
+        ),
+        migrations.AlterField(
+            model_name='transaction',
+            name='destination_account',
+            field=privacy_vault.fields.EncryptedTextField(max_length=100),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactions', '0003_encrypt_transaction_pii'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transaction',
+            name='analyst_label',
+            field=models.CharField(blank=True, choices=[('PENDING', 'pending'), ('COMPLIANT', 'Compliant'), ('HIGH_RISK', 'High-Risk'), ('BLOCKED', 'Blocked')], max_length=20, null=True),
+        ),
+        migrations.AddField(
+            model_name='transaction',
+            name='labeled_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactions', '0004_transaction_analyst_label'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchiveSegment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('path', models.CharField(max_length=255)),
+                ('row_count', models.PositiveIntegerField()),
+                ('size_bytes', models.BigIntegerField()),
+                ('checksum', models.CharField(max_length=64)),
+                ('min_timestamp', models.DateTimeField(db_index=True)),
+                ('max_timestamp', models.DateTimeField(db_index=True)),
+                ('min_amount', models.DecimalField(decimal_places=4, max_digits=19)),
+                ('max_amount', models.DecimalField(decimal_places=4, max_digits=19)),
+                ('min_labeled_at', models.DateTimeField(blank=True, null=True)),
+                ('max_labeled_at', models.DateTimeField(blank=True, null=True)),
+                ('status_counts', models.JSONField(default=dict)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['min_timestamp'],
+            },
+        ),
+    ]
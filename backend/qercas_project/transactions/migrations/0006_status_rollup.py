@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:51
+
+import privacy_vault.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactions', '0005_archive_segment'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RollupClient',
+            fields=[
+                ('key', models.CharField(max_length=32, primary_key=True, serialize=False)),
+                ('name', privacy_vault.fields.EncryptedTextField(max_length=255)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='StatusRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('granularity', models.CharField(choices=[('minute', 'Minute'), ('hour', 'Hour'), ('day', 'Day')], max_length=10)),
+                ('bucket_start', models.DateTimeField()),
+                ('dimension', models.CharField(choices=[('transaction_type', 'Transaction type'), ('currency', 'Currency'), ('client', 'Client')], max_length=20)),
+                ('key', models.CharField(max_length=32)),
+                ('status', models.CharField(choices=[('PENDING', 'pending'), ('COMPLIANT', 'Compliant'), ('HIGH_RISK', 'High-Risk'), ('BLOCKED', 'Blocked')], max_length=20)),
+                ('transaction_count', models.BigIntegerField(default=0)),
+                ('volume', models.DecimalField(decimal_places=4, default=0, max_digits=24)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['granularity', 'dimension', 'bucket_start'], name='transaction_granula_b1dfad_idx')],
+                'constraints': [models.UniqueConstraint(fields=('granularity', 'dimension', 'key', 'status', 'bucket_start'), name='unique_status_rollup')],
+            },
+        ),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+from privacy_vault.fields import EncryptedTextField, BlindIndexField
 import uuid
 
 class Transaction(models.Model):
@@ -17,7 +18,7 @@ class Transaction(models.Model):
 
     id = models.UUIDField(primary_key=True, default=uuid.uuid4 , editable=False)
     transaction_id_str = models.CharField(max_length=100 , unique=True , db_index=True)
-    timestamp = models.DateTimeField(auto_now_add=True)
+    timestamp = models.DateTimeField(auto_now_add=True, db_index=True)
 
     transaction_type = models.CharField(
         max_length=10,
@@ -28,9 +29,12 @@ class Transaction(models.Model):
     amount = models.DecimalField(max_digits=19 , decimal_places=4)
     currency = models.CharField(max_length=5)
 
-    client_name = models.CharField(max_length=255)
-    source_account = models.CharField(max_length=100)
-    destination_account = models.CharField(max_length=100)
+    # PII is stored encrypted; accounts carry blind indexes for lookups and joins
+    client_name = EncryptedTextField(max_length=255)
+    source_account = EncryptedTextField(max_length=100)
+    destination_account = EncryptedTextField(max_length=100)
+    source_account_index = BlindIndexField(source='source_account', domain='account')
+    destination_account_index = BlindIndexField(source='destination_account', domain='account')
 
     status = models.CharField(
         max_length=20,
@@ -39,6 +43,10 @@ class Transaction(models.Model):
         db_index=True
     )
 
+    # Outcome confirmed by an analyst; training prefers it over the model's status
+    analyst_label = models.CharField(max_length=20, choices=Status.choices, null=True, blank=True)
+    labeled_at = models.DateTimeField(null=True, blank=True, db_index=True)
+
     def __str__(self):
         return f"{self.transaction_id_str} - {self.amount} {self.currency} [{self.status}]"
 
@@ -66,3 +74,69 @@ class XaiExplanation(models.Model):
 
        def __str__(self):
         return f"Explanation for {self.transaction.transaction_id_str}"
+
+class ArchiveSegment(models.Model):
+    """
+    A compressed columnar file of transactions (and their explanations)
+    moved out of the live table by TransactionArchive. The min/max columns
+    index the segment, so a historical query only opens matching files.
+    """
+    path = models.CharField(max_length=255)
+    row_count = models.PositiveIntegerField()
+    size_bytes = models.BigIntegerField()
+    checksum = models.CharField(max_length=64)  # sha256 of the file
+
+    min_timestamp = models.DateTimeField(db_index=True)
+    max_timestamp = models.DateTimeField(db_index=True)
+    min_amount = models.DecimalField(max_digits=19, decimal_places=4)
+    max_amount = models.DecimalField(max_digits=19, decimal_places=4)
+    min_labeled_at = models.DateTimeField(null=True, blank=True)
+    max_labeled_at = models.DateTimeField(null=True, blank=True)
+    status_counts = models.JSONField(default=dict)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['min_timestamp']
+
+    def __str__(self):
+        return f"{self.min_timestamp:%Y-%m-%d} - {self.max_timestamp:%Y-%m-%d} ({self.row_count} transactions)"
+
+class StatusRollup(models.Model):
+    """
+    Count and amount of transactions per time bucket, dimension value and
+    assigned status, kept up to date by StatusRollups as statuses change.
+    """
+
+    class Granularity(models.TextChoices):
+        MINUTE = 'minute', 'Minute'
+        HOUR = 'hour', 'Hour'
+        DAY = 'day', 'Day'
+
+    class Dimension(models.TextChoices):
+        TRANSACTION_TYPE = 'transaction_type', 'Transaction type'
+        CURRENCY = 'currency', 'Currency'
+        CLIENT = 'client', 'Client'  # keyed by the client name's blind index
+
+    granularity = models.CharField(max_length=10, choices=Granularity.choices)
+    bucket_start = models.DateTimeField()
+    dimension = models.CharField(max_length=20, choices=Dimension.choices)
+    key = models.CharField(max_length=32)
+    status = models.CharField(max_length=20, choices=Transaction.Status.choices)
+    transaction_count = models.BigIntegerField(default=0)
+    volume = models.DecimalField(max_digits=24, decimal_places=4, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['granularity', 'dimension', 'key', 'status', 'bucket_start'], name='unique_status_rollup'),
+        ]
+        indexes = [models.Index(fields=['granularity', 'dimension', 'bucket_start'])]
+
+    def __str__(self):
+        return f"{self.granularity} {self.bucket_start:%Y-%m-%d %H:%M} {self.dimension}={self.key} [{self.status}]"
+
+class RollupClient(models.Model):
+    """The sealed client name behind a client rollup key, for labelling charts."""
+    key = models.CharField(max_length=32, primary_key=True)
+    name = EncryptedTextField(max_length=255)
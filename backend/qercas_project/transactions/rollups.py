@@ -0,0 +1,346 @@
+from collections import defaultdict
+from datetime import timedelta, timezone as dt_timezone
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Sum
+from django.utils import timezone
+from privacy_vault.fields import associated_data, blind_index, decrypt_fields
+from privacy_vault.keystore import Envelope
+
+from .archive import TransactionArchive
+from .models import RollupClient, StatusRollup, Transaction
+
+Granularity = StatusRollup.Granularity
+Dimension = StatusRollup.Dimension
+
+STEPS = {
+    Granularity.MINUTE: timedelta(minutes=1),
+    Granularity.HOUR: timedelta(hours=1),
+    Granularity.DAY: timedelta(days=1),
+}
+COARSEST_FIRST = (Granularity.DAY, Granularity.HOUR, Granularity.MINUTE)
+
+_known_clients = set()  # client keys this process has already registered
+_KNOWN_CLIENTS_MAX = 100000
+
+
+def floor(value, granularity):
+    """Start of the UTC bucket holding `value`."""
+    value = value.astimezone(dt_timezone.utc).replace(second=0, microsecond=0)
+    if granularity != Granularity.MINUTE:
+        value = value.replace(minute=0)
+    if granularity == Granularity.DAY:
+        value = value.replace(hour=0)
+    return value
+
+
+def ceil(value, granularity):
+    floored = floor(value, granularity)
+    return floored if floored == value else floored + STEPS[granularity]
+
+
+def client_key(client_name: str) -> str:
+    return blind_index(client_name, 'client')
+
+
+class StatusRollups:
+    """
+    Per-minute, per-hour and per-day aggregates of assigned statuses, by
+    transaction type, currency and client. Every status change adds the
+    transaction to its new status and removes it from the old one, in
+    all three granularities and dimensions, with one upsert statement in
+    the same database transaction as the status write. Charts then read
+    a bounded number of buckets instead of grouping the Transaction table,
+    and keep their history after transactions are archived.
+
+    Buckets start at UTC boundaries and count transactions by their own
+    timestamp. PENDING is not rolled up. Minute and hour buckets are pruned
+    after ROLLUP_MINUTE_RETENTION_DAYS and ROLLUP_HOUR_RETENTION_DAYS.
+    """
+
+    @staticmethod
+    def retention(granularity):
+        days = {
+            Granularity.MINUTE: getattr(settings, 'ROLLUP_MINUTE_RETENTION_DAYS', 7),
+            Granularity.HOUR: getattr(settings, 'ROLLUP_HOUR_RETENTION_DAYS', 180),
+        }.get(granularity)
+        return timedelta(days=days) if days else None
+
+    @classmethod
+    def retained_since(cls, granularity, now=None):
+        """Oldest bucket start kept at `granularity`, or None if kept forever."""
+        retention = cls.retention(granularity)
+        if retention is None:
+            return None
+        return ceil((now or timezone.now()) - retention, granularity)
+
+    @classmethod
+    def save_status(cls, instance, update_fields=('status',)):
+        """
+        Saves a transaction whose status was assigned and moves it between
+        status buckets. The previous status is read under a row lock, so
+        concurrent assignments to one transaction are counted once each.
+        """
+        with transaction.atomic():
+            previous = (
+                Transaction.objects.select_for_update().filter(pk=instance.pk)
+                .values_list('status', flat=True).first()
+            )
+            instance.save(update_fields=list(update_fields))
+            if previous != instance.status:
+                cls.apply(instance, previous, instance.status)
+
+    @classmethod
+    def apply(cls, instance, previous, current):
+        """Adds the transaction to `current`'s buckets and removes it from `previous`'s."""
+        keys = cls._keys(instance)
+        deltas = []
+        for status, sign in ((previous, -1), (current, 1)):
+            if status and status != Transaction.Status.PENDING:
+                deltas += [
+                    (granularity, floor(instance.timestamp, granularity), dimension, key, status, sign,
+                     sign * Decimal(instance.amount))
+                    for granularity in COARSEST_FIRST for dimension, key in keys
+                ]
+        cls._upsert(deltas)
+
+    @staticmethod
+    def _keys(instance):
+        key = client_key(instance.client_name)
+        if key not in _known_clients:
+            RollupClient.objects.bulk_create([RollupClient(key=key, name=instance.client_name)], ignore_conflicts=True)
+            if len(_known_clients) >= _KNOWN_CLIENTS_MAX:
+                _known_clients.clear()
+            _known_clients.add(key)
+        return [
+            (Dimension.TRANSACTION_TYPE, instance.transaction_type),
+            (Dimension.CURRENCY, instance.currency),
+            (Dimension.CLIENT, key),
+        ]
+
+    @staticmethod
+    def _upsert(deltas):
+        """
+        Adds (granularity, bucket_start, dimension, key, status, count, volume)
+        deltas to their rows, creating missing ones. Rows are written in key
+        order, so concurrent upserts lock them in the same order.
+        """
+        if not deltas:
+            return
+        deltas = sorted(deltas, key=lambda d: (d[0], d[2], d[3], d[4], d[1]))
+        quote = connection.ops.quote_name
+        table = quote(StatusRollup._meta.db_table)
+        columns = ['granularity', 'bucket_start', 'dimension', 'key', 'status', 'transaction_count', 'volume']
+        fields = [StatusRollup._meta.get_field(name) for name in columns]
+        params = []
+        for delta in deltas:
+            params += [field.get_db_prep_save(value, connection) for field, value in zip(fields, delta)]
+        # INSERT .. ON CONFLICT DO UPDATE is shared by SQLite and PostgreSQL
+        sql = (
+            f"INSERT INTO {table} ({', '.join(quote(c) for c in columns)}) VALUES "
+            + ', '.join(['(' + ', '.join(['%s'] * len(columns)) + ')'] * len(deltas))
+            + f" ON CONFLICT ({', '.join(quote(c) for c in ('granularity', 'dimension', 'key', 'status', 'bucket_start'))})"
+            f" DO UPDATE SET {quote('transaction_count')} = {table}.{quote('transaction_count')} + excluded.{quote('transaction_count')},"
+            f" {quote('volume')} = {table}.{quote('volume')} + excluded.{quote('volume')}"
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+
+    @classmethod
+    def choose_granularity(cls, start, end):
+        """
+        The coarsest granularity whose buckets cover [start, end) exactly and
+        are still retained at `start`; when none does, the finest one retained.
+        """
+        retained = [
+            granularity for granularity in COARSEST_FIRST
+            if cls.retained_since(granularity) is None or start >= cls.retained_since(granularity)
+        ]
+        for granularity in retained:
+            if floor(start, granularity) == start and floor(end, granularity) == end:
+                return granularity
+        return retained[-1]
+
+    @classmethod
+    def cover(cls, start, end, levels=COARSEST_FIRST):
+        """
+        Splits [start, end) into (granularity, start, end) pieces, coarsest
+        buckets in the middle and finer ones at the edges, so any range reads
+        at most its whole days plus 46 hours and 118 minutes per key. Edges older than the finest
+        retained granularity are widened to that granularity's boundaries.
+        """
+        granularity, finer = levels[0], levels[1:]
+        if finer:
+            retained = cls.retained_since(finer[0])
+            if retained is not None and start < retained:
+                finer = ()
+        if not finer:
+            return [(granularity, floor(start, granularity), ceil(end, granularity))]
+        inner_start, inner_end = ceil(start, granularity), floor(end, granularity)
+        if inner_start >= inner_end:
+            return cls.cover(start, end, finer)
+        pieces = [(granularity, inner_start, inner_end)]
+        if start < inner_start:
+            pieces = cls.cover(start, inner_start, finer) + pieces
+        if inner_end < end:
+            pieces += cls.cover(inner_end, end, finer)
+        return pieces
+
+    @staticmethod
+    def _queryset(granularity, dimension, start, end, statuses=None, keys=None):
+        queryset = StatusRollup.objects.filter(
+            granularity=granularity, dimension=dimension, bucket_start__gte=start, bucket_start__lt=end)
+        if statuses:
+            queryset = queryset.filter(status__in=statuses)
+        if keys:
+            queryset = queryset.filter(key__in=keys)
+        return queryset
+
+    @classmethod
+    def series(cls, dimension, start, end, granularity=None, statuses=None, keys=None):
+        """
+        Buckets of [start, end) as (granularity, [row, ...]) where each row
+        has bucket_start, key, status, transaction_count and volume. The
+        granularity defaults to choose_granularity(start, end).
+        """
+        granularity = granularity or cls.choose_granularity(start, end)
+        rows = (
+            cls._queryset(granularity, dimension, floor(start, granularity), end, statuses, keys)
+            .filter(transaction_count__gt=0).order_by('bucket_start', 'key', 'status')
+            .values('bucket_start', 'key', 'status', 'transaction_count', 'volume')
+        )
+        return granularity, list(rows)
+
+    @classmethod
+    def totals(cls, dimension, start, end, statuses=None, keys=None):
+        """
+        Totals over [start, end) as [{key, status, transaction_count, volume}],
+        largest volume first, read from the pieces of cover(start, end).
+        """
+        merged = defaultdict(lambda: [0, Decimal(0)])
+        for granularity, piece_start, piece_end in cls.cover(start, end):
+            rows = (
+                cls._queryset(granularity, dimension, piece_start, piece_end, statuses, keys)
+                .values('key', 'status').annotate(count=Sum('transaction_count'), total=Sum('volume'))
+                .order_by()
+            )
+            for row in rows:
+                entry = merged[row['key'], row['status']]
+                entry[0] += row['count']
+                entry[1] += Decimal(row['total'])
+        totals = [
+            {'key': key, 'status': status, 'transaction_count': count, 'volume': volume}
+            for (key, status), (count, volume) in merged.items() if count
+        ]
+        return sorted(totals, key=lambda row: row['volume'], reverse=True)
+
+    @staticmethod
+    def client_names(keys) -> dict:
+        """Decrypted client names of client rollup keys."""
+        clients = list(RollupClient.objects.filter(key__in=set(keys)))
+        decrypt_fields(clients, ['name'])
+        return {client.key: client.name for client in clients}
+
+    @classmethod
+    def prune(cls) -> int:
+        """Deletes minute and hour buckets past their retention."""
+        deleted = 0
+        for granularity in (Granularity.MINUTE, Granularity.HOUR):
+            retained = cls.retained_since(granularity)
+            if retained is not None:
+                deleted += StatusRollup.objects.filter(granularity=granularity, bucket_start__lt=retained).delete()[0]
+        return deleted
+
+    @staticmethod
+    def _lock_writers():
+        """
+        Makes save_status wait for the surrounding transaction: its upserts
+        queue behind the lock, so each status change is either seen by a
+        rebuild's scan or applied on top of the rebuilt rows, never lost.
+        """
+        if connection.vendor == 'postgresql':
+            # Conflicts with the upserts' ROW EXCLUSIVE lock; reads go on
+            table = connection.ops.quote_name(StatusRollup._meta.db_table)
+            with connection.cursor() as cursor:
+                cursor.execute(f"LOCK TABLE {table} IN EXCLUSIVE MODE")
+        else:
+            # SQLite has a single writer; the first write holds it until commit
+            StatusRollup.objects.all().delete()
+
+    @classmethod
+    def rebuild(cls, chunk_size=10000) -> int:
+        """
+        Recomputes every bucket from the live table and the transaction
+        archive, for backfills and after retention changes. Status writes
+        wait until it commits. Returns the number of rollup rows written.
+        """
+        with transaction.atomic():
+            cls._lock_writers()
+            buckets, names = cls._scan(chunk_size)
+            StatusRollup.objects.all().delete()
+            StatusRollup.objects.bulk_create(
+                [
+                    StatusRollup(granularity=g, bucket_start=b, dimension=d, key=k, status=s,
+                                 transaction_count=count, volume=volume)
+                    for (g, b, d, k, s), (count, volume) in buckets.items()
+                ],
+                batch_size=1000,
+            )
+            RollupClient.objects.bulk_create(
+                [RollupClient(key=key, name=name) for key, name in names.items()],
+                ignore_conflicts=True, batch_size=1000,
+            )
+        print(f"Rebuilt {len(buckets)} rollup buckets for {len(names)} clients")
+        return len(buckets)
+
+    @classmethod
+    def _scan(cls, chunk_size):
+        """Bucket totals and client names computed from the live table and the archive."""
+        retained = {granularity: cls.retained_since(granularity) for granularity in COARSEST_FIRST}
+        buckets = defaultdict(lambda: [0, Decimal(0)])
+        names = {}
+
+        def add(timestamp, transaction_type, currency, client_name, status, amount):
+            if status == Transaction.Status.PENDING:
+                return
+            key = client_key(client_name)
+            names[key] = client_name
+            for granularity in COARSEST_FIRST:
+                bucket_start = floor(timestamp, granularity)
+                if retained[granularity] is not None and bucket_start < retained[granularity]:
+                    continue
+                for dimension, value in (
+                    (Dimension.TRANSACTION_TYPE, transaction_type),
+                    (Dimension.CURRENCY, currency),
+                    (Dimension.CLIENT, key),
+                ):
+                    bucket = buckets[granularity, bucket_start, dimension, value, status]
+                    bucket[0] += 1
+                    bucket[1] += amount
+
+        label = Transaction._meta.label
+        rows = Transaction.objects.order_by().values_list(
+            'id', 'timestamp', 'transaction_type', 'currency', 'client_name', 'status', 'amount',
+        ).iterator(chunk_size=chunk_size)
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) >= chunk_size:
+                cls._add_sealed(chunk, add, label)
+                chunk = []
+        cls._add_sealed(chunk, add, label)
+        for record in TransactionArchive.records(decrypt=True):
+            add(record['timestamp'], record['transaction_type'], record['currency'],
+                record['client_name'], record['status'], record['amount'])
+        return buckets, names
+
+    @staticmethod
+    def _add_sealed(rows, add, label):
+        if not rows:
+            return
+        names = Envelope.open_many(
+            [row[4] for row in rows], [associated_data(label, 'client_name', row[0]) for row in rows])
+        for row, name in zip(rows, names):
+            add(row[1], row[2], row[3], name.decode('utf-8'), row[5], row[6])
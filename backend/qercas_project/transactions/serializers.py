@@ -1,10 +1,23 @@
 from rest_framework import serializers
+from privacy_vault.serializers import DecryptingListSerializer
 from .models import Transaction , XaiExplanation
 
 class TransactionSerializer(serializers.ModelSerializer):
+    # Encrypted columns are exposed as plain strings
+    client_name = serializers.CharField(max_length=255)
+    source_account = serializers.CharField(max_length=100)
+    destination_account = serializers.CharField(max_length=100)
+
     class Meta:
         model = Transaction
-        fields = '__all__'
+        exclude = ['source_account_index', 'destination_account_index']
+        read_only_fields = ['analyst_label', 'labeled_at']
+        list_serializer_class = DecryptingListSerializer
+
+class TransactionLabelSerializer(serializers.Serializer):
+    label = serializers.ChoiceField(choices=[
+        Transaction.Status.COMPLIANT, Transaction.Status.HIGH_RISK, Transaction.Status.BLOCKED,
+    ])
 
 class XaiExplanationSerializer(serializers.ModelSerializer):
     class Meta:
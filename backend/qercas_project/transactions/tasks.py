@@ -2,54 +2,112 @@ from celery import shared_task
 from xai_engine.services import XAIService
 from gnn_analyzer.services import GNNService
 from privacy_vault.services import CryptoService
+from qercas_project.metrics import TRANSACTIONS_ANALYZED, timed
+from .archive import TransactionArchive
 from .models import Transaction, XaiExplanation
+from .rollups import StatusRollups
+
+# Transactions that get explanation and graph follow-ups, and their message
+# priority. The Redis broker consumes lower numbers first, so BLOCKED
+# follow-ups overtake HIGH_RISK ones queued before them.
+FOLLOW_UP_PRIORITY = {
+    Transaction.Status.BLOCKED: 0,
+    Transaction.Status.HIGH_RISK: 3,
+}
 
 @shared_task(name="transactions.analyze_transaction_risk")
 def analyze_transaction_risk(transaction_id):
     """
-    Celery task to analyze a transaction's risk and trigger advanced analytics.
+    Celery task to score a transaction's risk (the 'scoring' queue). The
+    status is saved before any analytics run; explanation, graph analysis
+    and crypto are queued as separate tasks on their own queues, so a slow
+    follow-up never delays the scoring of the next transaction.
     """
-    try:
-        transaction = Transaction.objects.get(id=transaction_id)
-        
+    with timed('scoring'):
+        try:
+            transaction = Transaction.objects.get(id=transaction_id)
+        except Transaction.DoesNotExist:
+            return f"Transaction with id {transaction_id} not found."
+
         # --- XAI Analysis ---
-        features = transaction.to_feature_dict()
         service = XAIService()
-        predicted_status, probability, _ = service.predict_status(features)
+        predicted_status, probability, _ = service.predict_status(transaction.to_feature_dict())
         transaction.status = predicted_status
-        transaction.save()
-
-        # Generate explanation for risky transactions
-        if predicted_status in [Transaction.Status.HIGH_RISK, Transaction.Status.BLOCKED]:
-            explanation_data = service.generate_explanation(features)
-            
-            if explanation_data and explanation_data.get("base_value") is not None:
-                XaiExplanation.objects.create(
-                    transaction=transaction,
-                    **explanation_data
-                )
-            else:
-                print(f"WARNING: Could not generate explanation for transaction {transaction.id}. Skipping.")
-        
-        # --- GNN Analysis ---
-        # FIX: Use the 'predicted_status' variable for a reliable check
-        if predicted_status in [Transaction.Status.HIGH_RISK, Transaction.Status.BLOCKED]:
-            GNNService.analyze_and_generate_graph(transaction.id)
-
-        # --- PQC TEST ---
-        if predicted_status == Transaction.Status.BLOCKED:
-            print("\n--- PQC TEST: Securing critical transaction note with PQC ---")
-            try:
-                public_key, secret_key = CryptoService.generate_pqc_keys()
-                note = f"Urgent review needed for transaction {transaction.transaction_id_str}"
-                encrypted_note_ciphertext = CryptoService.encrypt_pqc(public_key, note)
-                print(f"Encrypted Note (Ciphertext): {encrypted_note_ciphertext[:30]}...")
-                CryptoService.decrypt_pqc(secret_key, encrypted_note_ciphertext)
-                print("--- PQC TEST: Decryption successful. ---")
-            except Exception as e:
-                print(f"PQC operation failed: {e}")
-
-        return f"Transaction {transaction.transaction_id_str} status updated to {transaction.status}"
-        
+        StatusRollups.save_status(transaction)
+        TRANSACTIONS_ANALYZED.labels(predicted_status).inc()
+
+    priority = FOLLOW_UP_PRIORITY.get(predicted_status)
+    if priority is not None:
+        explain_transaction.apply_async((transaction_id,), priority=priority)
+        analyze_transaction_graph.apply_async((transaction_id,), priority=priority)
+    if predicted_status == Transaction.Status.BLOCKED:
+        secure_review_note.apply_async((transaction_id,), priority=priority)
+
+    return f"Transaction {transaction.transaction_id_str} status updated to {transaction.status}"
+
+@shared_task(name="transactions.explain_transaction")
+def explain_transaction(transaction_id):
+    """Celery task to store a SHAP explanation for a risky transaction (the 'explanation' queue)."""
+    try:
+        transaction = Transaction.objects.get(id=transaction_id)
+    except Transaction.DoesNotExist:
+        return f"Transaction with id {transaction_id} not found."
+
+    explanation_data = XAIService().generate_explanation(transaction.to_feature_dict())
+    if explanation_data and explanation_data.get("base_value") is not None:
+        XaiExplanation.objects.update_or_create(transaction=transaction, defaults=explanation_data)
+        return f"Explanation stored for transaction {transaction.transaction_id_str}"
+    print(f"WARNING: Could not generate explanation for transaction {transaction.id}. Skipping.")
+    return f"No explanation generated for transaction {transaction.transaction_id_str}"
+
+@shared_task(name="transactions.analyze_transaction_graph")
+def analyze_transaction_graph(transaction_id):
+    """Celery task to render the related-account graph for a risky transaction (the 'graph' queue)."""
+    graph_path = GNNService.analyze_and_generate_graph(transaction_id)
+    return {'transaction_id': str(transaction_id), 'graph_path': graph_path}
+
+@shared_task(name="transactions.secure_review_note")
+def secure_review_note(transaction_id):
+    """Celery task to seal the review note for a blocked transaction (the 'crypto' queue)."""
+    try:
+        transaction = Transaction.objects.get(id=transaction_id)
     except Transaction.DoesNotExist:
-        return f"Transaction with id {transaction_id} not found."
\ No newline at end of file
+        return f"Transaction with id {transaction_id} not found."
+
+    # --- PQC TEST ---
+    print("\n--- PQC TEST: Securing critical transaction note with PQC ---")
+    try:
+        note = f"Urgent review needed for transaction {transaction.transaction_id_str}"
+        aad = transaction.transaction_id_str.encode('utf-8')
+        with timed('pqc_encrypt'):
+            encrypted_note = CryptoService.encrypt(note, associated_data=aad)
+        print(f"Encrypted Note (Envelope): {encrypted_note[:30]}...")
+        with timed('pqc_decrypt'):
+            CryptoService.decrypt(encrypted_note, associated_data=aad)
+        print("--- PQC TEST: Decryption successful. ---")
+        return f"Review note secured for transaction {transaction.transaction_id_str}"
+    except Exception as e:
+        print(f"PQC operation failed: {e}")
+        return f"PQC operation failed for transaction {transaction.transaction_id_str}: {e}"
+
+@shared_task(name="transactions.archive_transactions")
+def archive_transactions():
+    """Celery task to move transactions past the retention window into archive segments"""
+    try:
+        segments = TransactionArchive.archive()
+        return {
+            'status': 'success',
+            'segments': len(segments),
+            'transactions': sum(segment.row_count for segment in segments),
+        }
+    except Exception as e:
+        return {
+            'status': 'error',
+            'error': str(e),
+            'message': 'Transaction archival failed'
+        }
+
+@shared_task(name="transactions.prune_rollups")
+def prune_rollups():
+    """Celery task to delete minute and hour rollup buckets past their retention"""
+    return {'status': 'success', 'deleted': StatusRollups.prune()}
@@ -1,3 +1,627 @@
-from django.test import TestCase
+import base64
+import csv
+import hashlib
+import io
+import json
+import os
+import random
+import shutil
+import tempfile
+from collections import Counter
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import CommandError, call_command
+from django.db import connection, connections
+from django.db.models import Count, Sum
+from django.db.backends.sqlite3.base import DatabaseWrapper
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from privacy_vault.keystore import KeyStore
+from prometheus_client import REGISTRY
+from qercas_project import roles
+from qercas_project.celery import app, start_metrics_exporter
+from qercas_project.database import database_profile
+from qercas_project.metrics import TRANSACTIONS_ANALYZED, timed
+
+from . import archive, rollups, tasks
+from .archive import TransactionArchive
+from .management.commands import benchmark_startup
+from .management.commands.benchmark_db import _profile_list
+from .models import ArchiveSegment, StatusRollup, Transaction, XaiExplanation
+from .rollups import StatusRollups, client_key, floor
+
+VAULT_KEY = base64.b64encode(bytes(range(32))).decode()
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+class TransactionDataMixin:
+    """Creates transactions under a test vault key, with archives written to a temporary directory."""
+
+    def setUp(self):
+        super().setUp()
+        KeyStore._current = None
+        KeyStore._keys.clear()
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir, ignore_errors=True)
+        settings_override = override_settings(
+            PRIVACY_VAULT_MASTER_KEY=VAULT_KEY, TRANSACTION_ARCHIVE_DIR=os.path.join(self.tmp_dir, 'archive'),
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.count = 0
+
+    def create(self, amount=100, status=Transaction.Status.PENDING, client_name='Client', currency='EUR',
+               timestamp=None, transaction_type=Transaction.TransactionType.WIRE_TRANSFER, **fields):
+        self.count += 1
+        tx = Transaction.objects.create(
+            transaction_id_str=f"TX-{self.count}", amount=amount, currency=currency, client_name=client_name,
+            source_account='DE89 3704', destination_account='FR76 3000', status=status,
+            transaction_type=transaction_type, **fields,
+        )
+        if timestamp is not None:
+            Transaction.objects.filter(pk=tx.pk).update(timestamp=timestamp)
+        tx.refresh_from_db()
+        return tx
+
+
+class StageMetricsTests(SimpleTestCase):
+    def test_timed_observes_the_stage_duration(self):
+        before = sample('qercas_stage_duration_seconds_count', stage='test_stage')
+        with timed('test_stage'):
+            pass
+        self.assertEqual(sample('qercas_stage_duration_seconds_count', stage='test_stage'), before + 1)
+
+    def test_timed_counts_failures_and_reraises(self):
+        failures = sample('qercas_stage_failures_total', stage='test_failing')
+        observed = sample('qercas_stage_duration_seconds_count', stage='test_failing')
+
+        with self.assertRaises(ValueError):
+            with timed('test_failing'):
+                raise ValueError('boom')
+
+        self.assertEqual(sample('qercas_stage_failures_total', stage='test_failing'), failures + 1)
+        self.assertEqual(sample('qercas_stage_duration_seconds_count', stage='test_failing'), observed + 1)
+
+    def test_metrics_endpoint_serves_the_exposition_format(self):
+        with timed('test_endpoint'):
+            pass
+        response = self.client.get(reverse('metrics'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        self.assertIn(b'qercas_stage_duration_seconds_bucket{le="0.0005",stage="test_endpoint"}', response.content)
+
+    def test_outcome_counter_is_labeled_by_status_only(self):
+        self.assertEqual(TRANSACTIONS_ANALYZED._labelnames, ('status',))
+
+
+class AnalyzedCounterTests(TransactionDataMixin, TestCase):
+    def test_scoring_counts_the_assigned_status(self):
+        tx = self.create()
+        before = sample('qercas_transactions_analyzed_total', status=Transaction.Status.COMPLIANT)
+
+        with mock.patch.object(tasks, 'XAIService') as service:
+            service.return_value.predict_status.return_value = (Transaction.Status.COMPLIANT, 0.1, None)
+            tasks.analyze_transaction_risk(tx.id)
+
+        self.assertEqual(sample('qercas_transactions_analyzed_total', status=Transaction.Status.COMPLIANT), before + 1)
+
+
+@override_settings(METRICS_WORKER_PORT=9808)
+class WorkerExporterTests(SimpleTestCase):
+    def setUp(self):
+        environ = mock.patch.dict(os.environ)
+        environ.start()
+        self.addCleanup(environ.stop)
+        os.environ.pop('PROMETHEUS_MULTIPROC_DIR', None)
+
+    def start(self, pool_cls):
+        with mock.patch('prometheus_client.start_http_server') as start_http_server:
+            start_metrics_exporter(sender=mock.Mock(pool_cls=pool_cls))
+        return start_http_server
+
+    def test_prefork_pool_without_multiprocess_dir_is_not_exported(self):
+        self.start('prefork').assert_not_called()
+
+    def test_prefork_pool_with_multiprocess_dir_is_exported(self):
+        os.environ['PROMETHEUS_MULTIPROC_DIR'] = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, os.environ['PROMETHEUS_MULTIPROC_DIR'], ignore_errors=True)
+        start_http_server = self.start('prefork')
+
+        start_http_server.assert_called_once()
+        self.assertEqual(start_http_server.call_args.args, (9808,))
+
+    def test_solo_pool_is_exported(self):
+        self.start('solo').assert_called_once()
+
+    @override_settings(METRICS_WORKER_PORT=None)
+    def test_nothing_starts_without_a_port(self):
+        self.start('solo').assert_not_called()
+
+
+class PipelineTests(TransactionDataMixin, TestCase):
+    def score(self, status):
+        tx = self.create()
+        follow_ups = {}
+        with mock.patch.object(tasks, 'XAIService') as service, mock.patch.object(tasks.StatusRollups, 'apply'):
+            service.return_value.predict_status.return_value = (status, 0.9, None)
+            with mock.patch.object(tasks.explain_transaction, 'apply_async') as explain, \
+                    mock.patch.object(tasks.analyze_transaction_graph, 'apply_async') as graph, \
+                    mock.patch.object(tasks.secure_review_note, 'apply_async') as review:
+                explain.side_effect = lambda *args, **kwargs: self.assertEqual(
+                    Transaction.objects.get(pk=tx.pk).status, status)
+                tasks.analyze_transaction_risk(tx.id)
+        for name, queued in (('explain', explain), ('graph', graph), ('review', review)):
+            if queued.called:
+                self.assertEqual(queued.call_args.args, ((tx.id,),))
+                follow_ups[name] = queued.call_args.kwargs['priority']
+        return follow_ups
+
+    def test_blocked_follow_ups_are_queued_first_with_a_review_note(self):
+        self.assertEqual(self.score(Transaction.Status.BLOCKED), {'explain': 0, 'graph': 0, 'review': 0})
+
+    def test_high_risk_follow_ups_have_a_lower_priority(self):
+        self.assertEqual(self.score(Transaction.Status.HIGH_RISK), {'explain': 3, 'graph': 3})
+
+    def test_compliant_transactions_have_no_follow_ups(self):
+        self.assertEqual(self.score(Transaction.Status.COMPLIANT), {})
+
+    def test_stages_are_routed_to_their_own_queues(self):
+        expected = {
+            'transactions.analyze_transaction_risk': 'scoring',
+            'transactions.explain_transaction': 'explanation',
+            'transactions.analyze_transaction_graph': 'graph',
+            'gnn_analyzer.tasks.write_graph_snapshot': 'graph',
+            'transactions.secure_review_note': 'crypto',
+            'federated_learning.tasks.run_federated_training': 'training',
+        }
+        for name, queue in expected.items():
+            with self.subTest(name):
+                self.assertEqual(app.amqp.router.route({}, name, (), {})['queue'].name, queue)
+
+
+class DatabaseProfileTests(SimpleTestCase):
+    def test_sqlite_profile_keeps_the_default_journal(self):
+        self.assertEqual(database_profile('sqlite', 'db.sqlite3'), {
+            'ENGINE': 'django.db.backends.sqlite3', 'NAME': 'db.sqlite3',
+        })
+
+    def test_sqlite_wal_profile_takes_the_write_lock_up_front(self):
+        options = database_profile('sqlite-wal', 'db.sqlite3')['OPTIONS']
+
+        self.assertEqual(options['transaction_mode'], 'IMMEDIATE')
+        self.assertIn('PRAGMA journal_mode=WAL', options['init_command'])
+        self.assertIn('PRAGMA busy_timeout=20000', options['init_command'])
+
+    def test_sqlite_wal_connections_run_in_wal_mode(self):
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir, ignore_errors=True)
+        config = connections.configure_settings(
+            {'default': database_profile('sqlite-wal', os.path.join(tmp_dir, 'wal.sqlite3'))})['default']
+        wal = DatabaseWrapper(config, alias='wal')
+        self.addCleanup(wal.close)
+
+        with wal.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode')
+            self.assertEqual(cursor.fetchone()[0], 'wal')
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)  # NORMAL
+
+    def test_postgres_profile_uses_persistent_connections(self):
+        database = database_profile('postgres', None, environ={'POSTGRES_HOST': 'db', 'DB_CONN_MAX_AGE': '60'})
+
+        self.assertEqual(database['ENGINE'], 'django.db.backends.postgresql')
+        self.assertEqual(database['HOST'], 'db')
+        self.assertEqual(database['CONN_MAX_AGE'], 60)
+        self.assertNotIn('pool', database['OPTIONS'])
+
+    def test_postgres_pool_turns_persistent_connections_off(self):
+        database = database_profile('postgres', None, environ={'DB_POOL_MAX_SIZE': '8'})
+
+        self.assertEqual(database['CONN_MAX_AGE'], 0)
+        self.assertEqual(database['OPTIONS']['pool']['max_size'], 8)
+        self.assertEqual(database['OPTIONS']['pool']['min_size'], 2)
+
+    def test_unknown_profile_is_rejected(self):
+        with self.assertRaises(ValueError):
+            database_profile('mysql', 'db.sqlite3')
+        with self.assertRaises(CommandError):
+            _profile_list('sqlite,mysql')
+
+
+class NarrowWriteTests(TransactionDataMixin, TestCase):
+    def test_status_save_only_writes_the_status_column(self):
+        tx = self.create()
+        tx.status = Transaction.Status.HIGH_RISK
+
+        with CaptureQueriesContext(connection) as queries:
+            StatusRollups.save_status(tx)
+
+        table = Transaction._meta.db_table
+        updates = [q['sql'] for q in queries if q['sql'].startswith(f'UPDATE "{table}"')]
+        self.assertEqual(len(updates), 1)
+        self.assertIn('SET "status" = ', updates[0])
+        self.assertNotIn('client_name', updates[0])
+        self.assertEqual(Transaction.objects.get(pk=tx.pk).status, Transaction.Status.HIGH_RISK)
+
+
+
+class TransactionArchiveTests(TransactionDataMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.january = self.create(
+            amount='12.3456', status=Transaction.Status.BLOCKED, client_name='Alice',
+            timestamp=datetime(2024, 1, 10, 9, 30, tzinfo=dt_timezone.utc),
+            analyst_label=Transaction.Status.HIGH_RISK, labeled_at=datetime(2024, 1, 11, tzinfo=dt_timezone.utc),
+        )
+        self.february = self.create(
+            amount=5000, status=Transaction.Status.COMPLIANT, client_name='Bob',
+            timestamp=datetime(2024, 2, 3, tzinfo=dt_timezone.utc),
+        )
+        self.recent = self.create(amount=1, status=Transaction.Status.COMPLIANT)
+        XaiExplanation.objects.create(
+            transaction=self.january, base_value=0.25, shap_values=[0.5, -0.1],
+            feature_names=['amount', 'hour'], feature_values=[12.3456, 9],
+        )
+
+    def archive(self):
+        return TransactionArchive.archive(before=timezone.now() - timedelta(days=30))
+
+    def test_old_transactions_move_to_one_segment_per_month(self):
+        segments = self.archive()
+
+        self.assertEqual([s.min_timestamp.month for s in segments], [1, 2])
+        self.assertEqual(list(Transaction.objects.values_list('pk', flat=True)), [self.recent.pk])
+        self.assertFalse(XaiExplanation.objects.exists())
+        self.assertEqual(segments[0].status_counts, {'BLOCKED': 1})
+        self.assertEqual(segments[1].min_amount, Decimal(5000))
+
+    def test_records_roundtrip_with_explanations_and_decrypted_pii(self):
+        self.archive()
+        records = {r['transaction_id_str']: r for r in TransactionArchive.records(decrypt=True)}
+
+        january = records[self.january.transaction_id_str]
+        self.assertEqual(january['id'], self.january.pk)
+        self.assertEqual(january['timestamp'], self.january.timestamp)
+        self.assertEqual(january['amount'], Decimal('12.3456'))
+        self.assertEqual(january['status'], 'BLOCKED')
+        self.assertEqual(january['analyst_label'], 'HIGH_RISK')
+        self.assertEqual(january['labeled_at'], self.january.labeled_at)
+        self.assertEqual(january['client_name'], 'Alice')
+        self.assertEqual(january['source_account_index'], self.january.source_account_index)
+        self.assertEqual(january['explanation']['shap_values'], [0.5, -0.1])
+
+        february = records[self.february.transaction_id_str]
+        self.assertIsNone(february['explanation'])
+        self.assertIsNone(february['analyst_label'])
+        self.assertIsNone(february['labeled_at'])
+
+    def test_pii_stays_sealed_without_decrypt(self):
+        self.archive()
+        for record in TransactionArchive.records():
+            self.assertIsNone(record['client_name'])
+            self.assertIsNone(record['source_account'])
+
+    def test_segment_checksum_matches_the_file(self):
+        for segment in self.archive():
+            with open(segment.path, 'rb') as f:
+                self.assertEqual(segment.checksum, hashlib.sha256(f.read()).hexdigest())
+            self.assertEqual(segment.size_bytes, os.path.getsize(segment.path))
+            self.assertTrue(segment.path.startswith(os.path.join(self.tmp_dir, 'archive')))
+
+    def test_scan_only_opens_segments_inside_the_bounds(self):
+        self.archive()
+        with mock.patch.object(archive.np, 'load', wraps=np.load) as load:
+            scanned = list(TransactionArchive.scan(['amount'], start=datetime(2024, 2, 1, tzinfo=dt_timezone.utc)))
+
+        self.assertEqual(load.call_count, 1)
+        self.assertEqual([list(columns['amount']) for _, columns in scanned], [[5000 * 10 ** 4]])
+
+    def test_scan_filters_rows_inside_a_segment(self):
+        self.create(amount=7, timestamp=datetime(2024, 1, 20, tzinfo=dt_timezone.utc))
+        self.archive()
+
+        by_id = [r['amount'] for r in TransactionArchive.records(transaction_id_str=self.january.transaction_id_str)]
+        by_amount = [r['amount'] for r in TransactionArchive.records(min_amount=10, max_amount=100)]
+        by_status = [r['transaction_id_str'] for r in TransactionArchive.records(statuses=['COMPLIANT'])]
+        labeled = [r['transaction_id_str'] for r in TransactionArchive.records(
+            labeled_since=datetime(2024, 1, 1, tzinfo=dt_timezone.utc))]
+
+        self.assertEqual(by_id, [Decimal('12.3456')])
+        self.assertEqual(by_amount, [Decimal('12.3456')])
+        self.assertEqual(by_status, [self.february.transaction_id_str])
+        self.assertEqual(labeled, [self.january.transaction_id_str])
+
+    def test_segments_are_split_at_the_row_limit(self):
+        self.create(amount=7, timestamp=datetime(2024, 1, 20, tzinfo=dt_timezone.utc))
+        self.create(amount=8, timestamp=datetime(2024, 1, 21, tzinfo=dt_timezone.utc))
+
+        with override_settings(TRANSACTION_ARCHIVE_SEGMENT_ROWS=2):
+            segments = self.archive()
+
+        self.assertEqual([s.row_count for s in segments], [2, 1, 1])
+        self.assertEqual(len(list(TransactionArchive.records())), 4)
+
+    def test_failed_archive_keeps_the_rows_and_removes_the_file(self):
+        with mock.patch.object(ArchiveSegment.objects, 'create', side_effect=RuntimeError('db down')):
+            with self.assertRaises(RuntimeError):
+                self.archive()
+
+        self.assertEqual(Transaction.objects.count(), 3)
+        self.assertTrue(XaiExplanation.objects.exists())
+        for _, _, files in os.walk(self.tmp_dir):
+            self.assertEqual(files, [])
+
+    def test_archive_task_reports_what_it_moved(self):
+        with override_settings(TRANSACTION_RETENTION_DAYS=30):
+            result = tasks.archive_transactions()
+
+        self.assertEqual(result, {'status': 'success', 'segments': 2, 'transactions': 2})
+
+    def test_export_writes_the_matching_records_as_csv(self):
+        self.archive()
+        out = io.StringIO()
+        call_command('export_archive', '--start', '2024-01-01', '--end', '2024-02-01', '--decrypt', stdout=out)
+
+        rows = list(csv.DictReader(io.StringIO(out.getvalue())))
+        self.assertEqual([row['transaction_id_str'] for row in rows], [self.january.transaction_id_str])
+        self.assertEqual(rows[0]['client_name'], 'Alice')
+        self.assertEqual(rows[0]['amount'], '12.3456')
+
+
+
+class StatusRollupTests(TransactionDataMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        rollups._known_clients.clear()
+        self.addCleanup(rollups._known_clients.clear)
+        self.now = floor(timezone.now(), StatusRollup.Granularity.MINUTE)
+
+    def score(self, tx, status):
+        tx.status = status
+        StatusRollups.save_status(tx)
+
+    def populate(self, count=60):
+        rng = random.Random(0)
+        statuses = [Transaction.Status.COMPLIANT, Transaction.Status.HIGH_RISK, Transaction.Status.BLOCKED]
+        for _ in range(count):
+            tx = self.create(
+                amount=Decimal(rng.randint(1, 10 ** 6)).scaleb(-2),
+                currency=rng.choice(['EUR', 'USD']), client_name=rng.choice(['Alice', 'Bob', 'Carol']),
+                transaction_type=rng.choice(Transaction.TransactionType.values),
+                timestamp=self.now - timedelta(minutes=rng.randint(1, 4 * 24 * 60), seconds=rng.randint(0, 59)),
+            )
+            if rng.random() < 0.9:
+                self.score(tx, rng.choice(statuses))
+            if rng.random() < 0.3:
+                self.score(tx, rng.choice(statuses))  # rescored, e.g. by an analyst label
+
+    def grouped(self, field, start, end):
+        rows = (
+            Transaction.objects.filter(timestamp__gte=start, timestamp__lt=end)
+            .exclude(status=Transaction.Status.PENDING)
+            .values(field, 'status').annotate(count=Count('id'), total=Sum('amount'))
+        )
+        return {(row[field], row['status']): (row['count'], row['total']) for row in rows}
+
+    def totals(self, dimension, start, end, **filters):
+        return {
+            (row['key'], row['status']): (row['transaction_count'], row['volume'])
+            for row in StatusRollups.totals(dimension, start, end, **filters)
+        }
+
+    def test_totals_match_a_group_by_over_ragged_ranges(self):
+        self.populate()
+        ranges = [
+            (self.now - timedelta(days=3, hours=5, minutes=17), self.now - timedelta(minutes=41)),
+            (self.now - timedelta(days=2), self.now),
+            (self.now - timedelta(hours=7, minutes=3), self.now - timedelta(hours=2, minutes=58)),
+            (self.now - timedelta(days=5), self.now + timedelta(minutes=1)),
+        ]
+        for start, end in ranges:
+            with self.subTest(start=start, end=end):
+                self.assertEqual(
+                    self.totals(StatusRollup.Dimension.TRANSACTION_TYPE, start, end),
+                    self.grouped('transaction_type', start, end))
+                self.assertEqual(
+                    self.totals(StatusRollup.Dimension.CURRENCY, start, end),
+                    self.grouped('currency', start, end))
+
+    def test_client_totals_are_keyed_by_blind_index(self):
+        self.populate(20)
+        start, end = self.now - timedelta(days=5), self.now
+
+        expected, names = {}, {}
+        for tx in Transaction.objects.filter(timestamp__lt=end).exclude(status=Transaction.Status.PENDING):
+            key = client_key(tx.client_name)
+            count, volume = expected.get((key, tx.status), (0, 0))
+            expected[key, tx.status] = (count + 1, volume + tx.amount)
+            names[key] = tx.client_name
+        self.assertEqual(self.totals(StatusRollup.Dimension.CLIENT, start, end), expected)
+        self.assertEqual(StatusRollups.client_names(names), names)
+
+    def test_status_change_moves_the_transaction_between_buckets(self):
+        tx = self.create(amount=10, timestamp=self.now - timedelta(minutes=5))
+        self.score(tx, Transaction.Status.HIGH_RISK)
+        self.score(tx, Transaction.Status.BLOCKED)
+        self.score(tx, Transaction.Status.BLOCKED)
+
+        totals = self.totals(StatusRollup.Dimension.CURRENCY, self.now - timedelta(hours=1), self.now)
+        self.assertEqual(totals, {('EUR', Transaction.Status.BLOCKED): (1, Decimal(10))})
+
+    def test_series_picks_the_coarsest_exact_granularity(self):
+        self.populate(20)
+        day_start = floor(self.now, StatusRollup.Granularity.DAY)
+
+        granularity, rows = StatusRollups.series(
+            StatusRollup.Dimension.CURRENCY, day_start - timedelta(days=2), day_start)
+        self.assertEqual(granularity, StatusRollup.Granularity.DAY)
+        self.assertEqual(
+            sum(row['transaction_count'] for row in rows),
+            sum(count for count, _ in self.grouped('currency', day_start - timedelta(days=2), day_start).values()))
+
+        granularity, _ = StatusRollups.series(
+            StatusRollup.Dimension.CURRENCY, self.now - timedelta(minutes=90), self.now)
+        self.assertEqual(granularity, StatusRollup.Granularity.MINUTE)
+
+    def test_series_filters_statuses(self):
+        self.populate(20)
+        _, rows = StatusRollups.series(
+            StatusRollup.Dimension.CURRENCY, self.now - timedelta(days=5), self.now,
+            granularity=StatusRollup.Granularity.HOUR, statuses=[Transaction.Status.BLOCKED])
+
+        self.assertTrue(rows)
+        self.assertEqual({row['status'] for row in rows}, {Transaction.Status.BLOCKED})
+
+    def test_prune_drops_minute_buckets_past_retention(self):
+        old = self.create(amount=10, timestamp=self.now - timedelta(days=8))
+        self.score(old, Transaction.Status.BLOCKED)
+        recent = self.create(amount=10, timestamp=self.now - timedelta(days=1))
+        self.score(recent, Transaction.Status.BLOCKED)
+
+        self.assertEqual(tasks.prune_rollups(), {'status': 'success', 'deleted': 3})  # one per dimension
+        minute = StatusRollup.objects.filter(granularity=StatusRollup.Granularity.MINUTE)
+        self.assertEqual(minute.count(), 3)
+        self.assertEqual(StatusRollup.objects.filter(granularity=StatusRollup.Granularity.HOUR).count(), 6)
+
+    def test_rebuild_matches_incremental_rollups_after_archival(self):
+        self.populate(30)
+        start, end = self.now - timedelta(days=5), self.now + timedelta(minutes=1)
+        before = self.totals(StatusRollup.Dimension.CLIENT, start, end)
+
+        TransactionArchive.archive(before=self.now - timedelta(days=2))
+        StatusRollup.objects.all().delete()
+        StatusRollups.rebuild()
+
+        self.assertTrue(ArchiveSegment.objects.exists())
+        self.assertEqual(self.totals(StatusRollup.Dimension.CLIENT, start, end), before)
+
+    def test_rebuild_holds_the_writer_lock_across_its_scan(self):
+        self.populate(10)
+        table, rollup_table = Transaction._meta.db_table, StatusRollup._meta.db_table
+
+        with CaptureQueriesContext(connection) as queries:
+            StatusRollups.rebuild()
+
+        sql = [query['sql'] for query in queries.captured_queries]
+        savepoint = next(i for i, q in enumerate(sql) if q.startswith('SAVEPOINT'))
+        lock = next(i for i, q in enumerate(sql) if q.startswith('DELETE') and rollup_table in q)
+        scan = next(i for i, q in enumerate(sql) if q.startswith('SELECT') and f'FROM "{table}"' in q)
+        insert = max(i for i, q in enumerate(sql) if q.startswith('INSERT') and rollup_table in q)
+        release = next(i for i, q in enumerate(sql) if q.startswith('RELEASE SAVEPOINT'))
+        self.assertLess(savepoint, lock)
+        self.assertLess(lock, scan)
+        self.assertLess(insert, release)
+
+    def test_status_change_after_a_rebuild_applies_on_top(self):
+        tx = self.create(amount=10, timestamp=self.now - timedelta(minutes=5))
+        self.score(tx, Transaction.Status.HIGH_RISK)
+        StatusRollups.rebuild()
+        self.score(tx, Transaction.Status.BLOCKED)
+
+        totals = self.totals(StatusRollup.Dimension.CURRENCY, self.now - timedelta(hours=1), self.now)
+        self.assertEqual(totals, {('EUR', Transaction.Status.BLOCKED): (1, Decimal(10))})
+
+    def test_analytics_view_labels_client_totals(self):
+        tx = self.create(amount=10, client_name='Alice', timestamp=self.now - timedelta(minutes=5))
+        self.score(tx, Transaction.Status.BLOCKED)
+
+        response = self.client.get(reverse('alert-analytics', args=['client']), {'mode': 'totals'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([(row['client_name'], row['transaction_count']) for row in response.data['totals']],
+                         [('Alice', 1)])
+
+    def test_analytics_view_rejects_bad_parameters(self):
+        url = reverse('alert-analytics', args=['currency'])
+        self.assertEqual(self.client.get(url, {'granularity': 'week'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'start': 'yesterday'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('alert-analytics', args=['country'])).status_code, 404)
+
+
+STARTUP_BUDGETS = {'web': {'seconds': 1.5, 'rss_mb': 120}}
+
+
+@override_settings(STARTUP_BUDGETS=STARTUP_BUDGETS)
+class BenchmarkStartupTests(SimpleTestCase):
+    def run_check(self, seconds=1.0, rss_mb=100, forbidden_loaded=()):
+        report = {'wall_seconds': seconds, 'rss_mb': rss_mb, 'forbidden_loaded': list(forbidden_loaded)}
+        out = io.StringIO()
+        with mock.patch.object(benchmark_startup.Command, '_start', return_value=(report, Counter({'django': 80.0}))):
+            call_command('benchmark_startup', '--roles', 'web', '--repeat', '1', '--check', '--json', stdout=out)
+        return out.getvalue()
+
+    def test_check_passes_within_budget(self):
+        result = json.loads(self.run_check())[0]
+
+        self.assertEqual(result['role'], 'web')
+        self.assertEqual(result['budget'], STARTUP_BUDGETS['web'])
+        self.assertEqual(result['imports_ms'], {'django': 80.0})
+
+    def test_check_fails_on_a_forbidden_import(self):
+        with self.assertRaisesMessage(CommandError, 'web imported torch'):
+            self.run_check(forbidden_loaded=['torch'])
+
+    def test_check_fails_over_the_time_budget(self):
+        with self.assertRaisesMessage(CommandError, 'web started in 2.00s > 1.5s'):
+            self.run_check(seconds=2.0)
+
+    def test_check_fails_over_the_memory_budget(self):
+        with self.assertRaisesMessage(CommandError, 'web peaked at 300 MB > 120 MB'):
+            self.run_check(rss_mb=300)
+
+    def test_unknown_roles_are_rejected(self):
+        with self.assertRaisesMessage(CommandError, 'Unknown roles: cron'):
+            benchmark_startup._role_list('web,cron')
+
+    def test_import_breakdown_sums_self_time_per_package(self):
+        stderr = "\n".join([
+            'import time: self [us] | cumulative | imported package',
+            'import time:       500 |        500 |   torch._C',
+            'import time:      1500 |       2000 | torch',
+            'import time:       250 |        250 | json',
+            'unrelated line',
+        ])
+        self.assertEqual(benchmark_startup.import_breakdown(stderr), Counter({'torch': 2.0, 'json': 0.25}))
+
+    def test_web_and_nlp_roles_start_without_forbidden_imports(self):
+        for role in ('web', 'nlp'):
+            with self.subTest(role):
+                report, _ = benchmark_startup.Command._start(role)
+                self.assertEqual(report['role'], role)
+                self.assertEqual(report['forbidden_loaded'], [])
+
+
+class ProcessRoleTests(SimpleTestCase):
+    def test_unknown_role_is_rejected(self):
+        with mock.patch.dict(os.environ, {'QERCAS_ROLE': 'cron'}):
+            with self.assertRaises(ImproperlyConfigured):
+                roles.current_role()
+
+    def test_role_defaults_to_all(self):
+        with mock.patch.dict(os.environ):
+            os.environ.pop('QERCAS_ROLE', None)
+            self.assertEqual(roles.current_role(), 'all')
+            self.assertEqual(roles.get_role()['urls'], ('admin', 'api', 'gnn', 'nlp'))
+
+    def test_loaded_modules_reports_imported_ones_only(self):
+        self.assertEqual(roles.loaded_modules(['json', 'qercas_no_such_module']), ['json'])
+
+    def test_preload_imports_modules_and_calls_loaders(self):
+        role = {'urls': (), 'celery': True, 'preload': ('json', 'gnn_analyzer.services:_pyplot'), 'forbidden': ()}
+        with mock.patch.dict(roles.ROLES, {'test': role}), \
+                mock.patch.object(roles.importlib, 'import_module') as import_module:
+            roles.preload('test')
+
+        self.assertEqual([c.args for c in import_module.call_args_list], [('json',), ('gnn_analyzer.services',)])
+        import_module.return_value._pyplot.assert_called_once_with()
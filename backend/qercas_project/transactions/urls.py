@@ -1,9 +1,11 @@
 from django.urls import path
-from .views import ExplanationDetail, TransactionList, TransactionDetail, DashboardSummary
+from .views import AlertAnalytics, ExplanationDetail, TransactionLabel, TransactionList, TransactionDetail, DashboardSummary
 
 urlpatterns = [
     path('transactions/' , TransactionList.as_view(), name='transaction-list'),
     path('transactions/<uuid:pk>/', TransactionDetail.as_view(), name='transaction-detail'),
+    path('transactions/<uuid:pk>/label/', TransactionLabel.as_view(), name='transaction-label'),
     path('transactions/<uuid:pk>/explanation/', ExplanationDetail.as_view() ,  name='expalanation-detail'),
      path('summary/', DashboardSummary.as_view(), name='dashboard-summary'),
+    path('analytics/<str:dimension>/', AlertAnalytics.as_view(), name='alert-analytics'),
 ]
\ No newline at end of file
@@ -2,10 +2,15 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from django.http import Http404
-from .models import Transaction, XaiExplanation
-from .serializers import TransactionSerializer, XaiExplanationSerializer
+from .models import StatusRollup, Transaction, XaiExplanation
+from .rollups import StatusRollups
+from .serializers import TransactionLabelSerializer, TransactionSerializer, XaiExplanationSerializer
 from .tasks import analyze_transaction_risk
+from datetime import datetime, timedelta
+from django.conf import settings
 from django.db.models import Count, Q
+from django.utils import timezone
+from nlp_processor.services import RegulatoryCorpus
 
 
 class TransactionList(APIView):
@@ -41,6 +46,25 @@ class TransactionDetail(APIView):
         serializer = TransactionSerializer(transaction)
         return Response(serializer.data)
 
+class TransactionLabel(APIView):
+    """
+    Records an analyst's confirmed outcome for a transaction. Confirmed
+    labels feed the online model updates and the nightly retrain.
+    """
+    def post(self, request, pk, format=None):
+        serializer = TransactionLabelSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            transaction = Transaction.objects.get(pk=pk)
+        except Transaction.DoesNotExist:
+            raise Http404
+        transaction.analyst_label = serializer.validated_data['label']
+        transaction.status = transaction.analyst_label
+        transaction.labeled_at = timezone.now()
+        StatusRollups.save_status(transaction, update_fields=['analyst_label', 'status', 'labeled_at'])
+        return Response(TransactionSerializer(transaction).data)
+
 class ExplanationDetail(APIView):
      def get(self, request, pk, format=None):
         try:
@@ -54,6 +78,54 @@ class ExplanationDetail(APIView):
                 status=status.HTTP_404_NOT_FOUND
             )
             
+class AlertAnalytics(APIView):
+    """
+    Alert trends from the status rollups, e.g. alerts per hour by
+    transaction type (?granularity=hour&status=HIGH_RISK&status=BLOCKED),
+    status mix by currency, or blocked volume per client (mode=totals).
+
+    Query parameters: start and end (ISO datetimes; the last
+    ROLLUP_DEFAULT_RANGE_HOURS by default), status (repeatable), key
+    (repeatable), granularity (minute, hour or day; chosen from the range
+    when omitted) and mode (series or totals).
+    """
+    def get(self, request, dimension, format=None):
+        if dimension not in StatusRollup.Dimension.values:
+            raise Http404
+        params = request.query_params
+        try:
+            end = self._datetime(params.get('end')) or timezone.now()
+            start = self._datetime(params.get('start')) or end - timedelta(
+                hours=getattr(settings, 'ROLLUP_DEFAULT_RANGE_HOURS', 24))
+        except ValueError as e:
+            return Response({"error": f"Invalid datetime: {e}"}, status=status.HTTP_400_BAD_REQUEST)
+        granularity = params.get('granularity')
+        if granularity is not None and granularity not in StatusRollup.Granularity.values:
+            return Response({"error": f"Unknown granularity: {granularity}"}, status=status.HTTP_400_BAD_REQUEST)
+        if start >= end:
+            return Response({"error": "start must be before end"}, status=status.HTTP_400_BAD_REQUEST)
+
+        filters = {'statuses': params.getlist('status'), 'keys': params.getlist('key')}
+        if params.get('mode') == 'totals':
+            data = {'totals': StatusRollups.totals(dimension, start, end, **filters)}
+            rows = data['totals']
+        else:
+            granularity, rows = StatusRollups.series(dimension, start, end, granularity=granularity, **filters)
+            data = {'granularity': granularity, 'buckets': rows}
+        if dimension == StatusRollup.Dimension.CLIENT:
+            names = StatusRollups.client_names(row['key'] for row in rows)
+            for row in rows:
+                row['client_name'] = names.get(row['key'])
+        data.update(dimension=dimension, start=start, end=end)
+        return Response(data)
+
+    @staticmethod
+    def _datetime(value):
+        if not value:
+            return None
+        parsed = datetime.fromisoformat(value)
+        return parsed if timezone.is_aware(parsed) else timezone.make_aware(parsed)
+
 class DashboardSummary(APIView):
     """
     Provides summary statistics for the main dashboard cards.
@@ -72,7 +144,9 @@ class DashboardSummary(APIView):
 
         # These would be fetched from other modules in a full implementation
         active_quantum_tasks = 2 # Placeholder
-        regulatory_updates = 7   # Placeholder
+
+        # Regulatory documents added or changed within the reporting window
+        regulatory_updates = RegulatoryCorpus.recent_updates()
 
         data = {
             "real_time_alerts": real_time_alerts,
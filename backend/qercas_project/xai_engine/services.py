@@ -1,8 +1,8 @@
-import joblib
 import os
-import shap
 import numpy as np
 from django.conf import settings
+from federated_learning.registry import ModelRegistry
+from qercas_project.metrics import MODEL_VERSION, timed
 from transactions.models import Transaction
 
 class XAIService:
@@ -11,31 +11,82 @@ class XAIService:
     """
     _model = None
     _explainer = None
+    _explained_scaler = None  # applied to rows before the explainer sees them
+    _model_version = ''
+
+    @property
+    def model_version(self) -> str:
+        """The registry version being served, or 'legacy' for the joblib file."""
+        return XAIService._model_version
 
     def _load_model(self):
-        """Loads the trained model and explainer from disk."""
+        """
+        Loads the active model from the registry, reloading when a new version
+        is published or rolled back. Falls back to the legacy joblib file when
+        no version has been published yet.
+        """
+        try:
+            loaded = ModelRegistry.load_active()
+        except Exception as e:
+            print(f"Error loading model from the registry: {e}")
+            loaded = None
+        if loaded is not None:
+            record, model = loaded
+            if XAIService._model is not model:
+                print(f"Loaded global model v{record.version} from: {record.model_path}")
+                self._set_model(model)
+                XAIService._model_version = str(record.version)
+                MODEL_VERSION.set(record.version)
+            return
+
         if XAIService._model is None:
             model_path = os.path.join(settings.BASE_DIR, 'ml_models', 'risk_model.joblib')
             print(f"Loading model from: {model_path}")
             try:
-                XAIService._model = joblib.load(model_path)
-                print("Initializing explainer...")
-                
-                # Handle different model types
-                if hasattr(XAIService._model, 'predict_proba'):  # Scikit-learn model
-                    XAIService._explainer = shap.TreeExplainer(XAIService._model)
-                elif hasattr(XAIService._model, 'named_modules'):  # PyTorch model
-                    import torch
-                    background = torch.randn(100, 4)  # Example background data
-                    XAIService._explainer = shap.DeepExplainer(XAIService._model, background)
-                else:
-                    print("WARNING: Model type not fully supported - limited explainability")
-                    
+                import joblib
+                self._set_model(joblib.load(model_path))
+                XAIService._model_version = 'legacy'
+                MODEL_VERSION.set(0)
             except FileNotFoundError:
                 print(f"ERROR: Model file not found at {model_path}")
             except Exception as e:
                 print(f"Error loading model or explainer: {e}")
 
+    @staticmethod
+    def _set_model(model):
+        XAIService._model = model
+        XAIService._explainer = None
+        XAIService._explained_scaler = None
+
+    @staticmethod
+    def _get_explainer():
+        """
+        Builds the SHAP explainer for the loaded model on first use. shap pulls
+        in scikit-learn, scipy and matplotlib, so only processes that generate
+        explanations import it; scoring workers never do.
+        """
+        if XAIService._explainer is not None or XAIService._model is None:
+            return XAIService._explainer
+        print("Initializing explainer...")
+        import shap
+
+        # Handle different model types
+        if hasattr(XAIService._model, 'predict_proba'):  # Scikit-learn model
+            XAIService._explainer = shap.TreeExplainer(XAIService._model)
+        elif hasattr(XAIService._model, 'named_modules'):  # PyTorch model
+            import torch
+            from federated_learning.fedavg import background_rows, explained_layers
+            scaler, layers = explained_layers(XAIService._model)
+            background = torch.from_numpy(background_rows())
+            if scaler is not None:
+                with torch.no_grad():
+                    background = scaler(background)
+            XAIService._explainer = shap.DeepExplainer(layers, background)
+            XAIService._explained_scaler = scaler
+        else:
+            print("WARNING: Model type not fully supported - limited explainability")
+        return XAIService._explainer
+
     def predict_status(self, features: dict):
         """
         Predicts the compliance status of a transaction using the loaded model
@@ -61,25 +112,23 @@ class XAIService:
         ]
 
         try:
-            # Handle different model types
-            if hasattr(XAIService._model, 'predict_proba'):
-                # Standard scikit-learn model
-                probability = XAIService._model.predict_proba([feature_values])[0][1]
-                prediction_raw = XAIService._model.predict([feature_values])[0]
-            elif hasattr(XAIService._model, 'named_modules'):  # PyTorch model
-                import torch
-                feature_tensor = torch.tensor([feature_values], dtype=torch.float32)
-                with torch.no_grad():
-                    prediction = XAIService._model(feature_tensor)
-                probability = float(torch.sigmoid(prediction).item())
-                prediction_raw = 1 if probability > 0.5 else 0
-            elif hasattr(XAIService._model, 'predict'):
-                # Keras or other models with predict method
-                prediction = XAIService._model.predict([feature_values])[0]
-                probability = float(prediction[0]) if isinstance(prediction, (list, np.ndarray)) else float(prediction)
-                prediction_raw = 1 if probability > 0.5 else 0
-            else:
-                raise AttributeError("Model doesn't support required prediction methods")
+            with timed('inference'):
+                # Handle different model types
+                if hasattr(XAIService._model, 'predict_proba'):
+                    # Standard scikit-learn model
+                    probability = XAIService._model.predict_proba([feature_values])[0][1]
+                    prediction_raw = XAIService._model.predict([feature_values])[0]
+                elif hasattr(XAIService._model, 'named_modules'):  # PyTorch model
+                    from federated_learning.fedavg import predict_proba
+                    probability = float(predict_proba(XAIService._model, [feature_values])[0])
+                    prediction_raw = 1 if probability > 0.5 else 0
+                elif hasattr(XAIService._model, 'predict'):
+                    # Keras or other models with predict method
+                    prediction = XAIService._model.predict([feature_values])[0]
+                    probability = float(prediction[0]) if isinstance(prediction, (list, np.ndarray)) else float(prediction)
+                    prediction_raw = 1 if probability > 0.5 else 0
+                else:
+                    raise AttributeError("Model doesn't support required prediction methods")
 
             if probability > 0.8:
                 predicted_status = Transaction.Status.BLOCKED
@@ -97,7 +146,7 @@ class XAIService:
     def generate_explanation(self, features: dict) -> dict:
         """Generates a SHAP explanation for a single transaction."""
         self._load_model()
-        if XAIService._explainer is None:
+        if XAIService._get_explainer() is None:
             return {}
 
         feature_values = [
@@ -111,15 +160,20 @@ class XAIService:
             if hasattr(XAIService._model, 'named_modules'):  # PyTorch model
                 import torch
                 input_tensor = torch.tensor([feature_values], dtype=torch.float32)
-                shap_values = XAIService._explainer.shap_values(input_tensor)
+                if XAIService._explained_scaler is not None:
+                    with torch.no_grad():
+                        input_tensor = XAIService._explained_scaler(input_tensor)
+                with timed('shap'):
+                    shap_values = XAIService._explainer.shap_values(input_tensor)
                 return {
-                    "base_value": float(XAIService._explainer.expected_value),
-                    "shap_values": [float(v) for v in shap_values[0]],
+                    "base_value": float(np.ravel(XAIService._explainer.expected_value)[0]),
+                    "shap_values": np.asarray(shap_values[0], dtype=float).ravel().tolist(),
                     "feature_names": ['amount', 'day_of_week', 'hour_of_day', 'is_crypto'],
                     "feature_values": feature_values,
                 }
             else:  # Other model types
-                shap_values = XAIService._explainer.shap_values([feature_values])
+                with timed('shap'):
+                    shap_values = XAIService._explainer.shap_values([feature_values])
                 return {
                     "base_value": float(XAIService._explainer.expected_value),
                     "shap_values": shap_values[0].tolist(),